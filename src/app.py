@@ -2,19 +2,53 @@
 # defines the FastAPI Application
 
 import json
+import logging
 import re
 
-from fastapi import Depends, FastAPI, Request
+from math import ceil
+from random import uniform
+from threading import Thread as BackgroundThread
+from time import perf_counter, sleep, time
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from neomodel import db
+from neo4j.io import ServiceUnavailable
 from neomodel.exceptions import DoesNotExist, UniqueProperty
 from uvicorn import run as serve
 
-from src.controllers import replies, threads, users, votes
-from src.models import ReplyLowerLevel, ReplyTopLevel, Thread, User
+from src.controllers import admin, replies, threads, users, votes
+from src.models import MIGRATIONS, Reply, Thread, User
+from src.services.admission import WRITE_METHODS, Rejected, admission
+from src.services.batches import InvalidBatch
+from src.services.branches import InvalidCursor
+from src.services.compression import CompressionMiddleware, compression
+from src.services.concurrency import VersionConflict, etag
 from src.services.config import AppSettings, get_settings
-from src.services.graph import build_cs, graph_init
-from src.services.logs import logger
+from src.services.graph import await_graph, build_cs, graph_init
+from src.services.health import readiness
+from src.services.logs import (
+    REQUEST_LOGGER,
+    correlation_id,
+    logger,
+    logging_setup,
+    logging_shutdown,
+)
+from src.services.migrations import apply_migrations
+from src.services.my_votes import my_votes
+from src.services.profiling import profiler
+from src.services.projections import UnknownFields
+from src.services.repository import Repository, get_repository
+from src.services.sessions import (
+    BOOKMARK_HEADER,
+    RequestBookmarks,
+    parse_bookmarks,
+    request_bookmarks,
+)
+from src.services.shards import shard_map, split_shard, use_shard
+from src.services.trending import trending
+from src.services.votes import vote_recorder
+from src.services.warmup import access_stats, hot_threads, warm_up
 
 app = FastAPI(
     title="Threads",
@@ -22,47 +56,268 @@ app = FastAPI(
     version="0.0.1",
 )
 
+request_logger = logging.getLogger(REQUEST_LOGGER)
+
 
-@db.transaction
-def seed_data():
-    u1 = User(name="John Smith").save()
-    u2 = User(name="Joanne Bloggs").save()
-    u3 = User(name="Immanuel Kant").save()
+def seed_data(repository: Repository):
+    u1 = repository.create_user("John Smith")["uuid"]
+    u2 = repository.create_user("Joanne Bloggs")["uuid"]
+    u3 = repository.create_user("Immanuel Kant")["uuid"]
 
-    t1 = Thread(
+    t1 = repository.create_thread(
+        u1,
         title="How now, brown cow?",
         body="Hi guys! I was wondering whether you could answer this question.",
-    ).save()
-    t1.author.connect(u1)
+    )["uuid"]
 
-    r1 = ReplyTopLevel(body="The question is unanswerable.").save()
-    r1.author.connect(u2)
-    r1.parent.connect(t1)
+    r1 = repository.create_reply(u2, Thread, t1, "The question is unanswerable.")
 
-    r2a = ReplyLowerLevel(body="Are you sure?").save()
-    r2a.parent.connect(r1)
-    r2a.author.connect(u1)
+    repository.create_reply(u1, Reply, r1["uuid"], "Are you sure?")
+    repository.create_reply(
+        u3, Reply, r1["uuid"], "I do not believe that to be the case."
+    )
 
-    r2b = ReplyLowerLevel(body="I do not believe that to be the case.").save()
-    r2b.parent.connect(r1)
-    r2b.author.connect(u3)
 
+def rebuild_trending(repository: Repository, settings: AppSettings):
+    trending.configure(
+        window=settings.trending_window,
+        buckets=settings.trending_buckets,
+        capacity=settings.trending_capacity,
+        tracked=settings.trending_tracked,
+    )
+    trending.rebuild(repository.recent_activity(time() - settings.trending_window))
 
-@app.on_event("startup")
-def prepare_graph_database(settings: AppSettings = Depends(get_settings)):
-    settings = get_settings()
+
+def warm_caches(repository: Repository, settings: AppSettings):
+    access_stats.configure(
+        path=settings.access_stats_file, capacity=settings.access_stats_capacity
+    )
+    access_stats.load()
+
+    if not settings.warmup_threads:
+        return
+
+    readiness.mark_not_ready("warming up")
+    start = perf_counter()
+    try:
+        threads = hot_threads(repository, access_stats, settings.warmup_threads)
+        warmed = warm_up(
+            repository,
+            threads,
+            timeout=settings.warmup_timeout,
+            concurrency=settings.warmup_concurrency,
+        )
+    except Exception as exc:
+        # N.B. a failed warm-up only makes the first requests slower
+        logger.error(f"Failed to warm up: {exc}")
+        return
+
+    logger.info(
+        f"Warmed up {warmed} of {len(threads)} hot Threads "
+        f"in {perf_counter() - start:.1f}s."
+    )
+
+
+def prepare_graph_database(settings: AppSettings):
+    """
+    prepare_graph_database
+
+    Connects to the graph database and (optionally) migrates the schema and
+    seeds it, reloads the recent activity the trending rankings are based
+    on and warms the caches with the hottest Threads, then marks the
+    application as ready to serve traffic
+
+    N.B. raises ServiceUnavailable if a database does not answer within the
+         startup timeout (every step is safe to repeat, so it can be retried)
+
+    Input:
+        settings - the application settings
+
+    """
     connection_string = build_cs(
         settings.dbuser,
         settings.dbpass,
         settings.dbhost,
         settings.dbname,
+        settings.dbscheme,
+    )
+    graph_init(connection_string, timeout=settings.startup_timeout)
+
+    shard_map.configure(
+        [connection_string]
+        + [
+            build_cs(
+                settings.dbuser,
+                settings.dbpass,
+                *split_shard(shard, settings.dbname),
+                settings.dbscheme,
+            )
+            for shard in settings.dbshards
+        ]
     )
-    graph_init(connection_string)
-    try:  # if the database is empty, add some data
-        seed_data()
-    except UniqueProperty:
-        pass  # catch constraint violation if database is not empty
-    logger.info("Neomodel configured. Starting application.")
+    for index in range(1, shard_map.count):
+        with use_shard(index):
+            if not await_graph(timeout=settings.startup_timeout):
+                raise ServiceUnavailable(f"Graph database shard {index} not found")
+
+    if settings.migrate_on_startup:
+        for index in range(shard_map.count):
+            with use_shard(index):
+                applied = apply_migrations(MIGRATIONS)
+            if applied:
+                logger.info(f"Applied schema migrations {applied} (shard {index}).")
+
+    repository = get_repository()
+    if settings.seed_on_startup and repository.is_empty():
+        seed_data(repository)
+        logger.info("Empty database seeded with example data.")
+
+    rebuild_trending(repository, settings)
+
+    vote_recorder.configure(
+        hot_rate=settings.hot_vote_rate,
+        interval=settings.vote_roll_up_interval,
+        batch_size=settings.vote_roll_up_batch_size,
+    )
+    vote_recorder.start()
+
+    warm_caches(repository, settings)
+
+    readiness.mark_ready()
+    logger.info("Neomodel configured. Application ready.")
+
+
+def keep_preparing_graph_database(settings: AppSettings):
+    """
+    keep_preparing_graph_database
+
+    Prepares the graph database (see prepare_graph_database), retrying with
+    exponential backoff (plus jitter) until it succeeds, so that the
+    application becomes ready whenever the database does. Until then, the
+    readiness probe reports what went wrong.
+
+    Input:
+        settings - the application settings
+
+    """
+    delay = 1.0
+
+    while True:
+        try:
+            prepare_graph_database(settings)
+            return
+        except ServiceUnavailable as exc:
+            logger.error(f"Graph database unavailable (retrying): {exc}")
+            readiness.mark_not_ready("graph database unavailable")
+        except Exception as exc:
+            # N.B. e.g. an authentication failure or a failed migration
+            logger.error(f"Failed to prepare the graph database (retrying): {exc}")
+            readiness.mark_not_ready(
+                f"failed to prepare graph database: {type(exc).__name__}"
+            )
+
+        sleep(uniform(delay / 2, delay))
+        delay = min(delay * 2, settings.startup_retry_max_delay)
+
+
+@app.on_event("startup")
+def configure_logging():
+    settings = get_settings()
+    logging_setup(
+        level=settings.log_level,
+        levels=settings.log_levels,
+        json_format=settings.log_json,
+        request_sample_rate=settings.request_log_sample_rate,
+    )
+
+
+@app.on_event("shutdown")
+def roll_up_pending_votes():
+    vote_recorder.stop()
+
+
+@app.on_event("shutdown")
+def save_access_stats():
+    access_stats.save()
+
+
+@app.on_event("shutdown")
+def flush_logs():
+    logging_shutdown()
+
+
+@app.on_event("startup")
+def configure_query_profiling():
+    settings = get_settings()
+    if settings.query_profiling:
+        profiler.configure(
+            threshold_ms=settings.query_profile_threshold_ms,
+            buffer_size=settings.query_profile_buffer_size,
+        )
+        profiler.install()
+        logger.warning("Query profiling enabled: Cypher queries will be recorded.")
+
+
+@app.on_event("startup")
+def configure_admission_control():
+    settings = get_settings()
+    if settings.admission_control:
+        admission.configure(
+            client_rate=settings.client_write_rate,
+            client_burst=settings.client_write_burst,
+            user_rate=settings.user_write_rate,
+            user_burst=settings.user_write_burst,
+            global_rate=settings.global_write_rate,
+            global_burst=settings.global_write_burst,
+            max_concurrent=settings.max_concurrent_writes,
+            max_queued=settings.max_queued_writes,
+            queue_timeout=settings.write_queue_timeout,
+        )
+
+
+@app.on_event("startup")
+def configure_compression():
+    settings = get_settings()
+    compression.configure(
+        enabled=settings.compression,
+        minimum_size=settings.compression_minimum_size,
+        levels={
+            "gzip": settings.gzip_level,
+            "br": settings.brotli_quality,
+            "zstd": settings.zstd_level,
+        },
+    )
+
+
+@app.on_event("startup")
+def configure_my_votes():
+    settings = get_settings()
+    my_votes.configure(
+        capacity=settings.my_votes_cache_size, max_age=settings.my_votes_max_age
+    )
+
+
+@app.on_event("startup")
+def start_graph_database_preparation():
+    settings = get_settings()
+
+    if settings.repository_backend == "memory":
+        if settings.seed_on_startup:
+            seed_data(get_repository())
+        rebuild_trending(get_repository(), settings)
+        warm_caches(get_repository(), settings)
+        readiness.mark_ready()
+        logger.warning("Using the in-memory repository: nothing will be persisted.")
+        return
+
+    # runs in the background so that the liveness probe answers immediately
+    readiness.mark_not_ready("connecting to graph database")
+    BackgroundThread(
+        target=keep_preparing_graph_database,
+        args=(settings,),
+        name="prepare-graph-database",
+        daemon=True,
+    ).start()
 
 
 @app.get("/")
@@ -70,9 +325,137 @@ def root() -> str:
     return f"Welcome to {app.title}!"
 
 
+### probes
+
+
+@app.get("/healthz", tags=["health"])
+def liveness() -> dict:
+    """
+    liveness
+
+    Reports that the process is up and able to answer requests
+
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz", tags=["health"])
+def readiness_probe() -> JSONResponse:
+    """
+    readiness_probe
+
+    Reports whether the application is ready to serve traffic, i.e.
+    whether its graph database connection has been established
+
+    """
+    status_code = 200 if readiness.ready else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": readiness.detail},
+    )
+
+
+### middleware
+
+
+# N.B. added first, so that it runs last (compressing what the others send)
+app.add_middleware(CompressionMiddleware)
+
+
+@app.middleware("http")
+async def profile_queries(request: Request, call_next):
+    if not profiler.enabled:
+        return await call_next(request)
+
+    profile = profiler.start_request(request.method, request.url.path)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        profiler.finish_request(profile, status_code)
+
+    return response
+
+
+@app.middleware("http")
+async def propagate_bookmarks(request: Request, call_next):
+    # N.B. a client presenting the bookmark of its last write reads from a
+    #      cluster member that has caught up with it
+    bookmarks = RequestBookmarks(
+        presented=parse_bookmarks(request.headers.get(BOOKMARK_HEADER))
+    )
+    token = request_bookmarks.set(bookmarks)
+
+    try:
+        response = await call_next(request)
+    finally:
+        request_bookmarks.reset(token)
+
+    if bookmarks.header() is not None:
+        response.headers[BOOKMARK_HEADER] = bookmarks.header()
+
+    return response
+
+
+@app.middleware("http")
+async def control_admission(request: Request, call_next):
+    # N.B. only writes are limited (including those to the admin routes),
+    #      and rejected requests are answered without reaching the routes.
+    #      The write routes are plain functions, run on worker threads, so
+    #      admitted writes do run concurrently (up to the slots available).
+    if not admission.enabled or request.method not in WRITE_METHODS:
+        return await call_next(request)
+
+    user_id = request.query_params.get("user_id")
+    client = request.client.host if request.client else "unknown"
+    try:
+        await admission.admit(client, user_id)
+    except Rejected as exc:
+        return JSONResponse(
+            status_code=429,
+            content={"message": "Too many write requests", "reason": exc.reason},
+            headers={"Retry-After": str(max(ceil(exc.retry_after), 1))},
+        )
+
+    try:
+        return await call_next(request)
+    finally:
+        admission.release()
+
+
+@app.middleware("http")
+async def log_request(request: Request, call_next):
+    # N.B. defined after the other middleware, so that it runs first
+    request_id = request.headers.get("X-Request-ID") or uuid4().hex
+    token = correlation_id.set(request_id)
+    start = perf_counter()
+    status_code = 500
+
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        request_logger.info(
+            f"{request.method} {request.url.path} {status_code}",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": status_code,
+                "elapsed_ms": round((perf_counter() - start) * 1000, 3),
+            },
+        )
+        correlation_id.reset(token)
+
+    response.headers["X-Request-ID"] = request_id
+
+    return response
+
+
 ### include routers
 
 
+app.include_router(admin.router)
 app.include_router(replies.router)
 app.include_router(threads.router)
 app.include_router(users.router)
@@ -106,6 +489,30 @@ async def duplicate_exception_handler(request: Request, exc: UniqueProperty):
     return JSONResponse(status_code=409, content={"message": exc.message})
 
 
+@app.exception_handler(VersionConflict)
+async def version_conflict_exception_handler(request: Request, exc: VersionConflict):
+    return JSONResponse(
+        status_code=412,
+        content={"message": str(exc), "current_version": exc.current},
+        headers={"ETag": etag(exc.current)},
+    )
+
+
+@app.exception_handler(UnknownFields)
+async def unknown_fields_exception_handler(request: Request, exc: UnknownFields):
+    return JSONResponse(status_code=422, content={"message": str(exc)})
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_exception_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=422, content={"message": str(exc)})
+
+
+@app.exception_handler(InvalidBatch)
+async def invalid_batch_exception_handler(request: Request, exc: InvalidBatch):
+    return JSONResponse(status_code=422, content={"message": str(exc)})
+
+
 @app.exception_handler(Thread.DoesNotExist)
 async def missing_thread_exception_handler(request: Request, exc: Thread.DoesNotExist):
     uuid = parse_neomodel_exception(exc).get("uuid")
@@ -124,6 +531,15 @@ async def missing_user_exception_handler(request: Request, exc: User.DoesNotExis
     )
 
 
+@app.exception_handler(Reply.DoesNotExist)
+async def missing_reply_exception_handler(request: Request, exc: Reply.DoesNotExist):
+    uuid = parse_neomodel_exception(exc).get("uuid")
+    return JSONResponse(
+        status_code=404,
+        content={"message": f"Reply with UUID {uuid} not found"},
+    )
+
+
 ### serve (N.B. in practice we'll usually use uvicorn directly)
 
 
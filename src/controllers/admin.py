@@ -0,0 +1,178 @@
+# controllers/admin.py
+# controllers for inspecting and administering the running application
+
+import asyncio
+
+from dataclasses import asdict
+from hmac import compare_digest
+from time import time
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from src.schemas import (
+    AdmissionStatsRead,
+    ArchiveRead,
+    RelatedRefreshRead,
+    RequestProfileRead,
+    SingleFlightStatsRead,
+)
+from src.services.admission import admission
+from src.services.config import get_settings
+from src.services.migrations import check_index_usage
+from src.services.profiling import profiler
+from src.services.related import related_threads
+from src.services.repository import get_repository
+from src.services.repository.archiving import ArchivingRepository
+from src.services.singleflight import groups
+
+
+def require_admin_token(x_admin_token: Annotated[str | None, Header()] = None):
+    """
+    require_admin_token
+
+    Lets a request through to the admin routes only if it presents the
+    configured ADMIN_TOKEN (in the X-Admin-Token header)
+
+    N.B. with no ADMIN_TOKEN set, the admin routes are disabled (404)
+
+    """
+    token = get_settings().admin_token
+    if token is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+router = APIRouter(
+    prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_token)]
+)
+
+
+@router.get("/queries", response_model=list[RequestProfileRead])
+async def get_query_profiles():
+    """
+    get_query_profiles
+
+    Returns the Cypher queries issued by recent requests (most recent
+    first), with query plans for any that exceeded the latency threshold
+
+    N.B. only populated when QUERY_PROFILING is enabled
+
+    """
+    response = [RequestProfileRead(**asdict(profile)) for profile in profiler.recent()]
+
+    return response
+
+
+@router.delete("/queries", status_code=204)
+async def clear_query_profiles():
+    """
+    clear_query_profiles
+
+    Empties the buffer of recorded query profiles
+
+    """
+    profiler.clear()
+
+
+@router.get("/index-usage", response_model=dict[str, list[str]])
+async def get_index_usage():
+    """
+    get_index_usage
+
+    EXPLAINs each distinct query issued by the recorded requests and
+    returns those that would scan rather than use an index, with the
+    scanning operators in their plans
+
+    N.B. only available when QUERY_PROFILING is enabled
+
+    """
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Query profiling is not enabled")
+
+    response = await asyncio.to_thread(check_index_usage, profiler.captured_queries())
+
+    return response
+
+
+@router.get("/singleflight", response_model=list[SingleFlightStatsRead])
+async def get_single_flight_stats():
+    """
+    get_single_flight_stats
+
+    Returns, for each group of coalesced reads, how many requests were
+    made, how many database fetches were actually run and how many
+    requests shared a fetch already in flight
+
+    """
+    response = [
+        SingleFlightStatsRead(**asdict(group.stats)) for group in groups.values()
+    ]
+
+    return response
+
+
+@router.get("/admission", response_model=AdmissionStatsRead)
+async def get_admission_stats():
+    """
+    get_admission_stats
+
+    Returns how many write requests have been admitted, and how many were
+    rejected for each reason, plus how many are being handled and waiting
+
+    N.B. only counted when ADMISSION_CONTROL is enabled (since the process
+         started)
+
+    """
+    response = AdmissionStatsRead(enabled=admission.enabled, **asdict(admission.stats))
+
+    return response
+
+
+@router.post("/archive", response_model=ArchiveRead)
+async def archive_inactive_threads(
+    older_than_days: Annotated[float | None, Query(gt=0)] = None,
+    limit: Annotated[int, Query(ge=1, le=10000)] = 1000,
+):
+    """
+    archive_inactive_threads
+
+    Moves Threads in which nothing has happened for `older_than_days`
+    (default ARCHIVE_AFTER_DAYS) from the database to the archive
+
+    N.B. only available when ARCHIVE_DIR is set
+
+    """
+    repository = get_repository()
+    if not isinstance(repository, ArchivingRepository):
+        raise HTTPException(status_code=404, detail="Archiving is not enabled")
+
+    days = older_than_days or get_settings().archive_after_days
+    archived = await asyncio.to_thread(repository.archive, time() - days * 86400, limit)
+
+    return ArchiveRead(archived=archived)
+
+
+@router.post("/related", response_model=RelatedRefreshRead)
+async def refresh_related_threads(full: bool = False):
+    """
+    refresh_related_threads
+
+    Recomputes the related Threads of the Threads affected by activity
+    since the last refresh (or of every Thread, if full is set), and stores
+    them for GET /thread/{thread_id}/related
+
+    N.B. the first refresh after a restart is always full
+
+    """
+    settings = get_settings()
+    refreshed = await asyncio.to_thread(
+        related_threads.run,
+        get_repository(),
+        settings.related_threads_k,
+        settings.related_max_user_threads,
+        full,
+    )
+
+    return RelatedRefreshRead(refreshed=refreshed)
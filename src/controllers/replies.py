@@ -1,27 +1,40 @@
 # controllers/replies.py
 # controllers for Replies
 
-from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Path
-from neomodel import db
+from fastapi import APIRouter, Header, Path, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from src.models import Reply, ReplyLowerLevel, ReplyTopLevel, Thread, User
+from src.models import Reply, Thread
 from src.schemas import (
+    BatchCreated,
+    ReplyBatchCreate,
+    ReplyBranch,
     ReplyCreate,
     ReplyRead,
     ReplySimpleRead,
     ReplyUpdate,
-    UserRead,
 )
+from src.services.branches import MAX_BRANCH_DEPTH, MAX_BRANCH_REPLIES, decode_cursor
+from src.services.concurrency import etag, parse_if_match
+from src.services.my_votes import my_votes, with_my_votes
+from src.services.projections import REPLY_FIELDS, select_fields
+from src.services.repository import get_repository
+from src.services.sessions import presented_bookmarks
+from src.services.singleflight import single_flight
+from src.services.streaming import json_object_chunks
+from src.services.trending import trending
 
 router = APIRouter(tags=["reply"])
 
+reply_reads = single_flight("reply")
+
 
 ### POST requests
 @router.post("/thread/{thread_id}/reply", response_model=ReplyRead)
-async def create_reply(
+def create_reply(
     user_id: str,
     thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
     reply: ReplyCreate,
@@ -32,36 +45,17 @@ async def create_reply(
     Creates a new (top level) Reply
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        thread = Thread.nodes.get(uuid=thread_id)
-
-        new_reply = ReplyTopLevel(body=reply.body).save()
-        new_reply.parent.connect(thread)
-        new_reply.author.connect(user)
-
-    author_data = UserRead(
-        uuid=user.uuid,
-        name=user.name,
-        created_at=user.created_at,
-    )
+    new_reply = get_repository().create_reply(user_id, Thread, thread_id, reply.body)
+    if new_reply["thread"] is not None:
+        trending.record(new_reply["thread"], "reply")
 
-    response = ReplyRead(
-        uuid=new_reply.uuid,
-        body=new_reply.body,
-        author=author_data,
-        children=[],
-        created_at=new_reply.created_at,
-        updated_at=new_reply.updated_at,
-        upvotes=0,
-        downvotes=0,
-    )
+    response = ReplyRead(**new_reply)
 
     return response
 
 
 @router.post("/thread/{thread_id}/reply/{reply_id}", response_model=ReplyRead)
-async def create_nested_reply(
+def create_nested_reply(
     user_id: str,
     thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
     reply_id: Annotated[str, Path(title="UUID of the Reply to be retrieved")],
@@ -77,40 +71,48 @@ async def create_nested_reply(
          to identify the reply. An incorrect thread ID will be ignored.
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        parent_reply = Reply.nodes.get(uuid=reply_id)
-
-        new_reply = ReplyLowerLevel(body=reply.body).save()
-        new_reply.parent.connect(parent_reply)
-        new_reply.author.connect(user)
-
-    author_data = UserRead(
-        uuid=user.uuid,
-        name=user.name,
-        created_at=user.created_at,
-    )
+    new_reply = get_repository().create_reply(user_id, Reply, reply_id, reply.body)
+    if new_reply["thread"] is not None:
+        trending.record(new_reply["thread"], "reply")
 
-    response = ReplyRead(
-        uuid=new_reply.uuid,
-        body=new_reply.body,
-        author=author_data,
-        children=[],
-        created_at=new_reply.created_at,
-        updated_at=new_reply.updated_at,
-        upvotes=0,
-        downvotes=0,
-    )
+    response = ReplyRead(**new_reply)
 
     return response
 
 
+@router.post("/thread/{thread_id}/replies/batch", response_model=BatchCreated)
+def create_replies(
+    thread_id: Annotated[str, Path(title="UUID of the Thread replied to")],
+    batch: ReplyBatchCreate,
+):
+    """
+    create_replies
+
+    Creates a batch of Replies in a Thread, in a single transaction (so
+    either all of them are created or none are)
+
+    Each Reply replies to the Thread (if parent is not set), to an existing
+    Reply in the Thread (if parent is its UUID) or to an earlier Reply in
+    the batch (if parent is the temp_id that Reply was given).
+
+    """
+    uuids = get_repository().create_replies(
+        thread_id, [reply.dict() for reply in batch.replies]
+    )
+    for _ in uuids:
+        trending.record(thread_id, "reply")
+
+    return BatchCreated(uuids=uuids)
+
+
 ### PATCH requests
-@router.patch("/thread/{thread_id}/reply/{reply_id}", response_model=ReplyRead)
-async def update_reply(
+@router.patch("/thread/{thread_id}/reply/{reply_id}", response_model=ReplySimpleRead)
+def update_reply(
     thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
     reply_id: Annotated[str, Path(title="UUID of the Reply to be retrieved")],
     reply: ReplyUpdate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ):
     """
     update_reply
@@ -121,21 +123,21 @@ async def update_reply(
          reasons; the reply ID is unique and therefore sufficient
          to identify the reply. An incorrect thread ID will be ignored.
 
+    N.B. if an If-Match header is supplied, the update is only applied if
+         it matches the Reply's current version (ETag), otherwise a 412
+         response is returned
+
     """
-    with db.transaction:
-        updated_reply = Reply.nodes.get(uuid=reply_id)
-        updated_reply.body = reply.body
-        updated_reply.updated_at = datetime.now()
-        updated_reply.save()
-
-    response = ReplySimpleRead(
-        uuid=updated_reply.uuid,
-        body=updated_reply.body,
-        created_at=updated_reply.created_at,
-        updated_at=updated_reply.updated_at,
+    updated_reply = get_repository().update_item(
+        Reply,
+        reply_id,
+        {"body": reply.body},
+        parse_if_match(if_match),
     )
 
-    return response
+    response.headers["ETag"] = etag(updated_reply["version"])
+
+    return ReplySimpleRead(**updated_reply)
 
 
 ### GET requests
@@ -143,37 +145,102 @@ async def update_reply(
 async def get_reply(
     thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
     reply_id: Annotated[str, Path(title="UUID of the Reply to be retrieved")],
+    response: Response,
+    fields: str | None = None,
+    preview_chars: Annotated[int | None, Query(ge=0)] = None,
+    user_id: str | None = None,
 ):
-    with db.transaction:
-        reply = Reply.nodes.get(uuid=reply_id)
-        author = reply.author.get()
-        children = reply.children.all()
-
-    author_data = UserRead(
-        uuid=author.uuid,
-        name=author.name,
-        created_at=author.created_at,
+    """
+    get_reply
+
+    Returns a Reply by UUID
+
+    N.B. the thread ID is included in the path for purely semantic
+         reasons; the reply ID is unique and therefore sufficient
+         to identify the reply. An incorrect thread ID will be ignored.
+
+    N.B. fields (comma-separated) restricts the fields returned, and
+         preview_chars truncates the bodies of the Reply and its children;
+         unrequested fields are never read from the database
+
+    N.B. if user_id is given, my_vote says whether that User has upvoted
+         and downvoted the Reply and each of its children
+
+    N.B. concurrent requests for the same Reply (and bookmarks) share a
+         single fetch
+
+    """
+    selected = select_fields(fields, REPLY_FIELDS)
+
+    reply = await reply_reads.do(
+        (reply_id, selected, preview_chars, presented_bookmarks()),
+        get_repository().get_item,
+        Reply,
+        reply_id,
+        selected,
+        preview_chars,
     )
 
-    children_data = [
-        ReplySimpleRead(
-            uuid=child.uuid,
-            body=child.body,
-            created_at=child.created_at,
-            updated_at=child.updated_at,
+    if user_id is not None:
+        reply = with_my_votes(reply, my_votes.get(user_id, get_repository().user_votes))
+
+    if fields is None:
+        response.headers["ETag"] = etag(reply["version"])
+        return ReplyRead(**reply)
+
+    sparse_response = JSONResponse(content=jsonable_encoder(reply))
+    if "version" in reply:
+        sparse_response.headers["ETag"] = etag(reply["version"])
+
+    return sparse_response
+
+
+@router.get("/thread/{thread_id}/reply/{reply_id}/branch", response_model=ReplyBranch)
+async def get_reply_branch(
+    thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
+    reply_id: Annotated[str, Path(title="UUID of the Reply to start from")],
+    depth: Annotated[int, Query(ge=1, le=MAX_BRANCH_DEPTH)] = 10,
+    limit: Annotated[int, Query(ge=1, le=MAX_BRANCH_REPLIES)] = 100,
+    cursor: str | None = None,
+    preview_chars: Annotated[int | None, Query(ge=0)] = None,
+    user_id: str | None = None,
+):
+    """
+    get_reply_branch
+
+    Returns up to `depth` levels of the Replies below a Reply (at most
+    `limit` Replies in total), in a single query
+
+    Each Reply whose children were not all loaded has has_more_children
+    set and a continuation cursor: pass it as `cursor` to this route for
+    that Reply to load the next part of the branch.
+
+    N.B. streamed, a chunk of top-level Replies at a time, so that large
+         branches are sent (and compressed) as they are encoded
+
+    N.B. if user_id is given, my_vote says whether that User has upvoted
+         and downvoted each Reply in the branch
+
+    N.B. the thread ID is included in the path for purely semantic
+         reasons; the reply ID is unique and therefore sufficient
+         to identify the reply. An incorrect thread ID will be ignored.
+
+    """
+    after = decode_cursor(cursor, reply_id) if cursor is not None else None
+
+    branch = get_repository().get_branch(reply_id, depth, limit, after, preview_chars)
+
+    if user_id is not None:
+        branch = with_my_votes(
+            branch, my_votes.get(user_id, get_repository().user_votes)
         )
-        for child in children
-    ]
-
-    response = ReplyRead(
-        uuid=reply.uuid,
-        body=reply.body,
-        author=author_data,
-        children=children_data,
-        created_at=reply.created_at,
-        updated_at=reply.updated_at,
-        upvotes=reply.n_upvotes(),
-        downvotes=reply.n_downvotes(),
+
+    encoded = jsonable_encoder(ReplyBranch(**branch))
+    children = encoded.pop("children")
+
+    response = StreamingResponse(
+        json_object_chunks(encoded, "children", children),
+        media_type="application/json",
     )
 
     return response
@@ -181,7 +248,7 @@ async def get_reply(
 
 ### DELETE requests
 @router.delete("/thread/{thread_id}/reply/{reply_id}", status_code=204)
-async def delete_reply(
+def delete_reply(
     thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
     reply_id: Annotated[str, Path(title="UUID of the Reply to be deleted")],
 ):
@@ -195,6 +262,4 @@ async def delete_reply(
          to identify the reply. An incorrect thread ID will be ignored.
 
     """
-    with db.transaction:
-        reply = Reply.nodes.get(uuid=reply_id)
-        reply.delete()
+    get_repository().delete_item(Reply, reply_id)
@@ -1,161 +1,278 @@
 # controllers/threads.py
 # controllers for Threads
 
-from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Path
-from neomodel import db
+from fastapi import APIRouter, Header, Path, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from src.models import Thread, User
+from src.models import Thread
 from src.schemas import (
-    ReplySimpleRead,
+    BatchCreated,
+    RelatedThread,
+    ThreadBatchCreate,
     ThreadCreate,
     ThreadRead,
+    ThreadReadWithStats,
     ThreadSimpleRead,
+    ThreadStats,
     ThreadUpdate,
-    UserRead,
+    TrendingThread,
 )
+from src.services.concurrency import etag, parse_if_match
+from src.services.my_votes import my_votes, with_my_votes
+from src.services.projections import THREAD_FIELDS, THREAD_PROPERTIES, select_fields
+from src.services.repository import get_repository
+from src.services.sessions import presented_bookmarks
+from src.services.singleflight import single_flight
+from src.services.streaming import json_array_chunks
+from src.services.trending import trending
+from src.services.warmup import access_stats
 
 router = APIRouter(tags=["thread"])
 
+thread_reads = single_flight("thread")
+
 
 @router.post("/thread/", response_model=ThreadRead)
-async def create_thread(user_id: str, thread: ThreadCreate):
+def create_thread(user_id: str, thread: ThreadCreate):
     """
     create_thread
 
     Creates a new Thread
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
+    new_thread = get_repository().create_thread(user_id, thread.title, thread.body)
 
-        new_thread = Thread(title=thread.title, body=thread.body).save()
-        new_thread.author.connect(user)
+    response = ThreadRead(**new_thread)
 
-    author_data = UserRead(
-        uuid=user.uuid,
-        name=user.name,
-        created_at=user.created_at,
-    )
+    return response
 
-    response = ThreadRead(
-        uuid=new_thread.uuid,
-        title=new_thread.title,
-        body=new_thread.body,
-        author=author_data,
-        children=[],
-        created_at=new_thread.created_at,
-        updated_at=new_thread.updated_at,
-        upvotes=0,
-        downvotes=0,
-    )
 
-    return response
+@router.post("/thread/batch", response_model=BatchCreated)
+def create_threads(batch: ThreadBatchCreate):
+    """
+    create_threads
+
+    Creates a batch of Threads, in a single transaction (so either all of
+    them are created or none are)
+
+    """
+    uuids = get_repository().create_threads([thread.dict() for thread in batch.threads])
+
+    return BatchCreated(uuids=uuids)
 
 
-@router.get("/thread/", response_model=list[ThreadSimpleRead])
-async def get_all_threads():
+@router.get(
+    "/thread/",
+    response_model=list[ThreadReadWithStats],
+    response_model_exclude_none=True,
+)
+async def get_all_threads(
+    include_stats: bool = False,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    before: str | None = None,
+    fields: str | None = None,
+    preview_chars: Annotated[int | None, Query(ge=0)] = None,
+    user_id: str | None = None,
+):
     """
     get_all_threads
 
     Returns all Threads
 
+    N.B. if include_stats is set, each Thread's summary statistics are
+         included (read from its maintained counters where available)
+
+    N.B. if limit is set, Threads are returned a page at a time in
+         descending order of UUID, starting below before (if set). With
+         time-ordered ids (ID_SCHEME=uuid7) this is newest first.
+
+    N.B. fields (comma-separated) restricts the fields returned, and
+         preview_chars truncates the body; unrequested fields are never
+         read from the database
+
+    N.B. if user_id is given, my_vote says whether that User has upvoted
+         and downvoted each Thread
+
+    N.B. streamed, a chunk of Threads at a time, so that the response is
+         sent (and compressed) as it is encoded rather than all at once
+
     """
-    with db.transaction:
-        all_threads = Thread.nodes.all()
+    selected = select_fields(fields, THREAD_FIELDS) if fields else THREAD_PROPERTIES
+
+    all_threads = get_repository().list_threads(
+        selected,
+        preview_chars=preview_chars,
+        limit=limit,
+        before=before,
+        include_stats=include_stats,
+    )
 
-    response = [
-        ThreadSimpleRead(
-            uuid=thread.uuid,
-            title=thread.title,
-            body=thread.body,
-            created_at=thread.created_at,
-            updated_at=thread.updated_at,
+    if user_id is not None:
+        votes = my_votes.get(user_id, get_repository().user_votes)
+        all_threads = [with_my_votes(thread, votes) for thread in all_threads]
+
+    if fields is not None:
+        encoded = (jsonable_encoder(thread) for thread in all_threads)
+    else:
+        encoded = (
+            jsonable_encoder(ThreadReadWithStats(**thread), exclude_none=True)
+            for thread in all_threads
         )
-        for thread in all_threads
+
+    response = StreamingResponse(
+        json_array_chunks(encoded), media_type="application/json"
+    )
+
+    return response
+
+
+@router.get("/thread/trending", response_model=list[TrendingThread])
+async def get_trending_threads(limit: Annotated[int, Query(ge=1, le=100)] = 10):
+    """
+    get_trending_threads
+
+    Returns the Threads with the most recent activity (upvotes of the Thread
+    and its Replies, and new Replies), highest score first
+
+    N.B. answered from memory, without querying the database; fetch the
+         Threads themselves by UUID
+
+    """
+    response = [
+        TrendingThread(uuid=uuid, score=score) for uuid, score in trending.top(limit)
     ]
 
     return response
 
 
 @router.patch("/thread/{thread_id}", response_model=ThreadSimpleRead)
-async def update_thread(
+def update_thread(
     thread_id: Annotated[str, Path(title="UUID of the Thread to be updated")],
     thread: ThreadUpdate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ):
     """
     update_thread
 
     Updates an existing Thread
 
-    """
-    with db.transaction:
-        updated_thread = Thread.nodes.get(uuid=thread_id)
-        updated_thread.title = thread.title
-        updated_thread.body = thread.body
-        updated_thread.save()
+    N.B. if an If-Match header is supplied, the update is only applied if
+         it matches the Thread's current version (ETag), otherwise a 412
+         response is returned
 
-    response = ThreadSimpleRead(
-        uuid=updated_thread.uuid,
-        title=updated_thread.title,
-        body=updated_thread.body,
-        created_at=updated_thread.created_at,
-        updated_at=datetime.now(),
+    """
+    updated_thread = get_repository().update_item(
+        Thread,
+        thread_id,
+        {"title": thread.title, "body": thread.body},
+        parse_if_match(if_match),
     )
 
-    return response
+    response.headers["ETag"] = etag(updated_thread["version"])
+
+    return ThreadSimpleRead(**updated_thread)
 
 
 @router.get("/thread/{thread_id}", response_model=ThreadRead)
 async def get_thread(
-    thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")]
+    thread_id: Annotated[str, Path(title="UUID of the Thread to be retrieved")],
+    response: Response,
+    fields: str | None = None,
+    preview_chars: Annotated[int | None, Query(ge=0)] = None,
+    user_id: str | None = None,
 ):
     """
     get_thread
 
     Returns a thread by UUID
 
-    """
-    with db.transaction:
-        thread = Thread.nodes.get(uuid=thread_id)
-        author = thread.author.get()
-        children = thread.children.all()
+    N.B. fields (comma-separated) restricts the fields returned, and
+         preview_chars truncates the bodies of the Thread and its Replies;
+         unrequested fields are never read from the database
+
+    N.B. if user_id is given, my_vote says whether that User has upvoted
+         and downvoted the Thread and each of its Replies
 
-    author_data = UserRead(
-        uuid=author.uuid,
-        name=author.name,
-        created_at=author.created_at,
+    N.B. concurrent requests for the same Thread (and bookmarks) share a
+         single fetch
+
+    """
+    selected = select_fields(fields, THREAD_FIELDS)
+
+    thread = await thread_reads.do(
+        (thread_id, selected, preview_chars, presented_bookmarks()),
+        get_repository().get_item,
+        Thread,
+        thread_id,
+        selected,
+        preview_chars,
     )
+    access_stats.record(thread_id)
 
-    children_data = [
-        ReplySimpleRead(
-            uuid=child.uuid,
-            body=child.body,
-            created_at=child.created_at,
-            updated_at=child.updated_at,
+    if user_id is not None:
+        thread = with_my_votes(
+            thread, my_votes.get(user_id, get_repository().user_votes)
         )
-        for child in children
-    ]
 
-    response = ThreadRead(
-        uuid=thread.uuid,
-        title=thread.title,
-        body=thread.body,
-        author=author_data,
-        children=children_data,
-        created_at=thread.created_at,
-        updated_at=thread.updated_at,
-        upvotes=thread.n_upvotes(),
-        downvotes=thread.n_downvotes(),
-    )
+    if fields is None:
+        response.headers["ETag"] = etag(thread["version"])
+        return ThreadRead(**thread)
 
-    return response
+    sparse_response = JSONResponse(content=jsonable_encoder(thread))
+    if "version" in thread:
+        sparse_response.headers["ETag"] = etag(thread["version"])
+
+    return sparse_response
+
+
+@router.get("/thread/{thread_id}/stats", response_model=ThreadStats)
+async def get_thread_stats(
+    thread_id: Annotated[str, Path(title="UUID of the Thread to be summarised")],
+    exact: bool = False,
+):
+    """
+    get_thread_stats
+
+    Returns summary statistics for a Thread: reply and participant counts,
+    the depth of the deepest Reply and the time of the latest activity
+
+    N.B. by default these are read from the Thread's maintained counters;
+         set exact to recompute them from the full reply tree
+
+    """
+    stats = get_repository().get_thread_stats(thread_id, exact=exact)
+
+    return stats
+
+
+@router.get("/thread/{thread_id}/related", response_model=list[RelatedThread])
+async def get_related_threads(
+    thread_id: Annotated[str, Path(title="UUID of the Thread to find others like")],
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+):
+    """
+    get_related_threads
+
+    Returns the Threads most related to a Thread (those with the most
+    Users engaged with both, as authors or upvoters), best first
+
+    N.B. precomputed by the related Threads job (POST /admin/related), so
+         empty until it has been run; fetch the Threads themselves by UUID
+
+    """
+    related = get_repository().get_related(thread_id)
+
+    response = [RelatedThread(uuid=uuid, score=score) for uuid, score in related]
+
+    return response[:limit]
 
 
 @router.delete("/thread/{thread_id}", status_code=204)
-async def delete_thread(
+def delete_thread(
     thread_id: Annotated[str, Path(title="UUID of the Thread to be deleted")]
 ):
     """
@@ -164,6 +281,6 @@ async def delete_thread(
     Deletes a Thread
 
     """
-    with db.transaction:
-        thread = Thread.nodes.get(uuid=thread_id)
-        thread.delete()
+    get_repository().delete_item(Thread, thread_id)
+    trending.forget(thread_id)
+    access_stats.forget(thread_id)
@@ -4,30 +4,28 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Path
-from neomodel import db
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 
-from src.models import User
 from src.schemas import UserCreate, UserRead
+from src.services.my_votes import my_votes
+from src.services.repository import get_repository
+from src.services.streaming import json_array_chunks
 
 router = APIRouter(tags=["user"])
 
 
 @router.post("/user/", response_model=UserRead)
-async def create_user(user: UserCreate):
+def create_user(user: UserCreate):
     """
     create_user
 
     Creates a new User
 
     """
-    with db.transaction:
-        new_user = User(name=user.name).save()
+    new_user = get_repository().create_user(user.name)
 
-    response = UserRead(
-        uuid=new_user.uuid,
-        name=new_user.name,
-        created_at=new_user.created_at,
-    )
+    response = UserRead(**new_user)
 
     return response
 
@@ -39,18 +37,16 @@ async def get_all_users():
 
     Returns all Users
 
+    N.B. streamed, a chunk of Users at a time, so that the response is sent
+         (and compressed) as it is encoded rather than all at once
+
     """
-    with db.transaction:
-        all_users = User.nodes.all()
-
-    response = [
-        UserRead(
-            uuid=user.uuid,
-            name=user.name,
-            created_at=user.created_at,
-        )
-        for user in all_users
-    ]
+    all_users = get_repository().list_users()
+
+    response = StreamingResponse(
+        json_array_chunks(jsonable_encoder(UserRead(**user)) for user in all_users),
+        media_type="application/json",
+    )
 
     return response
 
@@ -65,28 +61,20 @@ async def get_user(
     Returns a User by UUID
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=uuid)
+    user = get_repository().get_user(uuid)
 
-    response = UserRead(
-        uuid=user.uuid,
-        name=user.name,
-        created_at=user.created_at,
-    )
+    response = UserRead(**user)
 
     return response
 
 
 @router.delete("/user/{uuid}", status_code=204)
-async def delete_user(
-    uuid: Annotated[str, Path(title="UUID of the User to be deleted")]
-):
+def delete_user(uuid: Annotated[str, Path(title="UUID of the User to be deleted")]):
     """
     delete_user
 
     Deletes a User
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=uuid)
-        user.delete()
+    get_repository().delete_user(uuid)
+    my_votes.forget(uuid)
@@ -2,37 +2,31 @@
 # controllers for Upvotes and Downvotes
 
 from fastapi import APIRouter
-from neomodel import db
 
-from src.models import Reply, Thread, User
+from src.models import Reply, Thread
 from src.schemas import ReplyReadWithVotes, ThreadReadWithVotes
+from src.services.my_votes import my_votes
+from src.services.repository import get_repository
+from src.services.trending import trending
 
 router = APIRouter(tags=["votes"])
 
 
 ### POST requests
 @router.post("/thread/{thread_id}/upvote", response_model=ThreadReadWithVotes)
-async def upvote_thread(user_id: str, thread_id: str):
+def upvote_thread(user_id: str, thread_id: str):
     """
     upvote_thread
 
     Adds an upvote to a Thread
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        thread = Thread.nodes.get(uuid=thread_id)
-        thread.upvoters.connect(user)
+    thread = get_repository().vote(Thread, thread_id, user_id, "up", cast=True)
+    my_votes.record(user_id, "up", thread_id, cast=True)
+    if thread["changed"] and thread["thread"] is not None:
+        trending.record(thread["thread"], "upvote")
 
-    response = ThreadReadWithVotes(
-        uuid=thread.uuid,
-        title=thread.title,
-        body=thread.body,
-        created_at=thread.created_at,
-        updated_at=thread.updated_at,
-        upvotes=thread.n_upvotes(),
-        downvotes=thread.n_downvotes(),
-    )
+    response = ThreadReadWithVotes(**thread)
 
     return response
 
@@ -40,7 +34,7 @@ async def upvote_thread(user_id: str, thread_id: str):
 @router.post(
     "/thread/{thread_id}/reply/{reply_id}/upvote", response_model=ReplyReadWithVotes
 )
-async def upvote_reply(
+def upvote_reply(
     user_id: str,
     thread_id: str,
     reply_id: str,
@@ -55,45 +49,28 @@ async def upvote_reply(
          to identify the reply. An incorrect thread ID will be ignored.
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        reply = Reply.nodes.get(uuid=reply_id)
-        reply.upvoters.connect(user)
+    reply = get_repository().vote(Reply, reply_id, user_id, "up", cast=True)
+    my_votes.record(user_id, "up", reply_id, cast=True)
+    if reply["changed"] and reply["thread"] is not None:
+        trending.record(reply["thread"], "upvote")
 
-    response = ReplyReadWithVotes(
-        uuid=reply.uuid,
-        body=reply.body,
-        created_at=reply.created_at,
-        updated_at=reply.updated_at,
-        upvotes=reply.n_upvotes(),
-        downvotes=reply.n_downvotes(),
-    )
+    response = ReplyReadWithVotes(**reply)
 
     return response
 
 
 @router.post("/thread/{thread_id}/downvote", response_model=ThreadReadWithVotes)
-async def downvote_thread(user_id: str, thread_id: str):
+def downvote_thread(user_id: str, thread_id: str):
     """
     upvote_thread
 
     Adds a downvote to a Thread
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        thread = Thread.nodes.get(uuid=thread_id)
-        thread.downvoters.connect(user)
+    thread = get_repository().vote(Thread, thread_id, user_id, "down", cast=True)
+    my_votes.record(user_id, "down", thread_id, cast=True)
 
-    response = ThreadReadWithVotes(
-        uuid=thread.uuid,
-        title=thread.title,
-        body=thread.body,
-        created_at=thread.created_at,
-        updated_at=thread.updated_at,
-        upvotes=thread.n_upvotes(),
-        downvotes=thread.n_downvotes(),
-    )
+    response = ThreadReadWithVotes(**thread)
 
     return response
 
@@ -101,7 +78,7 @@ async def downvote_thread(user_id: str, thread_id: str):
 @router.post(
     "/thread/{thread_id}/reply/{reply_id}/downvote", response_model=ReplyReadWithVotes
 )
-async def downvote_reply(
+def downvote_reply(
     user_id: str,
     thread_id: str,
     reply_id: str,
@@ -116,40 +93,31 @@ async def downvote_reply(
          to identify the reply. An incorrect thread ID will be ignored.
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        reply = Reply.nodes.get(uuid=reply_id)
-        reply.downvoters.connect(user)
+    reply = get_repository().vote(Reply, reply_id, user_id, "down", cast=True)
+    my_votes.record(user_id, "down", reply_id, cast=True)
 
-    response = ReplyReadWithVotes(
-        uuid=reply.uuid,
-        body=reply.body,
-        created_at=reply.created_at,
-        updated_at=reply.updated_at,
-        upvotes=reply.n_upvotes(),
-        downvotes=reply.n_downvotes(),
-    )
+    response = ReplyReadWithVotes(**reply)
 
     return response
 
 
 ### DELETE requests
 @router.delete("/thread/{thread_id}/upvote", status_code=204)
-async def remove_upvote_from_thread(user_id: str, thread_id: str):
+def remove_upvote_from_thread(user_id: str, thread_id: str):
     """
     remove_upvote_from_thread
 
     Removes an upvote from a Thread
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        thread = Thread.nodes.get(uuid=thread_id)
-        thread.upvoters.disconnect(user)
+    thread = get_repository().vote(Thread, thread_id, user_id, "up", cast=False)
+    my_votes.record(user_id, "up", thread_id, cast=False)
+    if thread["changed"] and thread["thread"] is not None:
+        trending.withdraw(thread["thread"], "upvote", thread["voted_at"])
 
 
 @router.delete("/thread/{thread_id}/reply/{reply_id}/upvote", status_code=204)
-async def remove_upvote_from_reply(
+def remove_upvote_from_reply(
     user_id: str,
     thread_id: str,
     reply_id: str,
@@ -164,28 +132,26 @@ async def remove_upvote_from_reply(
          to identify the reply. An incorrect thread ID will be ignored.
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        reply = Reply.nodes.get(uuid=reply_id)
-        reply.upvoters.disconnect(user)
+    reply = get_repository().vote(Reply, reply_id, user_id, "up", cast=False)
+    my_votes.record(user_id, "up", reply_id, cast=False)
+    if reply["changed"] and reply["thread"] is not None:
+        trending.withdraw(reply["thread"], "upvote", reply["voted_at"])
 
 
 @router.delete("/thread/{thread_id}/downvote", status_code=204)
-async def remove_downvote_from_thread(user_id: str, thread_id: str):
+def remove_downvote_from_thread(user_id: str, thread_id: str):
     """
     remove_downvote_from_thread
 
     Removes a downvote from a Thread
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        thread = Thread.nodes.get(uuid=thread_id)
-        thread.downvoters.disconnect(user)
+    get_repository().vote(Thread, thread_id, user_id, "down", cast=False)
+    my_votes.record(user_id, "down", thread_id, cast=False)
 
 
 @router.delete("/thread/{thread_id}/reply/{reply_id}/downvote", status_code=204)
-async def remove_downvote_from_reply(
+def remove_downvote_from_reply(
     user_id: str,
     thread_id: str,
     reply_id: str,
@@ -200,7 +166,5 @@ async def remove_downvote_from_reply(
          to identify the reply. An incorrect thread ID will be ignored.
 
     """
-    with db.transaction:
-        user = User.nodes.get(uuid=user_id)
-        reply = Reply.nodes.get(uuid=reply_id)
-        reply.downvoters.disconnect(user)
+    get_repository().vote(Reply, reply_id, user_id, "down", cast=False)
+    my_votes.record(user_id, "down", reply_id, cast=False)
@@ -2,16 +2,20 @@
 # defines the models for different Nodes and Relationships
 
 from neomodel import (
+    ArrayProperty,
     DateTimeProperty,
+    IntegerProperty,
     RelationshipFrom,
     RelationshipTo,
     StringProperty,
     StructuredNode,
     StructuredRel,
-    UniqueIdProperty,
     cardinality,
 )
 
+from src.services.ids import NodeIdProperty
+from src.services.migrations import Migration
+
 
 ### structured relationships
 class UpvotedBy(StructuredRel):
@@ -24,7 +28,7 @@ class DownvotedBy(StructuredRel):
 
 ### nodes and properties
 class User(StructuredNode):
-    uuid = UniqueIdProperty()
+    uuid = NodeIdProperty()
     name = StringProperty(required=True, unique_index=True)
     created_at = DateTimeProperty(default_now=True)
     updated_at = DateTimeProperty(default_now=True)
@@ -32,17 +36,19 @@ class User(StructuredNode):
 
 class UpvotableNode(StructuredNode):
     __abstract_node__ = True
-    uuid = UniqueIdProperty()
+    uuid = NodeIdProperty()
     created_at = DateTimeProperty(default_now=True)
     updated_at = DateTimeProperty(default_now=True)
+    version = IntegerProperty(default=0)  # incremented on every edit
     upvoters = RelationshipTo(User, "UPVOTED_BY", model=UpvotedBy)
     downvoters = RelationshipTo(User, "DOWNVOTED_BY", model=DownvotedBy)
 
-    # define methods to build a Cypher query to return upvote/downvote count:
+    # define methods to build a Cypher query to return upvote/downvote count
+    # (N.B. the label is needed for the lookup to use the uuid index):
     def _upvotes_query(self) -> str:
         return f"""\
          MATCH
-            ({{uuid: '{self.uuid}'}})-[uv:UPVOTED_BY]->()
+            (:{self.__label__} {{uuid: $uuid}})-[uv:UPVOTED_BY]->()
         RETURN
             COUNT(uv)
         """
@@ -50,7 +56,7 @@ class UpvotableNode(StructuredNode):
     def _downvotes_query(self) -> str:
         return f"""\
          MATCH
-            ({{uuid: '{self.uuid}'}})-[dv:DOWNVOTED_BY]->()
+            (:{self.__label__} {{uuid: $uuid}})-[dv:DOWNVOTED_BY]->()
         RETURN
             COUNT(dv)
         """
@@ -59,18 +65,27 @@ class UpvotableNode(StructuredNode):
     # the results and counting them:
     def n_upvotes(self):
         count_upvotes_query = self._upvotes_query()
-        results, columns = self.cypher(count_upvotes_query)
+        results, columns = self.cypher(count_upvotes_query, {"uuid": self.uuid})
         return results[0][0]
 
     def n_downvotes(self):
         count_downvotes_query = self._downvotes_query()
-        results, columns = self.cypher(count_downvotes_query)
+        results, columns = self.cypher(count_downvotes_query, {"uuid": self.uuid})
         return results[0][0]
 
 
 class Thread(UpvotableNode):
     title = StringProperty(required=True, unique_index=True)
     body = StringProperty(required=True)
+    # summary statistics, maintained as Replies are created and deleted
+    # (N.B. these are None for Threads that predate them), along with the
+    # number of Replies at each depth (from 1) and a PARTICIPATED_IN
+    # relationship from each User replying, counting their Replies
+    reply_count = IntegerProperty()
+    participant_count = IntegerProperty()
+    max_depth = IntegerProperty()
+    last_activity_at = DateTimeProperty()
+    reply_depths = ArrayProperty(IntegerProperty())
     author = RelationshipTo(User, "AUTHORED_BY", cardinality=cardinality.One)
     children = RelationshipFrom("ReplyTopLevel", "IN_REPLY_TO")
 
@@ -87,3 +102,85 @@ class ReplyTopLevel(Reply):
 
 class ReplyLowerLevel(Reply):
     parent = RelationshipTo(Reply, "IN_REPLY_TO")
+
+
+### schema migrations (apply with `pipenv run migrate`)
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description="uniqueness constraints",
+        statements=(
+            "CREATE CONSTRAINT user_uuid IF NOT EXISTS "
+            "FOR (n:User) REQUIRE n.uuid IS UNIQUE",
+            "CREATE CONSTRAINT user_name IF NOT EXISTS "
+            "FOR (n:User) REQUIRE n.name IS UNIQUE",
+            "CREATE CONSTRAINT thread_uuid IF NOT EXISTS "
+            "FOR (n:Thread) REQUIRE n.uuid IS UNIQUE",
+            "CREATE CONSTRAINT thread_title IF NOT EXISTS "
+            "FOR (n:Thread) REQUIRE n.title IS UNIQUE",
+            "CREATE CONSTRAINT reply_uuid IF NOT EXISTS "
+            "FOR (n:Reply) REQUIRE n.uuid IS UNIQUE",
+            "CREATE CONSTRAINT reply_top_level_uuid IF NOT EXISTS "
+            "FOR (n:ReplyTopLevel) REQUIRE n.uuid IS UNIQUE",
+            "CREATE CONSTRAINT reply_lower_level_uuid IF NOT EXISTS "
+            "FOR (n:ReplyLowerLevel) REQUIRE n.uuid IS UNIQUE",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="range indexes on timestamps",
+        statements=(
+            "CREATE INDEX thread_created_at IF NOT EXISTS "
+            "FOR (n:Thread) ON (n.created_at)",
+            "CREATE INDEX thread_updated_at IF NOT EXISTS "
+            "FOR (n:Thread) ON (n.updated_at)",
+            "CREATE INDEX reply_created_at_uuid IF NOT EXISTS "
+            "FOR (n:Reply) ON (n.created_at, n.uuid)",
+            "CREATE INDEX reply_updated_at IF NOT EXISTS "
+            "FOR (n:Reply) ON (n.updated_at)",
+            "CREATE INDEX upvoted_by_upvoted_at IF NOT EXISTS "
+            "FOR ()-[r:UPVOTED_BY]-() ON (r.upvoted_at)",
+            "CREATE INDEX downvoted_by_downvoted_at IF NOT EXISTS "
+            "FOR ()-[r:DOWNVOTED_BY]-() ON (r.downvoted_at)",
+        ),
+    ),
+    Migration(
+        version=3,
+        description="full-text indexes",
+        statements=(
+            "CREATE FULLTEXT INDEX thread_text IF NOT EXISTS "
+            "FOR (n:Thread) ON EACH [n.title, n.body]",
+            "CREATE FULLTEXT INDEX reply_text IF NOT EXISTS "
+            "FOR (n:Reply) ON EACH [n.body]",
+        ),
+    ),
+    Migration(
+        version=4,
+        description="indexes on pending vote events",
+        statements=(
+            "CREATE INDEX vote_event_target IF NOT EXISTS "
+            "FOR (n:VoteEvent) ON (n.target)",
+            "CREATE INDEX vote_event_at IF NOT EXISTS FOR (n:VoteEvent) ON (n.at)",
+        ),
+    ),
+    Migration(
+        version=5,
+        description="index on the voters of pending vote events",
+        statements=(
+            "CREATE INDEX vote_event_user IF NOT EXISTS "
+            "FOR (n:VoteEvent) ON (n.user)",
+        ),
+    ),
+    Migration(
+        version=6,
+        description="reset Thread statistics kept without participants",
+        statements=(
+            # N.B. the statistics are recomputed (with the participants and
+            #      depths now kept) when a Reply is next created or deleted
+            "MATCH (t:Thread) WHERE t.reply_count IS NOT NULL "
+            "AND t.reply_depths IS NULL "
+            "CALL { WITH t REMOVE t.reply_count, t.participant_count, "
+            "t.max_depth, t.last_activity_at } IN TRANSACTIONS OF 1000 ROWS",
+        ),
+    ),
+]
@@ -2,8 +2,9 @@
 # defines the schemas for different requests
 
 from datetime import datetime
+from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 ### users
@@ -20,6 +21,13 @@ class UserRead(UserBase):
     created_at: datetime
 
 
+### votes
+class MyVote(BaseModel):
+    # whether the User reading has upvoted and downvoted an item
+    up: bool
+    down: bool
+
+
 ### replies
 class ReplyBase(BaseModel):
     body: str
@@ -33,10 +41,21 @@ class ReplyUpdate(ReplyBase):
     pass
 
 
+class ReplyBatchItem(ReplyBase):
+    user_id: str
+    temp_id: str | None = None  # lets later Replies in the batch reply to this one
+    parent: str | None = None  # temp_id or uuid of the Reply replied to (if any)
+
+
+class ReplyBatchCreate(BaseModel):
+    replies: list[ReplyBatchItem] = Field(min_items=1, max_items=1000)
+
+
 class ReplySimpleRead(ReplyBase):
     uuid: str
     created_at: datetime
     updated_at: datetime
+    version: int = 0
 
 
 class ReplyReadWithVotes(ReplySimpleRead):
@@ -44,9 +63,33 @@ class ReplyReadWithVotes(ReplySimpleRead):
     downvotes: int
 
 
+class ReplyChildRead(ReplySimpleRead):
+    my_vote: MyVote | None = None
+
+
 class ReplyRead(ReplyReadWithVotes):
     author: UserRead
-    children: list[ReplySimpleRead]
+    children: list[ReplyChildRead]
+    my_vote: MyVote | None = None
+
+
+class ReplyBranchNode(ReplySimpleRead):
+    n_children: int
+    has_more_children: bool
+    continuation: str | None
+    children: list["ReplyBranchNode"]
+    my_vote: MyVote | None = None
+
+
+ReplyBranchNode.update_forward_refs()
+
+
+class ReplyBranch(BaseModel):
+    uuid: str
+    n_children: int
+    has_more_children: bool
+    continuation: str | None
+    children: list[ReplyBranchNode]
 
 
 ### threads
@@ -63,10 +106,19 @@ class ThreadUpdate(ThreadBase):
     pass
 
 
+class ThreadBatchItem(ThreadBase):
+    user_id: str
+
+
+class ThreadBatchCreate(BaseModel):
+    threads: list[ThreadBatchItem] = Field(min_items=1, max_items=1000)
+
+
 class ThreadSimpleRead(ThreadBase):
     uuid: str
     created_at: datetime
     updated_at: datetime
+    version: int = 0
 
 
 class ThreadReadWithVotes(ThreadSimpleRead):
@@ -76,4 +128,81 @@ class ThreadReadWithVotes(ThreadSimpleRead):
 
 class ThreadRead(ThreadReadWithVotes):
     author: UserRead
-    children: list[ReplySimpleRead]
+    children: list[ReplyChildRead]
+    my_vote: MyVote | None = None
+
+
+class ThreadStats(BaseModel):
+    reply_count: int
+    participant_count: int
+    max_depth: int
+    last_activity_at: datetime
+
+
+class ThreadReadWithStats(ThreadSimpleRead):
+    stats: ThreadStats | None = None
+    my_vote: MyVote | None = None
+
+
+class TrendingThread(BaseModel):
+    uuid: str
+    score: float
+
+
+class RelatedThread(BaseModel):
+    uuid: str
+    score: float  # cosine similarity of the Users engaged, from 0 to 1
+
+
+### batches
+class BatchCreated(BaseModel):
+    uuids: list[str]  # in the order the items were submitted
+
+
+### admin
+class QueryProfileRead(BaseModel):
+    query: str
+    params: dict[str, Any]
+    rows: int
+    elapsed_ms: float
+    db_hits: int | None
+    plan_mode: str | None
+    plan: dict[str, Any] | None
+
+
+class RelatedRefreshRead(BaseModel):
+    refreshed: int  # the number of Threads whose related Threads were stored
+
+
+class ArchiveRead(BaseModel):
+    archived: list[str]  # uuids of the Threads moved to the archive
+
+
+class AdmissionStatsRead(BaseModel):
+    enabled: bool
+    admitted: int
+    rejected_client_rate: int
+    rejected_user_rate: int
+    rejected_global_rate: int
+    rejected_queue_full: int
+    rejected_queue_timeout: int
+    in_flight: int
+    queued: int
+
+
+class SingleFlightStatsRead(BaseModel):
+    name: str
+    requests: int
+    executions: int
+    coalesced: int
+    in_flight: int
+
+
+class RequestProfileRead(BaseModel):
+    method: str
+    path: str
+    correlation_id: str
+    started_at: datetime
+    elapsed_ms: float
+    status_code: int | None
+    queries: list[QueryProfileRead]
@@ -0,0 +1,254 @@
+# services/admission.py
+# services for limiting the rate and concurrency of write requests
+
+import asyncio
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+# the request methods that write to the database
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0  # write requests let through
+    rejected_client_rate: int = 0  # rejected as their address was over its rate
+    rejected_user_rate: int = 0  # rejected as their User was over their rate
+    rejected_global_rate: int = 0  # rejected as all writes were over the rate
+    rejected_queue_full: int = 0  # rejected as too many were already waiting
+    rejected_queue_timeout: int = 0  # rejected after waiting too long for a slot
+    in_flight: int = 0  # write requests currently being handled
+    queued: int = 0  # write requests currently waiting for a slot
+
+
+class TokenBucket:
+    """
+    TokenBucket
+
+    Allows `rate` requests per second on average, and bursts of up to `burst`
+    at once: each request takes a token, and tokens are replaced at `rate`
+    per second, up to `burst` of them
+
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = now
+
+    def take(self, now: float) -> float:
+        """
+        take
+
+        Takes a token, if there is one
+
+        Input:
+            now - the current (monotonic) time
+
+        Output:
+            wait - 0 if a token was taken, else the seconds until there is one
+
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class Rejected(Exception):
+    """
+    Rejected
+
+    Raised when a write request is not admitted
+
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    AdmissionController
+
+    Protects the database's write capacity from any one client, and from
+    overload in general. Each write request must:
+
+    1. take a token from its client address's bucket (`client_rate` per
+       second, bursts of `client_burst`)
+    2. take a token from its User's bucket (`user_rate` and `user_burst`),
+       if it names one
+    3. take a token from the bucket shared by all writes (`global_rate` and
+       `global_burst`)
+    4. get one of `max_concurrent` slots, waiting (in order of arrival) for
+       up to `queue_timeout` seconds if they are all taken, as one of at
+       most `max_queued` waiting
+
+    Requests failing a step are rejected at once (having waited no longer
+    than the queue timeout), with the seconds to wait before retrying.
+
+    N.B. limits are per process: with several workers, each admits its own
+         share. The User is named by the client (and not authenticated), so
+         a client cannot escape its address's limit by naming ever new Users.
+         The slots bound the write transactions in flight only as the write
+         routes run on worker threads (as plain functions), off the event
+         loop.
+
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.client_rate = 20.0
+        self.client_burst = 80
+        self.user_rate = 5.0
+        self.user_burst = 20
+        self.global_rate = 200.0
+        self.global_burst = 400
+        self.max_concurrent = 32
+        self.max_queued = 256
+        self.queue_timeout = 2.0
+        self.max_tracked = 100_000
+        self.stats = AdmissionStats()
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._global: TokenBucket | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    def configure(
+        self,
+        client_rate: float,
+        client_burst: int,
+        user_rate: float,
+        user_burst: int,
+        global_rate: float,
+        global_burst: int,
+        max_concurrent: int,
+        max_queued: int,
+        queue_timeout: float,
+    ):
+        self.enabled = True
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.reset()
+
+    def reset(self):
+        self.stats = AdmissionStats()
+        self._buckets.clear()
+        self._global = None
+        self._slots = None
+
+    def _bucket(self, key: str, rate: float, burst: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst, now)
+            self._buckets[key] = bucket
+            # N.B. the least recently seen are forgotten (with a full bucket
+            #      once seen again), which only ever admits more
+            if len(self._buckets) > self.max_tracked:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        return bucket
+
+    def _take_tokens(self, client: str, user: str | None) -> list[TokenBucket]:
+        now = monotonic()
+
+        if self._global is None:
+            self._global = TokenBucket(self.global_rate, self.global_burst, now)
+
+        buckets = {
+            "client_rate": self._bucket(
+                f"client:{client}", self.client_rate, self.client_burst, now
+            )
+        }
+        if user:
+            buckets["user_rate"] = self._bucket(
+                f"user:{user}", self.user_rate, self.user_burst, now
+            )
+        buckets["global_rate"] = self._global
+
+        taken = []
+        for reason, bucket in buckets.items():
+            wait = bucket.take(now)
+            if wait:
+                # N.B. only admitted requests count against a client or User
+                for earlier in taken:
+                    earlier.give_back()
+                counter = f"rejected_{reason}"
+                setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+                raise Rejected(reason, wait)
+            taken.append(bucket)
+
+        return taken
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        if self._slots.locked():
+            if self.stats.queued >= self.max_queued:
+                self.stats.rejected_queue_full += 1
+                raise Rejected("queue_full", self.queue_timeout)
+
+            self.stats.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats.rejected_queue_timeout += 1
+                raise Rejected("queue_timeout", self.queue_timeout) from None
+            finally:
+                self.stats.queued -= 1
+        else:
+            await self._slots.acquire()
+
+    async def admit(self, client: str, user: str | None = None):
+        """
+        admit
+
+        Admits a write request, or raises Rejected
+
+        N.B. each request admitted must call release once it is done
+
+        Inputs:
+            client - the address the request came from
+            user - the User the request names (if any)
+
+        """
+        taken = self._take_tokens(client, user)
+        try:
+            await self._acquire_slot()
+        except Rejected:
+            for bucket in taken:
+                bucket.give_back()  # N.B. as in _take_tokens
+            raise
+
+        self.stats.admitted += 1
+        self.stats.in_flight += 1
+
+    def release(self):
+        self.stats.in_flight -= 1
+        self._slots.release()
+
+
+admission = AdmissionController()
@@ -0,0 +1,554 @@
+# services/archive.py
+# services for moving inactive Threads out of the graph into compressed files
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from threading import RLock
+from time import monotonic, time_ns
+
+from neomodel import db
+
+from src.models import Thread
+
+### the graph side
+
+# a Thread is inactive if neither it nor anything below it has been edited,
+# replied to or voted on since $before (pending vote events count as votes)
+INACTIVE_PREDICATE = """\
+    NOT EXISTS {
+        MATCH (t)<-[:IN_REPLY_TO*0..]-(n)
+        WHERE n.updated_at >= $before
+            OR EXISTS {
+                MATCH (n)-[v:UPVOTED_BY|DOWNVOTED_BY]->()
+                WHERE coalesce(v.upvoted_at, v.downvoted_at) >= $before
+            }
+            OR EXISTS { MATCH (:VoteEvent {target: n.uuid}) }
+    }
+    """
+
+
+# Threads with no activity since $before
+INACTIVE_THREADS_QUERY = f"""\
+    MATCH
+        (t:Thread)
+    WHERE
+        t.updated_at < $before AND {INACTIVE_PREDICATE}
+    RETURN
+        t.uuid
+    LIMIT
+        $limit
+    """
+
+
+def inactive_threads(before: float, limit: int) -> list[str]:
+    """
+    inactive_threads
+
+    Returns up to `limit` Threads with no activity since `before` (seconds
+    since the epoch)
+
+    """
+    results, _ = db.cypher_query(
+        INACTIVE_THREADS_QUERY, {"before": before, "limit": limit}
+    )
+    return [row[0] for row in results]
+
+
+# a Thread with its Replies, their authors and the votes on them
+EXPORT_THREAD_QUERY = """\
+    MATCH
+        (t:Thread {uuid: $uuid})
+    OPTIONAL MATCH
+        (t)-[:AUTHORED_BY]->(a:User)
+    CALL {
+        WITH t
+        MATCH path = (t)<-[:IN_REPLY_TO*]-(r:Reply)
+        OPTIONAL MATCH (r)-[:AUTHORED_BY]->(ra:User)
+        WITH r, ra, length(path) AS depth, nodes(path)[-2] AS parent
+        ORDER BY depth, r.created_at
+        RETURN
+            collect(r {
+                .uuid, .body, .created_at, .updated_at, .version,
+                author: ra.uuid, parent: parent.uuid
+            }) AS replies,
+            collect(DISTINCT ra {.uuid, .name, .created_at}) AS reply_authors
+    }
+    CALL {
+        WITH t
+        MATCH (t)<-[:IN_REPLY_TO*0..]-(n)-[v:UPVOTED_BY|DOWNVOTED_BY]->(u:User)
+        RETURN
+            collect([
+                n.uuid,
+                u.uuid,
+                CASE type(v) WHEN "UPVOTED_BY" THEN "up" ELSE "down" END,
+                coalesce(v.upvoted_at, v.downvoted_at)
+            ]) AS votes
+    }
+    RETURN
+        t {
+            .uuid, .title, .body, .created_at, .updated_at, .version,
+            author: a.uuid
+        },
+        a {.uuid, .name, .created_at},
+        replies,
+        reply_authors,
+        votes
+    """
+
+
+def export_thread(uuid: str) -> dict:
+    """
+    export_thread
+
+    Reads a Thread with its Replies, their authors and the votes on them in
+    a single query (see Repository.export_thread for the format)
+
+    """
+    results, _ = db.cypher_query(EXPORT_THREAD_QUERY, {"uuid": uuid})
+    if not results:
+        raise Thread.DoesNotExist(repr({"uuid": uuid}))
+
+    thread, author, replies, reply_authors, votes = results[0]
+    users = {user["uuid"]: user for user in reply_authors + [author] if user}
+
+    return {
+        "thread": thread,
+        "replies": replies,
+        "users": list(users.values()),
+        "votes": votes,
+    }
+
+
+def import_thread(tree: dict):
+    """
+    import_thread
+
+    Recreates an exported Thread, its Replies and the votes on them
+
+    N.B. run within a transaction, followed by store_thread_stats
+
+    """
+    thread = tree["thread"]
+    properties = ("uuid", "body", "created_at", "updated_at", "version")
+
+    db.cypher_query(
+        """\
+        CREATE
+            (t:Thread)
+        SET
+            t = $thread
+        WITH
+            t
+        OPTIONAL MATCH
+            (a:User {uuid: $author})
+        CALL {
+            WITH t, a
+            WITH * WHERE a IS NOT NULL
+            CREATE (t)-[:AUTHORED_BY]->(a)
+        }
+        """,
+        {
+            "thread": {field: thread[field] for field in properties + ("title",)},
+            "author": thread["author"],
+        },
+    )
+
+    db.cypher_query(
+        """\
+        UNWIND $replies AS reply
+        CREATE
+            (r:Reply)
+        SET
+            r = reply.properties
+        WITH
+            r, reply
+        CALL {
+            WITH r, reply
+            WITH * WHERE reply.parent = $thread
+            SET r:ReplyTopLevel
+        }
+        CALL {
+            WITH r, reply
+            WITH * WHERE reply.parent <> $thread
+            SET r:ReplyLowerLevel
+        }
+        CALL {
+            WITH r, reply
+            MATCH (a:User {uuid: reply.author})
+            CREATE (r)-[:AUTHORED_BY]->(a)
+        }
+        """,
+        {
+            "thread": thread["uuid"],
+            "replies": [
+                {
+                    "properties": {field: reply[field] for field in properties},
+                    "parent": reply["parent"],
+                    "author": reply["author"],
+                }
+                for reply in tree["replies"]
+            ],
+        },
+    )
+
+    # N.B. every Reply exists by now, so each can be linked to its parent
+    db.cypher_query(
+        """\
+        MATCH
+            (t:Thread {uuid: $thread})
+        UNWIND $replies AS reply
+        MATCH
+            (r:Reply {uuid: reply.uuid})
+        CALL {
+            WITH t, r, reply
+            WITH * WHERE reply.parent = t.uuid
+            CREATE (r)-[:IN_REPLY_TO]->(t)
+        }
+        CALL {
+            WITH t, r, reply
+            WITH * WHERE reply.parent <> t.uuid
+            MATCH (p:Reply {uuid: reply.parent})
+            CREATE (r)-[:IN_REPLY_TO]->(p)
+        }
+        """,
+        {
+            "thread": thread["uuid"],
+            "replies": [
+                {"uuid": reply["uuid"], "parent": reply["parent"]}
+                for reply in tree["replies"]
+            ],
+        },
+    )
+
+    votes = [
+        {"item": item, "user": user, "kind": kind, "at": at}
+        for item, user, kind, at in tree["votes"]
+    ]
+    db.cypher_query(
+        """\
+        UNWIND $votes AS vote
+        CALL {
+            WITH vote
+            WITH * WHERE vote.item = $thread
+            MATCH (n:Thread {uuid: vote.item})
+            RETURN n
+          UNION
+            WITH vote
+            WITH * WHERE vote.item <> $thread
+            MATCH (n:Reply {uuid: vote.item})
+            RETURN n
+        }
+        MATCH
+            (u:User {uuid: vote.user})
+        CALL {
+            WITH n, u, vote
+            WITH * WHERE vote.kind = "up"
+            CREATE (n)-[:UPVOTED_BY {upvoted_at: vote.at}]->(u)
+        }
+        CALL {
+            WITH n, u, vote
+            WITH * WHERE vote.kind = "down"
+            CREATE (n)-[:DOWNVOTED_BY {downvoted_at: vote.at}]->(u)
+        }
+        """,
+        {"thread": thread["uuid"], "votes": votes},
+    )
+
+
+def purge_thread(uuid: str, before: float) -> bool:
+    """
+    purge_thread
+
+    Deletes a Thread with all of its Replies (and so the votes on them),
+    provided it has had no activity since `before`
+
+    """
+    query = f"""\
+        MATCH
+            (t:Thread {{uuid: $uuid}})
+        WHERE
+            {INACTIVE_PREDICATE}
+        OPTIONAL MATCH
+            (t)<-[:IN_REPLY_TO*]-(r:Reply)
+        WITH
+            t, collect(r) AS replies
+        FOREACH (r IN replies | DETACH DELETE r)
+        DETACH DELETE t
+        RETURN
+            count(*)
+        """
+    results, _ = db.cypher_query(query, {"uuid": uuid, "before": before})
+    return results[0][0] > 0
+
+
+### the file side
+
+# archive segments start and end with this, and end with where their index is
+SEGMENT_MAGIC = b"THRDSEG1"
+SEGMENT_FOOTER = struct.Struct("<QQ8s")  # index offset, index length, magic
+
+
+class ArchiveSegment:
+    """
+    ArchiveSegment
+
+    A file holding a batch of archived Threads, each compressed on its own,
+    followed by a compressed index of where each Thread is, which Thread
+    each Reply belongs to and the title of each Thread. The file is
+    memory-mapped, so reading a Thread decompresses only its own bytes, and
+    the operating system keeps only the pages actually read in memory.
+
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.name = path.stem
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offset, length, magic = SEGMENT_FOOTER.unpack(self._map[-SEGMENT_FOOTER.size :])
+        if magic != SEGMENT_MAGIC or self._map[: len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not an archive segment")
+
+        index = json.loads(zlib.decompress(self._map[offset : offset + length]))
+        self.threads: dict[str, list[int]] = index["threads"]
+        self.replies: dict[str, str] = index["replies"]
+        self.titles: dict[str, str] = index.get("titles", {})  # Thread -> title
+
+    def read(self, thread_uuid: str) -> dict:
+        offset, length = self.threads[thread_uuid]
+        return json.loads(zlib.decompress(self._map[offset : offset + length]))
+
+    def close(self):
+        self._map.close()
+
+    @staticmethod
+    def write(path: Path, trees: list[dict], level: int = 6):
+        """
+        write
+
+        Writes a batch of exported Threads as a segment, atomically (the
+        file only appears once complete)
+
+        """
+        threads, replies, titles = {}, {}, {}
+        temporary = path.with_suffix(".tmp")
+
+        with open(temporary, "wb") as file:
+            file.write(SEGMENT_MAGIC)
+            for tree in trees:
+                uuid = tree["thread"]["uuid"]
+                blob = zlib.compress(json.dumps(tree).encode(), level)
+                threads[uuid] = [file.tell(), len(blob)]
+                replies.update({reply["uuid"]: uuid for reply in tree["replies"]})
+                titles[uuid] = tree["thread"]["title"]
+                file.write(blob)
+
+            index = zlib.compress(
+                json.dumps(
+                    {"threads": threads, "replies": replies, "titles": titles}
+                ).encode(),
+                level,
+            )
+            offset = file.tell()
+            file.write(index)
+            file.write(SEGMENT_FOOTER.pack(offset, len(index), SEGMENT_MAGIC))
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary, path)
+
+
+class ArchiveStore:
+    """
+    ArchiveStore
+
+    The archive segments in a directory, shared by every worker on the
+    host. A Thread brought back into the graph is marked with a tombstone
+    (a line in the directory's tombstones file), so that its archived copy
+    is ignored from then on, by every worker.
+
+    Workers pick up segments and tombstones written by others when they
+    look for something they cannot find (at most every `refresh_interval`
+    seconds) or before changing the archive.
+
+    """
+
+    def __init__(self, directory: str, refresh_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.refresh_interval = refresh_interval
+        self._lock = RLock()
+        self._segments: dict[str, ArchiveSegment] = {}
+        self._threads: dict[str, str] = {}  # Thread -> latest segment
+        self._replies: dict[str, str] = {}  # Reply -> Thread
+        self._titles: dict[str, str] = {}  # title -> Thread
+        self._tombstones: set[tuple[str, str]] = set()  # (Thread, segment)
+        self._tombstones_read = 0  # bytes of the tombstones file read
+        self._refreshed_at = float("-inf")
+        self.refresh()
+
+    @property
+    def _tombstones_path(self) -> Path:
+        return self.directory / "tombstones"
+
+    def refresh(self, force: bool = True):
+        """
+        refresh
+
+        Loads segments and tombstones written since the last refresh (if
+        forced, or if `refresh_interval` has passed since then)
+
+        """
+        with self._lock:
+            if not force and monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+            self._refreshed_at = monotonic()
+
+            for path in sorted(self.directory.glob("*.seg")):
+                if path.stem not in self._segments:
+                    segment = ArchiveSegment(path)
+                    self._segments[segment.name] = segment
+                    for thread in segment.threads:
+                        self._threads[thread] = segment.name
+                    self._replies.update(segment.replies)
+                    self._titles.update(
+                        {title: thread for thread, title in segment.titles.items()}
+                    )
+
+            if self._tombstones_path.exists():
+                with open(self._tombstones_path, "rb") as file:
+                    file.seek(self._tombstones_read)
+                    for line in file.read().decode().splitlines():
+                        thread, segment = line.split()
+                        self._tombstones.add((thread, segment))
+                    self._tombstones_read = file.tell()
+
+    def _live_segment(self, thread_uuid: str) -> str | None:
+        segment = self._threads.get(thread_uuid)
+        if segment is None or (thread_uuid, segment) in self._tombstones:
+            return None
+        return segment
+
+    def thread_of(self, node_class: type, uuid: str) -> str | None:
+        """
+        thread_of
+
+        Returns the uuid of the archived Thread a Thread or Reply belongs
+        to, or None if it is not archived
+
+        """
+        for attempt in (False, True):
+            with self._lock:
+                thread = uuid if node_class is Thread else self._replies.get(uuid)
+                if thread is not None and self._live_segment(thread) is not None:
+                    return thread
+            if attempt:
+                return None
+            self.refresh(force=False)
+
+    def thread_titled(self, title: str, force: bool = False) -> str | None:
+        """
+        thread_titled
+
+        Returns the uuid of the archived Thread with a title, or None if no
+        archived Thread has it
+
+        N.B. archived Threads keep their titles, so that they can be brought
+             back into the graph without a clash
+
+        """
+        for attempt in (False, True):
+            with self._lock:
+                thread = self._titles.get(title)
+                if (
+                    thread is not None
+                    and self._live_segment(thread) is not None
+                    and self._segments[self._threads[thread]].titles.get(thread)
+                    == title
+                ):
+                    return thread
+            if attempt:
+                return None
+            self.refresh(force=force)
+
+    def load(self, thread_uuid: str) -> dict | None:
+        """
+        load
+
+        Returns an archived Thread, as exported, or None if not archived
+
+        """
+        with self._lock:
+            segment = self._live_segment(thread_uuid)
+            if segment is None:
+                return None
+            return self._segments[segment].read(thread_uuid)
+
+    def write(self, trees: list[dict]) -> str:
+        """
+        write
+
+        Archives a batch of exported Threads as a new segment
+
+        Output:
+            name - of the segment
+
+        """
+        name = f"{time_ns():020d}"
+        ArchiveSegment.write(self.directory / f"{name}.seg", trees)
+        self.refresh()
+        return name
+
+    def tombstone(self, thread_uuid: str):
+        """
+        tombstone
+
+        Marks the archived copy of a Thread as no longer current
+
+        """
+        with self._lock:
+            segment = self._threads.get(thread_uuid)
+            if segment is None:
+                return
+            # N.B. appends of one short line are atomic, so workers can share
+            #      the file without further locking
+            with open(self._tombstones_path, "a") as file:
+                file.write(f"{thread_uuid} {segment}\n")
+            self.refresh()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return all(
+                segment is None for segment in map(self._live_segment, self._threads)
+            )
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """
+        exclusive
+
+        Keeps other workers (and processes) from changing the archive, e.g.
+        while a Thread is being brought back into the graph
+
+        """
+        with self._lock, open(self.directory / "lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
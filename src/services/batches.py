@@ -0,0 +1,276 @@
+# services/batches.py
+# services for creating many Threads or Replies in a single statement
+
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from neomodel import db
+
+from src.models import Reply, Thread, User
+from src.services.ids import new_id
+from src.services.sessions import write_transaction
+from src.services.stats import record_replies_created
+
+# consecutive items in a batch are this far apart in created_at, so that
+# they sort in the order they were submitted
+BATCH_TICK = timedelta(microseconds=1)
+
+
+class InvalidBatch(ValueError):
+    """
+    InvalidBatch
+
+    Raised when the items of a batch cannot be created as submitted (e.g.
+    an item refers to a temporary id that no earlier item declared)
+
+    """
+
+
+def timestamps(n: int) -> list[datetime]:
+    """
+    timestamps
+
+    Returns n distinct, increasing creation times, starting now
+
+    """
+    now = datetime.now(timezone.utc)
+    return [now + i * BATCH_TICK for i in range(n)]
+
+
+def is_uuid(value: str) -> bool:
+    """
+    is_uuid
+
+    Whether a value has the shape of a node identifier
+
+    """
+    try:
+        UUID(hex=value)
+    except ValueError:
+        return False
+
+    return True
+
+
+def resolve_replies(replies: list[dict]) -> list[dict]:
+    """
+    resolve_replies
+
+    Assigns each Reply in a batch its uuid and replaces temporary ids in
+    parent references with the uuids they stand for
+
+    Input:
+        replies - dicts with user_id, body, temp_id (optional) and parent:
+                  None (a top level Reply), the temp_id of an earlier Reply
+                  in the batch or the uuid of an existing Reply
+
+    Output:
+        resolved - dicts with uuid, user_id, body, parent (a uuid or None)
+                   and new_parent (whether the parent is in the batch), in
+                   the same order
+
+    """
+    declared = {
+        reply["temp_id"]: position
+        for position, reply in reversed(list(enumerate(replies)))
+        if reply.get("temp_id") is not None
+    }
+    uuids: dict[str, str] = {}
+    resolved = []
+
+    for position, reply in enumerate(replies):
+        uuid = new_id()
+        temp_id = reply.get("temp_id")
+        parent = reply.get("parent")
+
+        if parent is not None and parent not in uuids:
+            if parent in declared:
+                raise InvalidBatch(
+                    f"Reply at position {position} refers to temporary id "
+                    f"{parent!r}, which is only declared at position "
+                    f"{declared[parent]}"
+                )
+            if not is_uuid(parent):
+                raise InvalidBatch(
+                    f"Reply at position {position} refers to {parent!r}, "
+                    "which is neither a temporary id declared before it nor "
+                    "a Reply uuid"
+                )
+
+        resolved.append(
+            {
+                "uuid": uuid,
+                "user_id": reply["user_id"],
+                "body": reply["body"],
+                "parent": uuids.get(parent, parent),
+                "new_parent": parent in uuids,
+            }
+        )
+
+        if temp_id is not None:
+            if temp_id in uuids:
+                raise InvalidBatch(
+                    f"Temporary id {temp_id!r} is used more than once "
+                    f"(again at position {position})"
+                )
+            uuids[temp_id] = uuid
+
+    return resolved
+
+
+def check_references(
+    users: set[str], thread_uuid: str | None = None, parents: set[str] = frozenset()
+):
+    """
+    check_references
+
+    Checks that the Users, Thread and (existing) parent Replies a batch
+    refers to exist, and that the parents belong to the Thread
+
+    """
+    query = """\
+        RETURN
+            [user IN $users WHERE NOT EXISTS { (:User {uuid: user}) }],
+            $thread IS NULL OR EXISTS { (:Thread {uuid: $thread}) },
+            [parent IN $parents WHERE NOT EXISTS {
+                (:Reply {uuid: parent})-[:IN_REPLY_TO*]->(:Thread {uuid: $thread})
+            }]
+        """
+    params = {"users": list(users), "thread": thread_uuid, "parents": list(parents)}
+    results, _ = db.cypher_query(query, params)
+    missing_users, thread_exists, missing_parents = results[0]
+
+    if missing_users:
+        raise User.DoesNotExist(repr({"uuid": missing_users[0]}))
+    if not thread_exists:
+        raise Thread.DoesNotExist(repr({"uuid": thread_uuid}))
+    if missing_parents:
+        raise Reply.DoesNotExist(repr({"uuid": missing_parents[0]}))
+
+
+def create_replies(thread_uuid: str, replies: list[dict]) -> list[str]:
+    """
+    create_replies
+
+    Creates a batch of Replies in a Thread, in one transaction: all nodes
+    and relationships are written by a single UNWIND statement, then the
+    Thread's counters are updated for the whole batch at once
+
+    Inputs:
+        thread_uuid - the uuid of the Thread
+        replies - the Replies to create (see resolve_replies)
+
+    Output:
+        uuids - the uuids of the new Replies, in the order submitted
+
+    """
+    resolved = resolve_replies(replies)
+    created_at = timestamps(len(resolved))
+
+    for reply, timestamp in zip(resolved, created_at):
+        reply["created_at"] = Reply.created_at.deflate(timestamp)
+
+    query = """\
+        MATCH
+            (t:Thread {uuid: $thread})
+        UNWIND $replies AS reply
+        MATCH
+            (u:User {uuid: reply.user_id})
+        CREATE
+            (r:Reply {
+                uuid: reply.uuid,
+                body: reply.body,
+                created_at: reply.created_at,
+                updated_at: reply.created_at,
+                version: 0
+            })-[:AUTHORED_BY]->(u)
+        WITH
+            t, collect({node: r, parent: reply.parent}) AS created
+        UNWIND created AS reply
+        WITH
+            t, reply.node AS r, reply.parent AS parent
+        CALL {
+            WITH t, r, parent
+            WITH * WHERE parent IS NULL
+            CREATE (r)-[:IN_REPLY_TO]->(t)
+            SET r:ReplyTopLevel
+        }
+        CALL {
+            WITH r, parent
+            WITH * WHERE parent IS NOT NULL
+            MATCH (p:Reply {uuid: parent})
+            CREATE (r)-[:IN_REPLY_TO]->(p)
+            SET r:ReplyLowerLevel
+        }
+        RETURN
+            count(r)
+        """
+    # N.B. the CREATEs are collected before any parent is matched, so a
+    #      Reply can be the parent of later Replies in the same batch
+
+    with write_transaction():
+        check_references(
+            {reply["user_id"] for reply in resolved},
+            thread_uuid,
+            {
+                reply["parent"]
+                for reply in resolved
+                if reply["parent"] is not None and not reply["new_parent"]
+            },
+        )
+        db.cypher_query(query, {"thread": thread_uuid, "replies": resolved})
+        uuids = [reply["uuid"] for reply in resolved]
+        record_replies_created(thread_uuid, uuids)
+
+    return uuids
+
+
+def create_threads(threads: list[dict]) -> list[str]:
+    """
+    create_threads
+
+    Creates a batch of Threads with a single UNWIND statement
+
+    N.B. if any title is taken (or repeated in the batch), nothing is
+         created and UniqueProperty is raised
+
+    Input:
+        threads - dicts with user_id, title, body and (optionally) uuid
+
+    Output:
+        uuids - the uuids of the new Threads, in the order submitted
+
+    """
+    resolved = [
+        {
+            **thread,
+            "uuid": thread.get("uuid") or new_id(),
+            "created_at": Thread.created_at.deflate(timestamp),
+        }
+        for thread, timestamp in zip(threads, timestamps(len(threads)))
+    ]
+
+    query = """\
+        UNWIND $threads AS thread
+        MATCH
+            (u:User {uuid: thread.user_id})
+        CREATE
+            (:Thread {
+                uuid: thread.uuid,
+                title: thread.title,
+                body: thread.body,
+                created_at: thread.created_at,
+                updated_at: thread.created_at,
+                version: 0,
+                reply_count: 0,
+                participant_count: 1,
+                max_depth: 0,
+                reply_depths: []
+            })-[:AUTHORED_BY]->(u)
+        """
+
+    with write_transaction():
+        check_references({thread["user_id"] for thread in resolved})
+        db.cypher_query(query, {"threads": resolved})
+
+    return [thread["uuid"] for thread in resolved]
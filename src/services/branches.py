@@ -0,0 +1,233 @@
+# services/branches.py
+# services for loading deep reply branches a bounded number of levels at a time
+
+import json
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodingError
+
+from neomodel import db
+
+from src.models import Reply
+from src.services.projections import REPLY_PROPERTIES, inflate_fields, map_projection
+
+MAX_BRANCH_DEPTH = 50
+MAX_BRANCH_REPLIES = 500
+
+
+class InvalidCursor(ValueError):
+    """
+    InvalidCursor
+
+    Raised when a continuation cursor cannot be decoded, or does not belong
+    to the Reply it is used with
+
+    """
+
+
+def encode_cursor(uuid: str, after: tuple[float, str] | None) -> str:
+    """
+    encode_cursor
+
+    Returns an opaque cursor for continuing a branch below a Reply
+
+    Inputs:
+        uuid - the uuid of the Reply whose children are still to be loaded
+        after - (created_at, uuid) of the last child already loaded, if any
+
+    Output:
+        cursor
+
+    """
+    payload = json.dumps({"reply": uuid, "after": after}, separators=(",", ":"))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, uuid: str) -> tuple[float, str] | None:
+    """
+    decode_cursor
+
+    Extracts the position from a cursor created by encode_cursor
+
+    Inputs:
+        cursor - the cursor
+        uuid - the uuid of the Reply the branch is being continued from
+
+    Output:
+        after - (created_at, uuid) of the last child already loaded, if any
+
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(urlsafe_b64decode(padded))
+        reply = payload["reply"]
+        after = payload["after"]
+        if after is not None:
+            created_at, after_uuid = after
+            after = (float(created_at), str(after_uuid))
+    except (DecodingError, ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor(f"Malformed cursor {cursor!r}") from exc
+
+    if reply != uuid:
+        raise InvalidCursor(f"Cursor {cursor!r} does not belong to Reply {uuid}")
+
+    return after
+
+
+def branch_query(depth: int) -> str:
+    """
+    branch_query
+
+    Returns the query fetch_branch runs to load `depth` levels of a branch
+
+    """
+    # N.B. branch is the root's child on the path to each reply, so that
+    #      continuing after a child skips that child's whole subtree
+    return f"""\
+        MATCH
+            (root:Reply {{uuid: $uuid}})
+        CALL {{
+            WITH root
+            MATCH
+                path = (reply:Reply)-[:IN_REPLY_TO*1..{depth}]->(root)
+            WITH
+                reply, path, nodes(path)[-2] AS branch
+            WHERE
+                $after_created_at IS NULL
+                OR branch.created_at > $after_created_at
+                OR (
+                    branch.created_at = $after_created_at
+                    AND branch.uuid > $after_uuid
+                )
+            WITH
+                reply, path
+            ORDER BY
+                length(path), reply.created_at, reply.uuid
+            LIMIT
+                $limit
+            RETURN
+                collect({{
+                    reply: {map_projection("reply", REPLY_PROPERTIES)},
+                    created_at: reply.created_at,
+                    parent: nodes(path)[1].uuid,
+                    level: length(path),
+                    n_children: COUNT {{ (:Reply)-[:IN_REPLY_TO]->(reply) }}
+                }}) AS replies
+        }}
+        RETURN
+            replies,
+            COUNT {{
+                MATCH (child:Reply)-[:IN_REPLY_TO]->(root)
+                WHERE
+                    $after_created_at IS NULL
+                    OR child.created_at > $after_created_at
+                    OR (
+                        child.created_at = $after_created_at
+                        AND child.uuid > $after_uuid
+                    )
+            }} AS n_children
+        """
+
+
+def fetch_branch(
+    uuid: str,
+    depth: int,
+    limit: int,
+    after: tuple[float, str] | None = None,
+    preview_chars: int | None = None,
+) -> dict:
+    """
+    fetch_branch
+
+    Loads up to `depth` levels of the descendants of a Reply in a single
+    query, breadth first and in order of creation, stopping after `limit`
+    Replies. Replies whose children were not (all) loaded are flagged and
+    given a cursor from which to continue.
+
+    N.B. the number of Replies held in memory is bounded by `limit`,
+         whatever the depth of the branch
+
+    Inputs:
+        uuid - the uuid of the Reply to start from
+        depth - the number of levels to load (at most MAX_BRANCH_DEPTH)
+        limit - the maximum number of Replies to load
+        after - if set, only the root's children after this one are loaded
+        preview_chars - if set, bodies are truncated to this many characters
+
+    Output:
+        branch - the root's uuid and its (nested) descendants
+
+    """
+    depth = max(1, min(depth, MAX_BRANCH_DEPTH))
+    limit = max(1, min(limit, MAX_BRANCH_REPLIES))
+
+    query = branch_query(depth)
+    after_created_at, after_uuid = after if after is not None else (None, None)
+    params = {
+        "uuid": uuid,
+        "limit": limit,
+        "after_created_at": after_created_at,
+        "after_uuid": after_uuid,
+        "preview_chars": preview_chars,
+    }
+    results, _ = db.cypher_query(query, params)
+
+    if not results:
+        raise Reply.DoesNotExist(repr({"uuid": uuid}))
+
+    rows, n_children = results[0]
+
+    for row in rows:
+        inflate_fields(Reply, row["reply"])
+
+    return assemble_branch(uuid, n_children, rows, after)
+
+
+def assemble_branch(
+    uuid: str,
+    n_children: int,
+    rows: list[dict],
+    after: tuple[float, str] | None,
+) -> dict:
+    """
+    assemble_branch
+
+    Nests the Replies loaded for a branch under their parents, flagging
+    those whose children were not all loaded and giving them a cursor
+
+    Inputs:
+        uuid - the uuid of the Reply the branch starts from
+        n_children - the number of the root's children (after `after`)
+        rows - the loaded Replies, in order of level: each with its fields
+               ("reply"), created_at (as stored), parent and n_children
+        after - the position the branch was continued from, if any
+
+    Output:
+        branch - the root's uuid and its (nested) descendants
+
+    """
+    # rows are ordered by level, so every parent precedes its children
+    root = {"uuid": uuid, "n_children": n_children, "children": []}
+    loaded = {uuid: root}
+    last_loaded_child: dict[str, tuple[float, str]] = {}
+
+    for row in rows:
+        node = row["reply"]
+        node["n_children"] = row["n_children"]
+        node["children"] = []
+        loaded[node["uuid"]] = node
+        loaded[row["parent"]]["children"].append(node)
+        last_loaded_child[row["parent"]] = (row["created_at"], node["uuid"])
+
+    for node_uuid, node in loaded.items():
+        node["has_more_children"] = node["n_children"] > len(node["children"])
+        node["continuation"] = (
+            encode_cursor(
+                node_uuid,
+                last_loaded_child.get(node_uuid, after if node is root else None),
+            )
+            if node["has_more_children"]
+            else None
+        )
+
+    return root
@@ -0,0 +1,292 @@
+# services/compression.py
+# services for compressing responses, including streamed ones, as they are sent
+
+import zlib
+
+from abc import ABC, abstractmethod
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # N.B. optional: br is only offered if installed
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # N.B. optional: zstd is only offered if installed
+    zstandard = None
+
+# the content types worth compressing
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/xml", "+json")
+
+
+class Encoder(ABC):
+    """
+    Encoder
+
+    Compresses a response body a chunk at a time, for one content coding
+
+    """
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        """
+        compress
+
+        Takes the next chunk, returning whatever is ready to send
+
+        """
+
+    @abstractmethod
+    def flush(self) -> bytes:
+        """
+        flush
+
+        Returns everything compressed so far, so that the client can decode
+        it without waiting for the rest
+
+        """
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        """
+        finish
+
+        Ends the stream, returning what is left of it
+
+        """
+
+
+class GzipEncoder(Encoder):
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder(Encoder):
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# the encodings available, most preferred first
+ENCODERS: dict[str, type[Encoder]] = {
+    **({"zstd": ZstdEncoder} if zstandard is not None else {}),
+    **({"br": BrotliEncoder} if brotli is not None else {}),
+    "gzip": GzipEncoder,
+}
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """
+    parse_accept_encoding
+
+    Parses an Accept-Encoding header into the weight (q) of each encoding
+
+    """
+    weights = {}
+    for part in header.split(","):
+        coding, *params = (piece.strip() for piece in part.split(";"))
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+
+    return weights
+
+
+class ResponseCompression:
+    """
+    ResponseCompression
+
+    How responses are compressed: with the encoding the client weights
+    highest (ties going to zstd, then br, then gzip), at the level set for
+    it, unless the body is smaller than `minimum_size` bytes
+
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.minimum_size = 1024
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3}
+
+    def configure(self, enabled: bool, minimum_size: int, levels: dict[str, int]):
+        self.enabled = enabled
+        self.minimum_size = minimum_size
+        self.levels = {**self.levels, **levels}
+
+    def choose(self, accept_encoding: str) -> str | None:
+        """
+        choose
+
+        Returns the encoding to use for a client, or None to send the
+        response as it is
+
+        """
+        weights = parse_accept_encoding(accept_encoding)
+        wildcard = weights.get("*", 0.0)
+
+        best, best_weight = None, 0.0
+        for encoding in ENCODERS:
+            weight = weights.get(encoding, wildcard)
+            if weight > best_weight:
+                best, best_weight = encoding, weight
+
+        return best
+
+    def encoder(self, encoding: str) -> Encoder:
+        return ENCODERS[encoding](self.levels[encoding])
+
+
+compression = ResponseCompression()
+
+
+class CompressionMiddleware:
+    """
+    CompressionMiddleware
+
+    Compresses response bodies with the encoding negotiated for the client
+
+    A streamed response is compressed a chunk at a time, each chunk being
+    flushed as it is sent, so that it is never buffered as a whole. Its
+    first chunks are held back only until they reach the minimum size: a
+    response ending before then is sent uncompressed.
+
+    N.B. responses that are already encoded, or of content types that do
+         not compress well, are left as they are
+
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not compression.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = compression.choose(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await self.app(scope, receive, CompressingSender(send, encoding))
+
+
+class CompressingSender:
+    """
+    CompressingSender
+
+    Wraps the ASGI send of a single response, compressing its body
+
+    """
+
+    def __init__(self, send: Send, encoding: str):
+        self._send = send
+        self._encoding = encoding
+        self._start: Message | None = None
+        self._passthrough = False
+        self._buffer = bytearray()
+        self._encoder: Encoder | None = None
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or not any(
+                kind in content_type for kind in COMPRESSIBLE_TYPES
+            ):
+                self._passthrough = True
+                await self._send(message)
+            else:
+                self._start = message
+            return
+
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._encoder is None:
+            self._buffer += body
+            if len(self._buffer) < compression.minimum_size:
+                if more_body:
+                    return  # N.B. hold back until there is enough to compress
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(
+                    {"type": "http.response.body", "body": bytes(self._buffer)}
+                )
+                return
+
+            body = bytes(self._buffer)
+            self._buffer.clear()
+            self._encoder = compression.encoder(self._encoding)
+
+            headers = MutableHeaders(scope=self._start)
+            headers["Content-Encoding"] = self._encoding
+            headers.add_vary_header("Accept-Encoding")
+
+            if more_body:
+                del headers["Content-Length"]
+                await self._send(self._start)
+            else:
+                compressed = self._encoder.compress(body) + self._encoder.finish()
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+        if more_body:
+            compressed = self._encoder.compress(body) + self._encoder.flush()
+        else:
+            compressed = self._encoder.compress(body) + self._encoder.finish()
+
+        await self._send(
+            {
+                "type": "http.response.body",
+                "body": compressed,
+                "more_body": more_body,
+            }
+        )
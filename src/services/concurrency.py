@@ -0,0 +1,145 @@
+# services/concurrency.py
+# services for optimistic concurrency control on edits
+
+from datetime import datetime, timezone
+
+from neomodel import db
+
+from src.models import UpvotableNode
+
+
+class VersionConflict(Exception):
+    """
+    VersionConflict
+
+    Raised when an edit is conditional on a version of a node that is no
+    longer current (i.e. someone else has edited it in the meantime)
+
+    """
+
+    def __init__(self, uuid: str, expected: int, current: int):
+        self.uuid = uuid
+        self.expected = expected
+        self.current = current
+        super().__init__(
+            f"Version {expected} of {uuid} is out of date (current: {current})"
+        )
+
+
+def etag(version: int) -> str:
+    """
+    etag
+
+    Returns the (strong) entity tag for a version of a node
+
+    """
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: str | None) -> int | None:
+    """
+    parse_if_match
+
+    Extracts the expected version from an If-Match header
+
+    Input:
+        if_match - the header value, e.g. '"3"' (None or "*" match anything)
+
+    Output:
+        expected_version - None if any version is acceptable
+
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+
+    tag = if_match.split(",")[0].strip().removeprefix("W/").strip('"')
+
+    try:
+        return int(tag)
+    except ValueError:
+        return -1  # not a tag we issued, so it cannot match
+
+
+def conditional_update_query(label: str) -> str:
+    """
+    conditional_update_query
+
+    Returns the query conditional_update runs for a Thread or Reply (by
+    label)
+
+    """
+    return f"""\
+        MATCH
+            (n:{label} {{uuid: $uuid}})
+        SET
+            n._lock = true
+        WITH
+            n
+        REMOVE
+            n._lock
+        WITH
+            n,
+            coalesce(n.version, 0) AS current
+        WITH
+            n,
+            current,
+            ($expected IS NULL OR current = $expected) AS matched
+        FOREACH (_ IN CASE WHEN matched THEN [1] ELSE [] END |
+            SET
+                n += $properties,
+                n.updated_at = $now,
+                n.version = current + 1
+        )
+        RETURN
+            n, matched, current
+        """
+
+
+def conditional_update(
+    node_class: type[UpvotableNode],
+    uuid: str,
+    properties: dict,
+    expected_version: int | None,
+) -> UpvotableNode:
+    """
+    conditional_update
+
+    Updates a node's properties in a single statement, provided its version
+    still matches the expected one. On success, the version is incremented
+    and updated_at is set.
+
+    N.B. the node is write-locked before its version is read, so that of two
+         concurrent edits of the same version, the second waits for the
+         first to commit and then sees the version it left (rather than both
+         reading the old version and both succeeding)
+
+    Inputs:
+        node_class - the class of the node (its label is used for the lookup)
+        uuid - the uuid of the node to update
+        properties - the new values of the properties to change
+        expected_version - the version the edit was based on (None = any)
+
+    Output:
+        node - the node, as it is after the update
+
+    """
+    now = node_class.updated_at.deflate(datetime.now(timezone.utc))
+
+    query = conditional_update_query(node_class.__label__)
+    params = {
+        "uuid": uuid,
+        "expected": expected_version,
+        "properties": properties,
+        "now": now,
+    }
+    results, _ = db.cypher_query(query, params)
+
+    if not results:
+        raise node_class.DoesNotExist(repr({"uuid": uuid}))
+
+    node, matched, current = results[0]
+
+    if not matched:
+        raise VersionConflict(uuid, expected_version, current)
+
+    return node_class.inflate(node)
@@ -2,6 +2,7 @@
 # services for managing the application configuration
 
 from functools import lru_cache
+from typing import Literal
 
 from pydantic import BaseSettings
 
@@ -13,6 +14,95 @@ class AppSettings(BaseSettings):
     dbpass: str
     dbuser: str
 
+    # "neo4j" routes reads to followers and read replicas (and writes to the
+    # leader) of a cluster; "bolt" sends everything to the single dbhost
+    dbscheme: Literal["bolt", "bolt+s", "neo4j", "neo4j+s"] = "bolt"
+
+    # further databases to spread Threads over ("host:port/dbname" each, in
+    # a fixed order: shards should only ever be added at the end)
+    dbshards: list[str] = []
+
+    # the token the admin routes (/admin) require in the X-Admin-Token header;
+    # with no token set, they are disabled
+    admin_token: str | None = None
+
+    # storage ("memory" keeps everything in process, e.g. for tests)
+    repository_backend: Literal["neo4j", "memory"] = "neo4j"
+
+    # startup
+    seed_on_startup: bool = False
+    startup_timeout: float = 60.0  # seconds to wait for the graph database
+    startup_retry_max_delay: float = 60.0  # seconds, at most, between retries
+    migrate_on_startup: bool = False
+
+    # warm-up (the hottest Threads are read before the application reports
+    # ready; they are the most read, per the access stats, then most upvoted)
+    warmup_threads: int = 50  # 0 disables warming up
+    warmup_timeout: float = 30.0  # seconds, after which it is ready regardless
+    warmup_concurrency: int = 4  # Threads read at once
+    access_stats_file: str | None = None  # keeps read counts across restarts
+    access_stats_capacity: int = 1000  # Threads whose reads are counted
+
+    # cold storage (inactive Threads are moved to files in archive_dir; no
+    # archive_dir, no archiving)
+    archive_dir: str | None = None
+    archive_after_days: float = 90.0  # of inactivity
+    archive_cache_size: int = 64  # archived Threads kept in memory, once read
+
+    # admission control of writes (POST, PUT, PATCH and DELETE requests, per
+    # process; rejected requests get a 429 response with Retry-After)
+    admission_control: bool = False
+    client_write_rate: float = 20.0  # writes per second, per client address
+    client_write_burst: int = 80
+    user_write_rate: float = 5.0  # writes per second, per User
+    user_write_burst: int = 20
+    global_write_rate: float = 200.0  # writes per second, in total
+    global_write_burst: int = 400
+    max_concurrent_writes: int = 32
+    max_queued_writes: int = 256  # waiting for one of the concurrent slots
+    write_queue_timeout: float = 2.0  # seconds to wait for a slot
+
+    # response compression (gzip, plus br and zstd if brotli and zstandard
+    # are installed; the encoding is negotiated with each client)
+    compression: bool = True
+    compression_minimum_size: int = 1024  # bytes; smaller bodies are sent as is
+    gzip_level: int = 6  # 1 (fastest) to 9 (smallest)
+    brotli_quality: int = 4  # 0 to 11
+    zstd_level: int = 3  # 1 to 22
+
+    # logging
+    log_level: str = "INFO"
+    log_levels: dict[str, str] = {"neomodel": "WARNING", "neo4j": "WARNING"}
+    log_json: bool = False
+    request_log_sample_rate: float = 1.0  # fraction of request logs written
+
+    # votes (nodes voted on faster than this get append-only vote events)
+    hot_vote_rate: float = 20.0  # votes per second, per node
+    vote_roll_up_interval: float = 1.0  # seconds between roll-ups of events
+    vote_roll_up_batch_size: int = 5000
+
+    # each User's votes, held in memory to mark the items they read
+    my_votes_cache_size: int = 10_000  # Users held
+    my_votes_max_age: float = 60.0  # seconds before a User's votes are reloaded
+
+    # trending Threads (ranked by upvotes and Replies over a sliding window)
+    trending_window: float = 3600.0  # seconds
+    trending_buckets: int = 60  # the window slides a bucket at a time
+    trending_capacity: int = 100  # the most Threads that can be listed
+    trending_tracked: int = 10_000  # the most Threads scored at once
+
+    # related Threads (found by a job run through POST /admin/related)
+    related_threads_k: int = 10  # related Threads stored per Thread
+    related_max_user_threads: int = 1000  # Users engaged with more are ignored
+
+    # identifiers ("uuid7" ids are time-ordered, so index inserts append)
+    id_scheme: Literal["uuid4", "uuid7"] = "uuid4"
+
+    # query profiling (debug mode)
+    query_profiling: bool = False
+    query_profile_threshold_ms: float = 100.0  # slower queries get PROFILEd
+    query_profile_buffer_size: int = 100  # number of requests retained
+
 
 @lru_cache()
 def get_settings() -> AppSettings:
@@ -0,0 +1,44 @@
+# services/health.py
+# services for tracking the liveness and readiness of the application
+
+from threading import Event, Lock
+
+
+class Readiness:
+    """
+    Readiness
+
+    Thread-safe record of whether the application is ready to serve
+    traffic, together with the reason if it is not
+
+    """
+
+    def __init__(self):
+        self._ready = Event()
+        self._lock = Lock()
+        self._detail = "starting"
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def detail(self) -> str:
+        with self._lock:
+            return self._detail
+
+    def mark_ready(self):
+        with self._lock:
+            self._detail = "ready"
+        self._ready.set()
+
+    def mark_not_ready(self, detail: str):
+        with self._lock:
+            self._detail = detail
+        self._ready.clear()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+
+readiness = Readiness()
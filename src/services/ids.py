@@ -0,0 +1,258 @@
+# services/ids.py
+# services for generating node identifiers
+
+import os
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from time import time
+from uuid import UUID, uuid4
+
+from neomodel import UniqueIdProperty, db
+
+from src.services.config import get_settings
+
+
+def uuid7(timestamp: float | None = None) -> UUID:
+    """
+    uuid7
+
+    Returns a time-ordered UUID (version 7): the first 48 bits are a Unix
+    timestamp in milliseconds, the rest (version and variant aside) are
+    random
+
+    Input:
+        timestamp - seconds since the epoch (defaults to now)
+
+    Output:
+        uuid
+
+    """
+    milliseconds = int((time() if timestamp is None else timestamp) * 1000)
+    randomness = int.from_bytes(os.urandom(10), "big")
+
+    value = (milliseconds & 0xFFFF_FFFF_FFFF) << 80 | randomness
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # variant (RFC 4122)
+
+    return UUID(int=value)
+
+
+def id_timestamp(uuid: str) -> datetime | None:
+    """
+    id_timestamp
+
+    Returns the creation time embedded in a time-ordered id (None for ids
+    from other schemes)
+
+    """
+    value = UUID(hex=uuid)
+    if value.version != 7:
+        return None
+
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
+
+
+def new_id() -> str:
+    """
+    new_id
+
+    Returns a new node identifier (32 hex characters), using the scheme
+    set by ID_SCHEME: random (uuid4) or time-ordered (uuid7) ids
+
+    N.B. both schemes share a format, so they can coexist in the graph
+
+    """
+    if get_settings().id_scheme == "uuid7":
+        return uuid7().hex
+
+    return uuid4().hex
+
+
+class NodeIdProperty(UniqueIdProperty):
+    """
+    NodeIdProperty
+
+    A unique identifier generated by new_id, so that the id scheme can be
+    chosen in configuration
+
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.default = new_id
+
+
+### migration of existing nodes
+
+# the labels of the nodes whose ids can be migrated
+ID_LABELS = ("User", "Thread", "Reply")
+
+# the property of :VoteEvent nodes referring to nodes of each label
+VOTE_EVENT_REFERENCES = {"User": "user", "Thread": "target", "Reply": "target"}
+
+
+def id_migration_blocker(label: str, sharded: bool, archived: bool) -> str | None:
+    """
+    id_migration_blocker
+
+    Returns why the ids of nodes of a label cannot be migrated (None if
+    they can)
+
+    Inputs:
+        label - the label of the nodes
+        sharded - whether Threads are spread over several databases
+        archived - whether any Threads are in the archive
+
+    Output:
+        reason
+
+    """
+    if archived:
+        return "archived Threads refer to Threads, Replies and Users by id"
+    if sharded and label == "Thread":
+        return "the shard holding a Thread is chosen by its id"
+    if sharded and label == "User":
+        return "every shard holds a copy of each User under the same id"
+    return None
+
+
+def migrate_ids(label: str, batch_size: int = 1000) -> int:
+    """
+    migrate_ids
+
+    Replaces the ids of existing nodes with time-ordered ones, derived
+    from their creation time. The previous id is kept as legacy_uuid, and
+    pending vote events are pointed at the new ids. The related Threads
+    stored on Threads are removed when Threads are migrated (run a full
+    refresh of them afterwards).
+
+    N.B. clients holding the previous ids will need to re-fetch them. See
+         id_migration_blocker for when ids must not be migrated.
+
+    Inputs:
+        label - the label of the nodes to migrate
+        batch_size - the number of nodes updated per transaction
+
+    Output:
+        migrated - the number of nodes given new ids
+
+    """
+    migrated = 0
+
+    while True:
+        results, _ = db.cypher_query(
+            f"""\
+            MATCH
+                (n:{label})
+            WHERE
+                substring(n.uuid, 12, 1) <> '7'
+            RETURN
+                n.uuid, n.created_at
+            LIMIT
+                $batch_size
+            """,
+            {"batch_size": batch_size},
+        )
+        if not results:
+            break
+
+        changes = [
+            {"uuid": uuid, "new_uuid": uuid7(created_at).hex}
+            for uuid, created_at in results
+        ]
+        reference = VOTE_EVENT_REFERENCES[label]
+        db.cypher_query(
+            f"""\
+            UNWIND $changes AS change
+            MATCH
+                (n:{label} {{uuid: change.uuid}})
+            SET
+                n.legacy_uuid = n.uuid,
+                n.uuid = change.new_uuid
+            WITH
+                change
+            CALL {{
+                WITH change
+                MATCH
+                    (e:VoteEvent {{{reference}: change.uuid}})
+                SET
+                    e.{reference} = change.new_uuid
+            }}
+            """,
+            {"changes": changes},
+        )
+        migrated += len(changes)
+
+    if label == "Thread":
+        # N.B. they list Threads by their previous ids
+        db.cypher_query(
+            """\
+            MATCH
+                (t:Thread)
+            WHERE
+                t.related IS NOT NULL
+            REMOVE
+                t.related, t.related_scores, t.related_at
+            """
+        )
+
+    return migrated
+
+
+def main():
+    from src.services.archive import ArchiveStore
+    from src.services.graph import build_cs, graph_init
+    from src.services.shards import shard_map, split_shard, use_shard
+
+    parser = ArgumentParser(description="Give existing nodes time-ordered ids")
+    parser.add_argument(
+        "labels",
+        nargs="*",
+        choices=ID_LABELS,
+        default=list(ID_LABELS),
+        help="the labels of the nodes to migrate (default all)",
+    )
+    parser.add_argument("--host", help="host + port (defaults to DBHOST)")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    archived = settings.archive_dir is not None and not (
+        ArchiveStore(settings.archive_dir).is_empty()
+    )
+    blockers = {
+        label: id_migration_blocker(label, bool(settings.dbshards), archived)
+        for label in args.labels
+    }
+    for label, reason in blockers.items():
+        if reason is not None:
+            print(f"{label}: cannot migrate ids, as {reason}")
+    if any(blockers.values()):
+        raise SystemExit(1)
+
+    def connection_string(host: str, dbname: str) -> str:
+        return build_cs(
+            settings.dbuser, settings.dbpass, host, dbname, settings.dbscheme
+        )
+
+    primary = connection_string(args.host or settings.dbhost, settings.dbname)
+    graph_init(primary)
+    shard_map.configure(
+        [primary]
+        + [
+            connection_string(*split_shard(shard, settings.dbname))
+            for shard in settings.dbshards
+        ]
+    )
+
+    # N.B. only Replies are migrated on a sharded graph, each on its shard
+    for label in args.labels:
+        migrated = 0
+        for index in range(shard_map.count):
+            with use_shard(index):
+                migrated += migrate_ids(label)
+        print(f"{label}: {migrated} ids migrated")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,193 @@
 # services/logs.py
 # services for writing application logs
 
+import copy
+import json
 import logging
 
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from random import random
 
-def logging_setup() -> logging.Logger:
+APPLICATION_LOGGER = "my-application"
+REQUEST_LOGGER = f"{APPLICATION_LOGGER}.requests"
+
+# identifies the request a log record was written while handling
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+# message arguments that are safe to format later, on the listener thread
+PLAIN_VALUES = (str, int, float, bool, type(None))
+
+# attributes every LogRecord has (anything else was passed via `extra`)
+STANDARD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+    "correlation_id",
+}
+
+
+class CorrelationIdFilter(logging.Filter):
+    """
+    CorrelationIdFilter
+
+    Stamps each record with the correlation id of the current request
+
+    N.B. must run on the thread that logs (i.e. before the queue), since
+         the id is held in a context variable
+
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    LocalQueueHandler
+
+    Puts records on an in-process queue as they are, so that all of the
+    formatting (of the message, and of any exception) happens on the
+    listener thread, and formatters see exc_info
+
+    N.B. QueueHandler.prepare formats the message and folds the traceback
+         into it on the logging thread, as a queue between processes
+         needs records that can be pickled. Here only messages whose
+         arguments are not plain values (which could change before the
+         listener formats them) are formatted up front.
+
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.args and not (
+            isinstance(record.args, tuple)
+            and all(isinstance(arg, PLAIN_VALUES) for arg in record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    SamplingFilter
+
+    Passes only a fraction of the records below WARNING (warnings and
+    errors are always passed)
+
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    JsonFormatter
+
+    Formats each record as a single-line JSON object, including any
+    fields passed via `extra`
+
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", "-"),
+        }
+        entry.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in STANDARD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+_listener: QueueListener | None = None
+
+
+def logging_setup(
+    level: str = "INFO",
+    levels: dict[str, str] | None = None,
+    json_format: bool = False,
+    request_sample_rate: float = 1.0,
+) -> logging.Logger:
     """
     logging_setup
 
     Returns a configured logger for the application
 
+    Records are put on a queue by the logging thread and formatted and
+    written by a background listener, so that logging costs little more
+    than a queue insertion on the request path.
+
+    Inputs:
+        level - the level of the root logger
+        levels - levels for specific loggers (e.g. {"neomodel": "WARNING"})
+        json_format - whether to write structured (JSON) logs
+        request_sample_rate - the fraction of request logs to keep
+
     """
-    logging.basicConfig(
-        format="{levelname:7} {message}", style="{", level=logging.DEBUG
-    )
+    global _listener
 
-    logger = logging.getLogger("my-application")
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler()
+    if json_format:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter("{levelname:7} [{correlation_id}] {message}", style="{")
+        )
+
+    log_queue: SimpleQueue = SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationIdFilter())
+
+    root_logger = logging.getLogger()
+    root_logger.handlers = [queue_handler]
+    root_logger.setLevel(level)
+
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    logging.getLogger(REQUEST_LOGGER).filters = [SamplingFilter(request_sample_rate)]
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+    logger = logging.getLogger(APPLICATION_LOGGER)
 
     return logger
 
 
-logger = logging_setup()
+def logging_shutdown():
+    """
+    logging_shutdown
+
+    Writes out any queued records and stops the background listener
+
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+logger = logging_setup(levels={"neomodel": "WARNING", "neo4j": "WARNING"})
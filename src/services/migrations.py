@@ -0,0 +1,289 @@
+# services/migrations.py
+# services for managing the graph schema (indexes and constraints)
+
+from argparse import ArgumentParser
+from dataclasses import dataclass
+
+from neomodel import config, db
+
+SCHEMA_NAME = "threads"
+
+# operators that indicate a query is not using an index to find its start nodes
+SCAN_OPERATORS = ("AllNodesScan", "NodeByLabelScan", "DirectedAllRelationshipsScan")
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    statements: tuple[str, ...]
+
+
+def hot_queries() -> dict[str, tuple[str, dict]]:
+    """
+    hot_queries
+
+    Returns the queries the services issue on the hot paths of the
+    controllers (built from the same constants and query builders the
+    services run), with example parameters
+
+    N.B. queries that scan by design (e.g. thread_engagement, the vote
+         roll-up, most_voted_threads for the warm-up and unpaged listings)
+         and pure writes are left out
+
+    Output:
+        queries - mapping of name to (query, example parameters)
+
+    """
+    # N.B. imported here, since the models import this module
+    from src.models import Reply, Thread
+    from src.services.archive import EXPORT_THREAD_QUERY, INACTIVE_THREADS_QUERY
+    from src.services.branches import MAX_BRANCH_DEPTH, branch_query
+    from src.services.concurrency import conditional_update_query
+    from src.services.projections import (
+        REPLY_FIELDS,
+        THREAD_FIELDS,
+        item_query,
+        threads_query,
+    )
+    from src.services.related import GET_RELATED_QUERY
+    from src.services.stats import (
+        READ_THREAD_STATS_QUERY,
+        REPLIES_CREATED_QUERY,
+        REPLY_CREATED_QUERY,
+        REPLY_DELETED_QUERY,
+        THREAD_OF_REPLY_QUERY,
+    )
+    from src.services.trending import RECENT_ACTIVITY_QUERY
+    from src.services.votes import (
+        HAS_PENDING_VOTES_QUERY,
+        USER_VOTES_QUERY,
+        vote_counts_query,
+        vote_state_query,
+    )
+
+    uuid = {"uuid": ""}
+    queries = {
+        # as issued by neomodel for User.nodes.get(uuid=...)
+        "get user by uuid": (
+            "MATCH (user:User) WHERE user.uuid = $uuid RETURN user",
+            uuid,
+        ),
+        "list threads": (
+            threads_query(THREAD_FIELDS, paged=True, before=True),
+            {"before": "", "limit": 1, "preview_chars": None},
+        ),
+        "get branch": (
+            branch_query(MAX_BRANCH_DEPTH),
+            {
+                **uuid,
+                "after_created_at": None,
+                "after_uuid": None,
+                "limit": 1,
+                "preview_chars": None,
+            },
+        ),
+        "get thread stats": (READ_THREAD_STATS_QUERY, uuid),
+        "count reply created": (REPLY_CREATED_QUERY, uuid),
+        "count replies created": (REPLIES_CREATED_QUERY, {"thread": "", "uuids": []}),
+        "count reply deleted": (REPLY_DELETED_QUERY, uuid),
+        "find thread of reply": (THREAD_OF_REPLY_QUERY, uuid),
+        "find recent activity": (RECENT_ACTIVITY_QUERY, {"since": 0.0}),
+        "get related threads": (GET_RELATED_QUERY, uuid),
+        "find pending votes": (HAS_PENDING_VOTES_QUERY, {"target": "", "user": ""}),
+        "get user votes": (USER_VOTES_QUERY, uuid),
+        "find inactive threads": (INACTIVE_THREADS_QUERY, {"before": 0.0, "limit": 1}),
+        "export thread": (EXPORT_THREAD_QUERY, uuid),
+    }
+
+    for node_class, fields in ((Thread, THREAD_FIELDS), (Reply, REPLY_FIELDS)):
+        label = node_class.__label__
+        name = label.lower()
+        queries[f"get {name}"] = (
+            item_query(node_class, fields),
+            {**uuid, "preview_chars": None},
+        )
+        queries[f"update {name}"] = (
+            conditional_update_query(label),
+            {**uuid, "expected": None, "properties": {}, "now": 0.0},
+        )
+        queries[f"count {name} votes"] = (vote_counts_query(label), uuid)
+        for kind in ("up", "down"):
+            queries[f"find {name} {kind}vote"] = (
+                vote_state_query(label, kind),
+                {**uuid, "user": "", "kind": kind},
+            )
+
+    return queries
+
+
+def applied_version() -> int:
+    """
+    applied_version
+
+    Returns the version of the most recent migration applied to the graph
+    (zero if none has been applied)
+
+    """
+    results, _ = db.cypher_query(
+        "MATCH (v:SchemaVersion {name: $name}) RETURN v.version",
+        {"name": SCHEMA_NAME},
+    )
+    return results[0][0] if results else 0
+
+
+def apply_migrations(
+    migrations: list[Migration], await_timeout: int = 300
+) -> list[int]:
+    """
+    apply_migrations
+
+    Applies any migrations newer than the version recorded in the graph,
+    waiting for the resulting indexes to come online before recording each
+    new version
+
+    N.B. every statement must be idempotent (i.e. use IF NOT EXISTS), so
+         that concurrent or interrupted runs are harmless. Schema commands
+         cannot share a transaction with data writes, so each statement is
+         run in its own (auto-commit) transaction.
+
+    Inputs:
+        migrations - the full list of migrations for the schema
+        await_timeout - seconds to wait for index population
+
+    Output:
+        applied - the versions applied by this call
+
+    """
+    current = applied_version()
+    applied = []
+
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= current:
+            continue
+
+        for statement in migration.statements:
+            db.cypher_query(statement)
+
+        db.cypher_query("CALL db.awaitIndexes($timeout)", {"timeout": await_timeout})
+        db.cypher_query(
+            """\
+            MERGE (v:SchemaVersion {name: $name})
+            SET
+                v.version = $version,
+                v.description = $description,
+                v.applied_at = datetime()
+            """,
+            {
+                "name": SCHEMA_NAME,
+                "version": migration.version,
+                "description": migration.description,
+            },
+        )
+        applied.append(migration.version)
+
+    return applied
+
+
+def find_scans(plan: dict) -> list[str]:
+    """
+    find_scans
+
+    Returns the operators in a query plan that scan all nodes (of a label)
+    rather than seeking via an index
+
+    Input:
+        plan - the (nested) plan returned in the query summary
+
+    Output:
+        scans - the offending operator types
+
+    """
+    scans = []
+    pending = [plan]
+
+    while pending:
+        operator = pending.pop()
+        operator_type = operator.get("operatorType", "")
+        if operator_type.startswith(SCAN_OPERATORS):
+            scans.append(operator_type)
+        pending.extend(operator.get("children", []))
+
+    return scans
+
+
+def check_index_usage(
+    queries: dict[str, tuple[str, dict]] | None = None
+) -> dict[str, list[str]]:
+    """
+    check_index_usage
+
+    EXPLAINs each query and reports those that would scan rather than use
+    an index
+
+    Input:
+        queries - mapping of name to (query, example parameters), by default
+                  those of hot_queries()
+
+    Output:
+        offenders - mapping of name to the scanning operators in its plan
+
+    """
+    if queries is None:
+        queries = hot_queries()
+
+    if not db.url:
+        db.set_connection(config.DATABASE_URL)
+
+    offenders = {}
+
+    with db.driver.session(database=db._database_name) as session:
+        for name, (query, params) in queries.items():
+            plan = session.run(f"EXPLAIN {query}", params).consume().plan
+            scans = find_scans(plan)
+            if scans:
+                offenders[name] = scans
+
+    return offenders
+
+
+### command line interface
+
+
+def main():
+    from src.models import MIGRATIONS
+    from src.services.config import get_settings
+    from src.services.graph import build_cs, graph_init
+
+    parser = ArgumentParser(description="Manage the graph schema")
+    parser.add_argument("command", choices=["apply", "status", "check"])
+    parser.add_argument("--host", help="host + port (defaults to DBHOST)")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    connection_string = build_cs(
+        settings.dbuser,
+        settings.dbpass,
+        args.host or settings.dbhost,
+        settings.dbname,
+        settings.dbscheme,
+    )
+    graph_init(connection_string)
+
+    if args.command == "apply":
+        applied = apply_migrations(MIGRATIONS)
+        print(f"Applied migrations: {applied or 'none (already up to date)'}")
+    elif args.command == "status":
+        latest = max(migration.version for migration in MIGRATIONS)
+        print(f"Schema version {applied_version()} (latest: {latest})")
+    else:
+        offenders = check_index_usage()
+        for name, scans in offenders.items():
+            print(f"{name}: {', '.join(scans)}")
+        if offenders:
+            raise SystemExit(1)
+        print("All hot queries use an index.")
+
+
+if __name__ == "__main__":
+    main()
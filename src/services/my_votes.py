@@ -0,0 +1,176 @@
+# services/my_votes.py
+# services for telling which of the items read a User has voted on
+
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Callable
+from threading import Lock
+from time import monotonic
+
+VOTE_KINDS = ("up", "down")
+
+
+class UserVotes:
+    """
+    UserVotes
+
+    The uuids of the items a User has upvoted, and of those they have
+    downvoted, each kept as a sorted array: looking an item up is a binary
+    search, and the state takes little more memory than the uuids themselves
+
+    """
+
+    __slots__ = ("loaded_at", "_uuids")
+
+    def __init__(self, votes: dict[str, list[str]], loaded_at: float):
+        self.loaded_at = loaded_at
+        self._uuids = {kind: sorted(set(votes.get(kind, ()))) for kind in VOTE_KINDS}
+
+    def _find(self, kind: str, uuid: str) -> tuple[list[str], int, bool]:
+        uuids = self._uuids[kind]
+        index = bisect_left(uuids, uuid)
+        return uuids, index, index < len(uuids) and uuids[index] == uuid
+
+    def has(self, kind: str, uuid: str) -> bool:
+        return self._find(kind, uuid)[2]
+
+    def set(self, kind: str, uuid: str, cast: bool):
+        uuids, index, found = self._find(kind, uuid)
+        if cast and not found:
+            uuids.insert(index, uuid)
+        elif found and not cast:
+            del uuids[index]
+
+    def of(self, uuid: str) -> dict[str, bool]:
+        """
+        of
+
+        Returns whether the User has upvoted and downvoted an item, as
+        {"up": ..., "down": ...}
+
+        """
+        return {kind: self.has(kind, uuid) for kind in VOTE_KINDS}
+
+
+class VoteStates:
+    """
+    VoteStates
+
+    The votes of the most recently active Users (up to `capacity` of them),
+    each loaded in one query when first needed and then kept current as
+    they vote, so that marking which items read a User has voted on costs
+    no queries at all
+
+    N.B. a User's state is reloaded once older than `max_age` seconds, as
+         with several workers their votes may have been recorded elsewhere
+
+    """
+
+    def __init__(self):
+        self.capacity = 10_000
+        self.max_age = 60.0
+        self._states: OrderedDict[str, UserVotes] = OrderedDict()
+        # votes recorded while a User's state is being loaded, to replay on it
+        self._loading: dict[str, list[list[tuple[str, str, bool]]]] = {}
+        self._lock = Lock()
+
+    def configure(self, capacity: int, max_age: float):
+        with self._lock:
+            self.capacity = capacity
+            self.max_age = max_age
+            while len(self._states) > capacity:
+                self._states.popitem(last=False)
+
+    def get(
+        self, user_uuid: str, load: Callable[[str], dict[str, list[str]]]
+    ) -> UserVotes:
+        """
+        get
+
+        Returns a User's votes, loading them if not already held
+
+        Inputs:
+            user_uuid - the uuid of the User
+            load - fetches a User's votes as {"up": [uuids], "down": [uuids]}
+
+        Output:
+            votes - the User's votes
+
+        """
+        now = monotonic()
+
+        with self._lock:
+            state = self._states.get(user_uuid)
+            if state is not None and now - state.loaded_at < self.max_age:
+                self._states.move_to_end(user_uuid)
+                return state
+
+            pending = []
+            self._loading.setdefault(user_uuid, []).append(pending)
+
+        try:
+            state = UserVotes(load(user_uuid), now)
+        finally:
+            with self._lock:
+                loading = self._loading[user_uuid]
+                loading.remove(pending)
+                if not loading:
+                    del self._loading[user_uuid]
+
+        with self._lock:
+            for kind, uuid, cast in pending:
+                state.set(kind, uuid, cast)
+            self._states[user_uuid] = state
+            self._states.move_to_end(user_uuid)
+            if len(self._states) > self.capacity:
+                self._states.popitem(last=False)
+
+        return state
+
+    def record(self, user_uuid: str, kind: str, uuid: str, cast: bool):
+        """
+        record
+
+        Applies a vote cast (or withdrawn) to the User's state, if held
+
+        """
+        with self._lock:
+            state = self._states.get(user_uuid)
+            if state is not None:
+                state.set(kind, uuid, cast)
+            for pending in self._loading.get(user_uuid, ()):
+                pending.append((kind, uuid, cast))
+
+    def forget(self, user_uuid: str):
+        with self._lock:
+            self._states.pop(user_uuid, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+my_votes = VoteStates()
+
+
+def with_my_votes(item: dict, votes: UserVotes) -> dict:
+    """
+    with_my_votes
+
+    Returns a copy of an item (e.g. a Thread, a Reply or a branch), with
+    whether the User has voted on it, and on each of its children, under
+    "my_vote"
+
+    N.B. items without a uuid (e.g. with a restricted selection of fields)
+         are left as they are
+
+    """
+    annotated = dict(item)
+    if "uuid" in item:
+        annotated["my_vote"] = votes.of(item["uuid"])
+    if isinstance(item.get("children"), list):
+        annotated["children"] = [
+            with_my_votes(child, votes) for child in item["children"]
+        ]
+
+    return annotated
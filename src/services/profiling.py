@@ -0,0 +1,233 @@
+# services/profiling.py
+# services for capturing the Cypher queries (and query plans) behind each request
+
+import re
+
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from time import perf_counter
+
+from neo4j.exceptions import Neo4jError
+from neomodel import db
+
+from src.services.logs import correlation_id, logger
+
+# queries matching this pattern may modify the graph, so we must not re-run them
+WRITE_CLAUSES = re.compile(
+    r"\b(CREATE|MERGE|SET|DELETE|REMOVE|DROP|FOREACH|LOAD\s+CSV|CALL)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class QueryRecord:
+    query: str
+    params: dict
+    rows: int
+    elapsed_ms: float
+    db_hits: int | None = None
+    plan_mode: str | None = None  # "PROFILE", "EXPLAIN" or None
+    plan: dict | None = None
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    correlation_id: str
+    started_at: datetime
+    elapsed_ms: float = 0.0
+    status_code: int | None = None
+    queries: list[QueryRecord] = field(default_factory=list)
+    timer_start: float = field(default_factory=perf_counter, repr=False)
+
+
+_current_profile: ContextVar[RequestProfile | None] = ContextVar(
+    "current_profile", default=None
+)
+
+
+def total_db_hits(plan: dict) -> int:
+    """
+    total_db_hits
+
+    Sums the database hits over every operator in a PROFILE plan
+
+    Input:
+        plan - the (nested) plan returned in the query summary
+
+    Output:
+        db_hits
+
+    """
+    db_hits = 0
+    pending = [plan]
+
+    while pending:
+        operator = pending.pop()
+        db_hits += operator.get("dbHits", 0)
+        pending.extend(operator.get("children", []))
+
+    return db_hits
+
+
+def capture_plan(query: str, params: dict | None) -> tuple[str, dict]:
+    """
+    capture_plan
+
+    Obtains the plan Neo4J chooses for a query. Read-only queries are
+    re-run with PROFILE (giving db hits per operator); anything that may
+    write is only EXPLAINed, so it is never executed twice.
+
+    Inputs:
+        query - the Cypher query
+        params - the query parameters
+
+    Output:
+        plan_mode - "PROFILE" or "EXPLAIN"
+        plan - the plan, as returned by the database
+
+    """
+    plan_mode = "EXPLAIN" if WRITE_CLAUSES.search(query) else "PROFILE"
+
+    # N.B. we use a separate session rather than the request's transaction,
+    #      since a failure here would otherwise roll back the request's work
+    with db.driver.session(database=db._database_name) as session:
+        summary = session.run(f"{plan_mode} {query}", params).consume()
+
+    plan = summary.profile if plan_mode == "PROFILE" else summary.plan
+
+    return plan_mode, plan
+
+
+class QueryProfiler:
+    """
+    QueryProfiler
+
+    Records every Cypher query issued while handling a request, keeping the
+    most recent requests in a bounded ring buffer. Queries slower than the
+    threshold have their plan captured with PROFILE/EXPLAIN.
+
+    """
+
+    def __init__(self, threshold_ms: float = 100.0, buffer_size: int = 100):
+        self.threshold_ms = threshold_ms
+        self.enabled = False
+        self._buffer: deque[RequestProfile] = deque(maxlen=buffer_size)
+        self._lock = Lock()
+        self._original_cypher_query = None
+
+    def configure(self, threshold_ms: float, buffer_size: int):
+        with self._lock:
+            self.threshold_ms = threshold_ms
+            self._buffer = deque(self._buffer, maxlen=buffer_size)
+
+    def install(self):
+        """
+        install
+
+        Wraps neomodel's query method so that queries are recorded. The
+        Database object is thread-local, so we patch its class rather than
+        the instance, to cover every worker thread.
+
+        """
+        if self.enabled:
+            return
+
+        database_class = type(db)
+        original = database_class.cypher_query
+        profiler = self
+
+        def profiled_cypher_query(self, query, params=None, *args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return original(self, query, params, *args, **kwargs)
+
+            start = perf_counter()
+            results, meta = original(self, query, params, *args, **kwargs)
+            elapsed_ms = (perf_counter() - start) * 1000
+
+            record = QueryRecord(
+                query=query,
+                params=dict(params or {}),
+                rows=len(results),
+                elapsed_ms=elapsed_ms,
+            )
+            if elapsed_ms >= profiler.threshold_ms:
+                try:
+                    record.plan_mode, record.plan = capture_plan(query, params)
+                except Neo4jError as exc:
+                    logger.warning(f"Could not capture query plan: {exc}")
+                if record.plan_mode == "PROFILE":
+                    record.db_hits = total_db_hits(record.plan)
+            profile.queries.append(record)
+
+            return results, meta
+
+        self._original_cypher_query = original
+        database_class.cypher_query = profiled_cypher_query
+        self.enabled = True
+
+    def uninstall(self):
+        if not self.enabled:
+            return
+        type(db).cypher_query = self._original_cypher_query
+        self.enabled = False
+
+    def start_request(self, method: str, path: str) -> RequestProfile:
+        profile = RequestProfile(
+            method=method,
+            path=path,
+            correlation_id=correlation_id.get(),
+            started_at=datetime.now(),
+        )
+        _current_profile.set(profile)
+        return profile
+
+    def finish_request(self, profile: RequestProfile, status_code: int):
+        _current_profile.set(None)
+        profile.status_code = status_code
+        profile.elapsed_ms = (perf_counter() - profile.timer_start) * 1000
+        if profile.queries:
+            with self._lock:
+                self._buffer.append(profile)
+
+    def recent(self) -> list[RequestProfile]:
+        """
+        recent
+
+        Returns the buffered request profiles, most recent first
+
+        """
+        with self._lock:
+            return list(reversed(self._buffer))
+
+    def captured_queries(self) -> dict[str, tuple[str, dict]]:
+        """
+        captured_queries
+
+        Returns each distinct query recorded in the buffered request
+        profiles, with the parameters of its most recent run (e.g. to check
+        their index usage)
+
+        Output:
+            queries - mapping of the query (with its whitespace collapsed)
+                      to (query, parameters)
+
+        """
+        queries = {}
+        for profile in reversed(self.recent()):
+            for record in profile.queries:
+                queries[" ".join(record.query.split())] = (record.query, record.params)
+
+        return queries
+
+    def clear(self):
+        with self._lock:
+            self._buffer.clear()
+
+
+profiler = QueryProfiler()
@@ -0,0 +1,246 @@
+# services/projections.py
+# services for reading only the requested fields of nodes from the graph
+
+from neomodel import db
+
+from src.models import Reply, Thread, User
+
+# the fields that can be requested, per type of node
+USER_FIELDS = ("uuid", "name", "created_at")
+REPLY_PROPERTIES = ("uuid", "body", "created_at", "updated_at", "version")
+THREAD_PROPERTIES = ("uuid", "title", "body", "created_at", "updated_at", "version")
+RELATED_FIELDS = ("author", "children", "upvotes", "downvotes")
+REPLY_FIELDS = REPLY_PROPERTIES + RELATED_FIELDS
+THREAD_FIELDS = THREAD_PROPERTIES + RELATED_FIELDS
+
+# what is needed to report a Thread's maintained statistics
+THREAD_COUNTERS = (
+    "uuid",
+    "updated_at",
+    "reply_count",
+    "participant_count",
+    "max_depth",
+    "last_activity_at",
+)
+
+
+class UnknownFields(ValueError):
+    """
+    UnknownFields
+
+    Raised when a field selection names fields that do not exist
+
+    """
+
+    def __init__(self, unknown: list[str], available: tuple[str, ...]):
+        self.unknown = unknown
+        self.available = available
+        super().__init__(
+            f"Unknown fields {unknown}; available fields are {list(available)}"
+        )
+
+
+def select_fields(fields: str | None, available: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    select_fields
+
+    Parses a comma-separated field selection
+
+    Inputs:
+        fields - e.g. "uuid,title" (None selects every available field)
+        available - the fields that can be selected
+
+    Output:
+        selected - the requested fields, in order, without duplicates
+
+    """
+    if fields is None:
+        return available
+
+    selected = tuple(
+        dict.fromkeys(field.strip() for field in fields.split(",") if field.strip())
+    )
+
+    unknown = [field for field in selected if field not in available]
+    if unknown:
+        raise UnknownFields(unknown, available)
+
+    return selected
+
+
+def map_projection(var: str, fields: tuple[str, ...]) -> str:
+    """
+    map_projection
+
+    Builds the Cypher map projection that reads the given fields of the
+    node bound to var (and nothing else)
+
+    N.B. bodies are truncated to $preview_chars characters if that is set
+
+    """
+    entries = []
+
+    for field in fields:
+        if field == "body":
+            entries.append(
+                f"body: CASE WHEN $preview_chars IS NULL THEN {var}.body "
+                f"ELSE left({var}.body, $preview_chars) END"
+            )
+        elif field == "version":
+            entries.append(f"version: coalesce({var}.version, 0)")
+        elif field == "author":
+            user = map_projection("author", USER_FIELDS)
+            entries.append(
+                f"author: head([({var})-[:AUTHORED_BY]->(author:User) | {user}])"
+            )
+        elif field == "children":
+            child = map_projection("child", REPLY_PROPERTIES)
+            entries.append(
+                f"children: [(child:Reply)-[:IN_REPLY_TO]->({var}) | {child}]"
+            )
+        elif field == "upvotes":
+            entries.append(f"upvotes: COUNT {{ ({var})-[:UPVOTED_BY]->() }}")
+        elif field == "downvotes":
+            entries.append(f"downvotes: COUNT {{ ({var})-[:DOWNVOTED_BY]->() }}")
+        elif field == "counters":
+            entries.append(f"counters: {map_projection(var, THREAD_COUNTERS)}")
+        else:
+            entries.append(f".{field}")
+
+    return f"{var} {{{', '.join(entries)}}}"
+
+
+def inflate_fields(node_class: type, data: dict) -> dict:
+    """
+    inflate_fields
+
+    Converts the raw property values of a projected node (e.g. timestamps
+    stored as floats) to their Python types, in place
+
+    Inputs:
+        node_class - the class of the projected node
+        data - the projected fields
+
+    Output:
+        data
+
+    """
+    properties = node_class.defined_properties(rels=False, aliases=False)
+
+    for field, value in data.items():
+        if field in properties and value is not None:
+            data[field] = properties[field].inflate(value)
+
+    if data.get("author") is not None:
+        inflate_fields(User, data["author"])
+
+    for child in data.get("children", []):
+        inflate_fields(Reply, child)
+
+    if data.get("counters") is not None:
+        inflate_fields(node_class, data["counters"])
+
+    return data
+
+
+def item_query(node_class: type[Thread] | type[Reply], fields: tuple[str, ...]) -> str:
+    """
+    item_query
+
+    Returns the query fetch_item runs to read fields of a Thread or Reply
+
+    """
+    return f"""\
+        MATCH
+            (n:{node_class.__label__} {{uuid: $uuid}})
+        RETURN
+            {map_projection("n", fields)}
+        """
+
+
+def threads_query(
+    fields: tuple[str, ...], paged: bool = False, before: bool = False
+) -> str:
+    """
+    threads_query
+
+    Returns the query fetch_threads runs to read fields of all Threads or
+    (if paged) of a page of them, optionally before a given uuid
+
+    """
+    query = "MATCH (t:Thread)"
+    if before:
+        query += " WHERE t.uuid < $before"
+    query += f" RETURN {map_projection('t', fields)}"
+    if paged:
+        query += " ORDER BY t.uuid DESC LIMIT $limit"
+
+    return query
+
+
+def fetch_item(
+    node_class: type[Thread] | type[Reply],
+    uuid: str,
+    fields: tuple[str, ...],
+    preview_chars: int | None = None,
+) -> dict:
+    """
+    fetch_item
+
+    Reads the requested fields of a Thread or Reply (including its author,
+    direct Replies and vote counts, if requested) in a single query
+
+    Inputs:
+        node_class - Thread or Reply
+        uuid - the uuid of the node
+        fields - the fields to read
+        preview_chars - if set, bodies are truncated to this many characters
+
+    Output:
+        item - the requested fields
+
+    """
+    results, _ = db.cypher_query(
+        item_query(node_class, fields), {"uuid": uuid, "preview_chars": preview_chars}
+    )
+
+    if not results:
+        raise node_class.DoesNotExist(repr({"uuid": uuid}))
+
+    return inflate_fields(node_class, results[0][0])
+
+
+def fetch_threads(
+    fields: tuple[str, ...],
+    preview_chars: int | None = None,
+    limit: int | None = None,
+    before: str | None = None,
+    include_counters: bool = False,
+) -> list[dict]:
+    """
+    fetch_threads
+
+    Reads the requested fields of all Threads, or of a page of Threads in
+    descending order of UUID
+
+    Inputs:
+        fields - the fields to read
+        preview_chars - if set, bodies are truncated to this many characters
+        limit - if set, the size of the page
+        before - if set, only Threads with a lower UUID are returned
+        include_counters - whether to read the Threads' statistics counters
+                           (returned as a map under "counters")
+
+    Output:
+        threads - the requested fields of each Thread
+
+    """
+    if include_counters:
+        fields += ("counters",)
+
+    results, _ = db.cypher_query(
+        threads_query(fields, paged=limit is not None, before=before is not None),
+        {"preview_chars": preview_chars, "limit": limit, "before": before},
+    )
+
+    return [inflate_fields(Thread, row[0]) for row in results]
@@ -0,0 +1,394 @@
+# services/related.py
+# services for finding related Threads from the Users they have in common
+
+import heapq
+
+from collections import defaultdict
+from math import log2, sqrt
+from threading import Lock
+from time import time
+
+from neomodel import db
+
+from src.models import Thread
+
+# the Users engaged with each Thread (of those matched as t): its author, its
+# upvoters, and the authors and upvoters of the Replies in it
+ENGAGED_USERS = """\
+    CALL {
+        WITH t
+        MATCH (t)-[:AUTHORED_BY|UPVOTED_BY]->(u:User)
+        RETURN u.uuid AS user
+        UNION
+        WITH t
+        MATCH (t)<-[:IN_REPLY_TO*]-(:Reply)-[:AUTHORED_BY|UPVOTED_BY]->(u:User)
+        RETURN u.uuid AS user
+    }
+    RETURN
+        t.uuid, collect(user)
+    """
+
+ENGAGEMENT_QUERY = f"""\
+    MATCH
+        (t:Thread)
+    {ENGAGED_USERS}
+    """
+
+# as ENGAGEMENT_QUERY, for the Threads in $threads only
+THREADS_ENGAGEMENT_QUERY = f"""\
+    MATCH
+        (t:Thread)
+    WHERE
+        t.uuid IN $threads
+    {ENGAGED_USERS}
+    """
+
+# the Threads each User in $users is engaged with (the inverse of the above)
+USER_ENGAGEMENT_QUERY = """\
+    MATCH
+        (u:User)
+    WHERE
+        u.uuid IN $users
+    CALL {
+        WITH u
+        MATCH (u)<-[:AUTHORED_BY|UPVOTED_BY]-(t:Thread)
+        RETURN t.uuid AS thread
+        UNION
+        WITH u
+        MATCH (u)<-[:AUTHORED_BY|UPVOTED_BY]-(:Reply)-[:IN_REPLY_TO*]->(t:Thread)
+        RETURN t.uuid AS thread
+    }
+    RETURN
+        u.uuid, collect(thread)
+    """
+
+
+def thread_engagement(threads: set[str] | None = None) -> dict[str, list[str]]:
+    """
+    thread_engagement
+
+    Finds the Users engaged with each Thread (as author or upvoter of the
+    Thread or of any Reply in it)
+
+    Input:
+        threads - the uuids of the Threads to look at (default all)
+
+    Output:
+        engagement - the uuids of the Users engaged, by Thread uuid
+
+    """
+    if threads is None:
+        results, _ = db.cypher_query(ENGAGEMENT_QUERY)
+    else:
+        results, _ = db.cypher_query(
+            THREADS_ENGAGEMENT_QUERY, {"threads": list(threads)}
+        )
+    return {thread: users for thread, users in results}
+
+
+def user_engagement(users: set[str]) -> dict[str, list[str]]:
+    """
+    user_engagement
+
+    Finds the Threads each of a set of Users is engaged with
+
+    Input:
+        users - the uuids of the Users
+
+    Output:
+        engagement - the uuids of the Threads engaged with, by User uuid
+
+    """
+    results, _ = db.cypher_query(USER_ENGAGEMENT_QUERY, {"users": list(users)})
+    return {user: threads for user, threads in results}
+
+
+def store_related(related: dict[str, list[tuple[str, float]]]):
+    """
+    store_related
+
+    Stores the related Threads found for each Thread on it, as parallel
+    arrays of uuids and scores (best first)
+
+    Input:
+        related - the related Threads and their scores, by Thread uuid
+
+    """
+    query = """\
+        UNWIND $rows AS row
+        MATCH
+            (t:Thread {uuid: row.uuid})
+        SET
+            t.related = row.related,
+            t.related_scores = row.scores,
+            t.related_at = $at
+        """
+    rows = [
+        {
+            "uuid": uuid,
+            "related": [other for other, _ in neighbours],
+            "scores": [score for _, score in neighbours],
+        }
+        for uuid, neighbours in related.items()
+    ]
+    db.cypher_query(query, {"rows": rows, "at": time()})
+
+
+# the related Threads stored on a Thread
+STORED_RELATED_QUERY = """\
+    MATCH
+        (t:Thread {uuid: $uuid})
+    RETURN
+        coalesce(t.related, []), coalesce(t.related_scores, [])
+    """
+
+# as STORED_RELATED_QUERY, leaving out the Threads deleted since
+GET_RELATED_QUERY = """\
+    MATCH
+        (t:Thread {uuid: $uuid})
+    OPTIONAL MATCH
+        (o:Thread)
+    WHERE
+        o.uuid IN t.related
+    WITH
+        t, collect(o.uuid) AS present
+    WITH
+        [
+            i IN range(0, size(coalesce(t.related, [])) - 1)
+            WHERE t.related[i] IN present
+        ] AS kept, t
+    RETURN
+        [i IN kept | t.related[i]], [i IN kept | t.related_scores[i]]
+    """
+
+# those of the Threads in $uuids that exist
+EXISTING_THREADS_QUERY = """\
+    MATCH
+        (t:Thread)
+    WHERE
+        t.uuid IN $uuids
+    RETURN
+        t.uuid
+    """
+
+
+def get_related(uuid: str, present_only: bool = True) -> list[tuple[str, float]]:
+    """
+    get_related
+
+    Reads the related Threads stored on a Thread (best first)
+
+    Inputs:
+        uuid - the uuid of the Thread
+        present_only - whether to leave out related Threads not in the
+                       database (e.g. deleted since they were stored)
+
+    Output:
+        related - (uuid, score) of the related Threads
+
+    """
+    query = GET_RELATED_QUERY if present_only else STORED_RELATED_QUERY
+    results, _ = db.cypher_query(query, {"uuid": uuid})
+    if not results:
+        raise Thread.DoesNotExist(repr({"uuid": uuid}))
+
+    related, scores = results[0]
+    return list(zip(related, scores))
+
+
+def existing_threads(uuids: list[str]) -> set[str]:
+    """
+    existing_threads
+
+    Returns those of a list of Threads that are in the database
+
+    """
+    results, _ = db.cypher_query(EXISTING_THREADS_QUERY, {"uuids": uuids})
+    return {row[0] for row in results}
+
+
+def compute_related(
+    engagement: dict[str, list[str]],
+    k: int,
+    threads: set[str] | None = None,
+    max_user_threads: int = 1000,
+    thread_counts: dict[str, int] | None = None,
+) -> dict[str, list[tuple[str, float]]]:
+    """
+    compute_related
+
+    Scores how related Threads are by the cosine similarity of the sets of
+    Users engaged with them, each User weighted by 1 / log2(1 + n), where
+    n is the number of Threads they are engaged with (so that a User who
+    engages with everything says little about any pair of Threads)
+
+    The engagement matrix is sparse, so rather than comparing every pair of
+    Threads, each Thread's row is multiplied by the (transposed) matrix via
+    an index of the Threads of each User: only Threads sharing a User with
+    it are ever scored.
+
+    N.B. Users engaged with more than `max_user_threads` Threads (e.g.
+         bots) are left out, as each adds n^2 pairs to score
+
+    Inputs:
+        engagement - the uuids of the Users engaged with each Thread
+        k - the number of related Threads to keep per Thread
+        threads - the Threads to find related Threads for (default all)
+        max_user_threads - see above
+        thread_counts - the number of Threads each User is engaged with, if
+                        engagement is not given for all of them (default
+                        counted in engagement)
+
+    Output:
+        related - the k most related Threads and their scores, best first,
+                  by Thread uuid
+
+    """
+    threads_of = defaultdict(list)
+    for thread, users in engagement.items():
+        for user in set(users):
+            threads_of[user].append(thread)
+
+    counts = {user: len(user_threads) for user, user_threads in threads_of.items()}
+    counts.update(thread_counts or {})
+
+    weights = {
+        user: 1 / log2(1 + count)
+        for user, count in counts.items()
+        if count <= max_user_threads and user in threads_of
+    }
+
+    norms = {
+        thread: sqrt(sum(weights.get(user, 0.0) ** 2 for user in set(users)))
+        for thread, users in engagement.items()
+    }
+
+    related = {}
+    for thread in engagement if threads is None else threads & engagement.keys():
+        if not norms[thread]:
+            related[thread] = []
+            continue
+
+        overlap = defaultdict(float)
+        for user in set(engagement[thread]):
+            weight = weights.get(user)
+            if weight is None:
+                continue
+            for other in threads_of[user]:
+                if other != thread:
+                    overlap[other] += weight * weight
+
+        related[thread] = [
+            (other, round(score / (norms[thread] * norms[other]), 6))
+            for score, other in heapq.nlargest(
+                k, ((score, other) for other, score in overlap.items())
+            )
+        ]
+
+    return related
+
+
+def _union(groups) -> set[str]:
+    return {member for group in groups for member in group}
+
+
+def neighbourhood(
+    repository, changed: set[str]
+) -> tuple[dict[str, list[str]], set[str], dict[str, int]]:
+    """
+    neighbourhood
+
+    Loads the engagement needed to recompute the related Threads affected
+    by a change in some Threads' engagement, without loading every
+    Thread's: that of the affected Threads (those changed, and every Thread
+    sharing a User with them), of every Thread sharing a User with those
+    (the candidates for being related to them), and the number of Threads
+    each User among them is engaged with (which weights them)
+
+    Inputs:
+        repository - the repository the Threads are in
+        changed - the uuids of the Threads whose engagement has changed
+
+    Outputs:
+        engagement - the Users engaged, by Thread uuid
+        affected - the uuids of the Threads to recompute
+        thread_counts - the number of Threads engaged with, by User uuid
+
+    """
+    users = _union(repository.thread_engagement(changed).values())
+    threads_of = repository.user_engagement(users)
+    affected = changed | _union(threads_of.values())
+
+    engagement = repository.thread_engagement(affected)
+    users = _union(engagement.values())
+    threads_of.update(repository.user_engagement(users - threads_of.keys()))
+
+    candidates = _union(threads_of[user] for user in users if user in threads_of)
+    engagement.update(repository.thread_engagement(candidates - engagement.keys()))
+    users = _union(engagement.values())
+    threads_of.update(repository.user_engagement(users - threads_of.keys()))
+
+    thread_counts = {user: len(threads) for user, threads in threads_of.items()}
+
+    return engagement, affected & engagement.keys(), thread_counts
+
+
+class RelatedThreadsJob:
+    """
+    RelatedThreadsJob
+
+    Recomputes and stores the related Threads of every Thread (a full run),
+    or only of those affected by activity since the last run (incremental)
+
+    N.B. incremental runs only notice upvotes and Replies (as recorded in
+         recent activity); run a full refresh now and then to account for
+         withdrawn votes and new Threads. Deleted Threads are left out when
+         related Threads are read.
+
+    """
+
+    def __init__(self):
+        self.last_run: float | None = None
+        self._lock = Lock()
+
+    def run(self, repository, k: int, max_user_threads: int, full: bool = False) -> int:
+        """
+        run
+
+        Refreshes the related Threads stored on Threads
+
+        Inputs:
+            repository - the repository the Threads are in
+            k - the number of related Threads to keep per Thread
+            max_user_threads - see compute_related
+            full - whether to refresh every Thread, rather than only those
+                   affected since the last run (N.B. the first run is full)
+
+        Output:
+            n_threads - the number of Threads refreshed
+
+        """
+        with self._lock:
+            started = time()
+
+            if full or self.last_run is None:
+                engagement = repository.thread_engagement()
+                threads, thread_counts = None, None
+            else:
+                changed = {
+                    thread for thread, _, _ in repository.recent_activity(self.last_run)
+                }
+                engagement, threads, thread_counts = neighbourhood(repository, changed)
+
+            related = compute_related(
+                engagement, k, threads, max_user_threads, thread_counts
+            )
+            if related:
+                repository.store_related(related)
+
+            self.last_run = started
+
+            return len(related)
+
+
+related_threads = RelatedThreadsJob()
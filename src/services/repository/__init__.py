@@ -0,0 +1,43 @@
+# services/repository/__init__.py
+# selects the storage backend behind the API
+
+from functools import lru_cache
+
+from src.services.archive import ArchiveStore
+from src.services.config import get_settings
+from src.services.repository.archiving import ArchivingRepository  # noqa: F401
+from src.services.repository.base import ItemClass, Repository  # noqa: F401
+from src.services.repository.graph import Neo4jRepository
+from src.services.repository.memory import MemoryRepository
+from src.services.repository.sharded import ShardedRepository
+from src.services.shards import shard_map
+
+
+@lru_cache()
+def get_repository() -> Repository:
+    """
+    get_repository
+
+    Returns the repository for the backend set by REPOSITORY_BACKEND (with
+    Threads spread over the databases in DBSHARDS, if any, and inactive
+    Threads archived to ARCHIVE_DIR, if set)
+
+    """
+    settings = get_settings()
+
+    if settings.repository_backend == "memory":
+        repository = MemoryRepository()
+    elif settings.dbshards:
+        shards = [Neo4jRepository(shard) for shard in range(len(settings.dbshards) + 1)]
+        repository = ShardedRepository(shards, shard_map)
+    else:
+        repository = Neo4jRepository()
+
+    if settings.archive_dir is not None:
+        return ArchivingRepository(
+            repository,
+            ArchiveStore(settings.archive_dir),
+            cache_size=settings.archive_cache_size,
+        )
+
+    return repository
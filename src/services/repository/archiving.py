@@ -0,0 +1,339 @@
+# services/repository/archiving.py
+# a repository serving inactive Threads from archive files rather than the graph
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Lock
+
+from neomodel.exceptions import UniqueProperty
+
+from src.models import Reply, Thread
+from src.schemas import ThreadStats
+from src.services.archive import ArchiveStore
+from src.services.repository.base import ItemClass, Repository
+from src.services.repository.memory import MemoryRepository
+
+
+class ArchivingRepository(Repository):
+    """
+    ArchivingRepository
+
+    Adds cold storage to another repository: archive moves Threads in which
+    nothing has happened for a while out of it, into compressed archive
+    segments (see services/archive.py).
+
+    Reads of an archived Thread or Reply are served from its segment, via
+    an in-memory copy of its Thread (the `cache_size` most recently read
+    are kept). Replying to, editing, deleting or voting on anything in an
+    archived Thread first brings the whole Thread back.
+
+    Archived Threads keep their titles: no other Thread can be given one,
+    so that bringing an archived Thread back never clashes.
+
+    N.B. archived Threads are not listed by list_threads, and votes in them
+         are not returned by user_votes
+
+    """
+
+    def __init__(self, inner: Repository, store: ArchiveStore, cache_size: int = 64):
+        self.inner = inner
+        self.store = store
+        self.cache_size = cache_size
+        self._views: OrderedDict[str, MemoryRepository] = OrderedDict()
+        self._lock = Lock()
+
+    ### archived Threads
+
+    def _view(self, node_class: ItemClass, uuid: str) -> MemoryRepository | None:
+        # the archived Thread holding an item, loaded into memory
+        thread = self.store.thread_of(node_class, uuid)
+        if thread is None:
+            return None
+
+        with self._lock:
+            if thread in self._views:
+                self._views.move_to_end(thread)
+                return self._views[thread]
+
+        tree = self.store.load(thread)
+        if tree is None:
+            return None
+
+        view = MemoryRepository()
+        for user in tree["users"]:
+            view.store_user(
+                {
+                    **user,
+                    "created_at": datetime.fromtimestamp(
+                        user["created_at"], timezone.utc
+                    ),
+                }
+            )
+        view.import_thread(tree)
+
+        with self._lock:
+            self._views[thread] = view
+            if len(self._views) > self.cache_size:
+                self._views.popitem(last=False)
+
+        return view
+
+    def _read(self, node_class: ItemClass, uuid: str, method: str, *args):
+        # reads from the live repository, falling back on the archive
+        try:
+            return getattr(self.inner, method)(*args)
+        except node_class.DoesNotExist:
+            view = self._view(node_class, uuid)
+            if view is None:
+                raise
+            return getattr(view, method)(*args)
+
+    def _rehydrate(self, node_class: ItemClass, uuid: str):
+        # brings the archived Thread an item belongs to (if any) back
+        if self.store.thread_of(node_class, uuid) is None:
+            return
+
+        with self.store.exclusive():
+            self.store.refresh()
+            thread = self.store.thread_of(node_class, uuid)
+            if thread is None:
+                return  # brought back by another worker meanwhile
+
+            try:
+                self.inner.get_item(Thread, thread, ("uuid",))
+            except Thread.DoesNotExist:
+                self.inner.import_thread(self.store.load(thread))
+            self.store.tombstone(thread)
+
+        with self._lock:
+            self._views.pop(thread, None)
+
+    def _check_titles(self, titles: list[str], force: bool = False):
+        # raises UniqueProperty if an archived Thread has one of the titles
+        for title in titles:
+            if self.store.thread_titled(title, force) is not None:
+                raise UniqueProperty(
+                    f"Node already exists with label `Thread` and property "
+                    f"`title` = {title!r}"
+                )
+
+    def _claim_titles(self, titles: list[str], uuids: list[str]):
+        # N.B. a Thread archived between the first check and the creation of
+        #      the new Threads frees its title in the graph, so the titles
+        #      are checked again (against the latest segments) afterwards
+        try:
+            self._check_titles(titles, force=True)
+        except UniqueProperty:
+            for uuid in uuids:
+                self.inner.delete_item(Thread, uuid)
+            raise
+
+    def archive(self, before: float, limit: int = 1000) -> list[str]:
+        """
+        archive
+
+        Moves Threads with no activity since a given time into a new archive
+        segment
+
+        Inputs:
+            before - seconds since the epoch
+            limit - the most Threads to archive
+
+        Output:
+            uuids - of the Threads archived
+
+        N.B. the segment is written before the Threads are deleted, and a
+             Thread that has become active in between is kept (and its
+             archived copy ignored)
+
+        """
+        with self.store.exclusive():
+            uuids = self.inner.inactive_threads(before, limit)
+            if not uuids:
+                return []
+
+            self.store.write([self.inner.export_thread(uuid) for uuid in uuids])
+
+            archived = []
+            for uuid in uuids:
+                if self.inner.purge_thread(uuid, before):
+                    archived.append(uuid)
+                else:
+                    self.store.tombstone(uuid)
+
+        return archived
+
+    ### users
+
+    def create_user(self, name: str) -> dict:
+        return self.inner.create_user(name)
+
+    def store_user(self, user: dict):
+        self.inner.store_user(user)
+
+    def list_users(self) -> list[dict]:
+        return self.inner.list_users()
+
+    def get_user(self, uuid: str) -> dict:
+        return self.inner.get_user(uuid)
+
+    def delete_user(self, uuid: str):
+        self.inner.delete_user(uuid)
+
+    ### threads and replies
+
+    def create_thread(
+        self, user_uuid: str, title: str, body: str, uuid: str | None = None
+    ) -> dict:
+        self._check_titles([title])
+        thread = self.inner.create_thread(user_uuid, title, body, uuid)
+        self._claim_titles([title], [thread["uuid"]])
+        return thread
+
+    def create_reply(
+        self,
+        user_uuid: str,
+        parent_class: ItemClass,
+        parent_uuid: str,
+        body: str,
+    ) -> dict:
+        self._rehydrate(parent_class, parent_uuid)
+        return self.inner.create_reply(user_uuid, parent_class, parent_uuid, body)
+
+    def create_threads(self, threads: list[dict]) -> list[str]:
+        titles = [thread["title"] for thread in threads]
+        self._check_titles(titles)
+        uuids = self.inner.create_threads(threads)
+        self._claim_titles(titles, uuids)
+        return uuids
+
+    def create_replies(self, thread_uuid: str, replies: list[dict]) -> list[str]:
+        self._rehydrate(Thread, thread_uuid)
+        return self.inner.create_replies(thread_uuid, replies)
+
+    def list_threads(
+        self,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+        limit: int | None = None,
+        before: str | None = None,
+        include_stats: bool = False,
+    ) -> list[dict]:
+        return self.inner.list_threads(
+            fields, preview_chars, limit, before, include_stats
+        )
+
+    def get_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+    ) -> dict:
+        return self._read(
+            node_class, uuid, "get_item", node_class, uuid, fields, preview_chars
+        )
+
+    def update_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        properties: dict,
+        expected_version: int | None,
+    ) -> dict:
+        self._rehydrate(node_class, uuid)
+        if node_class is Thread and properties.get("title") is not None:
+            self._check_titles([properties["title"]])
+        return self.inner.update_item(node_class, uuid, properties, expected_version)
+
+    def delete_item(self, node_class: ItemClass, uuid: str):
+        self._rehydrate(node_class, uuid)
+        self.inner.delete_item(node_class, uuid)
+
+    def get_branch(
+        self,
+        uuid: str,
+        depth: int,
+        limit: int,
+        after: tuple[float, str] | None = None,
+        preview_chars: int | None = None,
+    ) -> dict:
+        return self._read(
+            Reply, uuid, "get_branch", uuid, depth, limit, after, preview_chars
+        )
+
+    def get_thread_stats(self, uuid: str, exact: bool = False) -> ThreadStats:
+        return self._read(Thread, uuid, "get_thread_stats", uuid, exact)
+
+    ### votes
+
+    def vote(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        user_uuid: str,
+        kind: str,
+        cast: bool,
+    ) -> dict:
+        self._rehydrate(node_class, uuid)
+        return self.inner.vote(node_class, uuid, user_uuid, kind, cast)
+
+    def most_voted_threads(self, limit: int) -> list[tuple[str, int]]:
+        return self.inner.most_voted_threads(limit)
+
+    def user_votes(self, user_uuid: str) -> dict[str, list[str]]:
+        return self.inner.user_votes(user_uuid)
+
+    ### activity
+
+    def recent_activity(self, since: float) -> list[tuple[str, str, float]]:
+        return self.inner.recent_activity(since)
+
+    ### related threads
+
+    def thread_engagement(
+        self, threads: set[str] | None = None
+    ) -> dict[str, list[str]]:
+        return self.inner.thread_engagement(threads)
+
+    def user_engagement(self, users: set[str]) -> dict[str, list[str]]:
+        return self.inner.user_engagement(users)
+
+    def store_related(self, related: dict[str, list[tuple[str, float]]]):
+        self.inner.store_related(related)
+
+    def get_related(
+        self, uuid: str, present_only: bool = True
+    ) -> list[tuple[str, float]]:
+        related = self._read(Thread, uuid, "get_related", uuid, False)
+        if not present_only:
+            return related
+
+        present = self.existing_threads([other for other, _ in related])
+        return [(other, score) for other, score in related if other in present]
+
+    def existing_threads(self, uuids: list[str]) -> set[str]:
+        # N.B. archived Threads can still be read, so they count as present
+        return self.inner.existing_threads(uuids) | {
+            uuid for uuid in uuids if self.store.thread_of(Thread, uuid) is not None
+        }
+
+    ### archiving
+
+    def inactive_threads(self, before: float, limit: int) -> list[str]:
+        return self.inner.inactive_threads(before, limit)
+
+    def export_thread(self, uuid: str) -> dict:
+        self._rehydrate(Thread, uuid)
+        return self.inner.export_thread(uuid)
+
+    def import_thread(self, tree: dict):
+        self.inner.import_thread(tree)
+
+    def purge_thread(self, uuid: str, before: float) -> bool:
+        return self.inner.purge_thread(uuid, before)
+
+    ### administration
+
+    def is_empty(self) -> bool:
+        return self.inner.is_empty() and self.store.is_empty()
@@ -0,0 +1,512 @@
+# services/repository/base.py
+# defines the operations the controllers perform on stored Users, Threads and Replies
+
+from abc import ABC, abstractmethod
+
+from src.models import Reply, Thread
+from src.schemas import ThreadStats
+
+# nodes that can be read, edited and voted on
+ItemClass = type[Thread] | type[Reply]
+
+
+class Repository(ABC):
+    """
+    Repository
+
+    The storage operations behind the API. Items are exchanged as plain
+    dictionaries of fields (as produced by the projections in
+    services/projections.py), so that any backend can serve them.
+
+    Missing nodes are reported by raising the DoesNotExist exception of
+    their model class, duplicate names and titles by raising UniqueProperty
+    and stale edits by raising VersionConflict, whatever the backend.
+
+    """
+
+    ### users
+
+    @abstractmethod
+    def create_user(self, name: str) -> dict:
+        """
+        create_user
+
+        Creates a User
+
+        Input:
+            name - the (unique) name of the User
+
+        Output:
+            user - uuid, name and created_at
+
+        """
+
+    @abstractmethod
+    def store_user(self, user: dict):
+        """
+        store_user
+
+        Stores a copy of a User created elsewhere (e.g. on another shard),
+        keeping its uuid; storing the same User again has no effect
+
+        Input:
+            user - uuid, name and created_at
+
+        """
+
+    @abstractmethod
+    def list_users(self) -> list[dict]:
+        """
+        list_users
+
+        Returns every User
+
+        """
+
+    @abstractmethod
+    def get_user(self, uuid: str) -> dict:
+        """
+        get_user
+
+        Returns a User by uuid
+
+        """
+
+    @abstractmethod
+    def delete_user(self, uuid: str):
+        """
+        delete_user
+
+        Deletes a User (the items they wrote remain, without an author)
+
+        """
+
+    ### threads and replies
+
+    @abstractmethod
+    def create_thread(
+        self, user_uuid: str, title: str, body: str, uuid: str | None = None
+    ) -> dict:
+        """
+        create_thread
+
+        Creates a Thread
+
+        Inputs:
+            user_uuid - the uuid of the author
+            title - the (unique) title of the Thread
+            body - the text of the Thread
+            uuid - if set, the uuid to give the Thread (instead of a new one)
+
+        Output:
+            thread - every field of the new Thread (see THREAD_FIELDS)
+
+        """
+
+    @abstractmethod
+    def create_reply(
+        self,
+        user_uuid: str,
+        parent_class: ItemClass,
+        parent_uuid: str,
+        body: str,
+    ) -> dict:
+        """
+        create_reply
+
+        Creates a Reply to a Thread (a top level Reply) or to another Reply
+        (a nested Reply), and counts it into the Thread's statistics
+
+        Inputs:
+            user_uuid - the uuid of the author
+            parent_class - Thread or Reply
+            parent_uuid - the uuid of the item replied to
+            body - the text of the Reply
+
+        Output:
+            reply - every field of the new Reply (see REPLY_FIELDS), plus the
+                    uuid of its Thread under "thread"
+
+        """
+
+    @abstractmethod
+    def create_threads(self, threads: list[dict]) -> list[str]:
+        """
+        create_threads
+
+        Creates a batch of Threads, all or none of them
+
+        Input:
+            threads - dicts with user_id, title, body and (optionally) the
+                      uuid to give the Thread
+
+        Output:
+            uuids - the uuids of the new Threads, in the order submitted
+
+        """
+
+    @abstractmethod
+    def create_replies(self, thread_uuid: str, replies: list[dict]) -> list[str]:
+        """
+        create_replies
+
+        Creates a batch of Replies in a Thread, all or none of them. Replies
+        can reply to earlier Replies in the batch by their temporary ids.
+
+        Inputs:
+            thread_uuid - the uuid of the Thread
+            replies - dicts with user_id, body, temp_id (optional) and parent
+                      (see services/batches.py)
+
+        Output:
+            uuids - the uuids of the new Replies, in the order submitted
+
+        """
+
+    @abstractmethod
+    def list_threads(
+        self,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+        limit: int | None = None,
+        before: str | None = None,
+        include_stats: bool = False,
+    ) -> list[dict]:
+        """
+        list_threads
+
+        Returns the requested fields of all Threads, or of a page of Threads
+        in descending order of UUID
+
+        Inputs:
+            fields - the fields to read
+            preview_chars - if set, bodies are truncated to this many characters
+            limit - if set, the size of the page
+            before - if set, only Threads with a lower UUID are returned
+            include_stats - whether to include each Thread's statistics
+                            (as a ThreadStats under "stats")
+
+        Output:
+            threads - the requested fields of each Thread
+
+        """
+
+    @abstractmethod
+    def get_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+    ) -> dict:
+        """
+        get_item
+
+        Returns the requested fields of a Thread or Reply, including its
+        author, direct Replies and vote counts if requested
+
+        Inputs:
+            node_class - Thread or Reply
+            uuid - the uuid of the item
+            fields - the fields to read
+            preview_chars - if set, bodies are truncated to this many characters
+
+        Output:
+            item - the requested fields
+
+        """
+
+    @abstractmethod
+    def update_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        properties: dict,
+        expected_version: int | None,
+    ) -> dict:
+        """
+        update_item
+
+        Edits a Thread or Reply, provided its version still matches the
+        expected one, incrementing its version and setting updated_at
+
+        Inputs:
+            node_class - Thread or Reply
+            uuid - the uuid of the item
+            properties - the new values of the properties to change
+            expected_version - the version the edit was based on (None = any)
+
+        Output:
+            item - the properties of the item after the edit
+
+        """
+
+    @abstractmethod
+    def delete_item(self, node_class: ItemClass, uuid: str):
+        """
+        delete_item
+
+        Deletes a Thread or Reply (its Replies remain, orphaned), updating
+        the statistics of the Thread a deleted Reply belonged to
+
+        """
+
+    @abstractmethod
+    def get_branch(
+        self,
+        uuid: str,
+        depth: int,
+        limit: int,
+        after: tuple[float, str] | None = None,
+        preview_chars: int | None = None,
+    ) -> dict:
+        """
+        get_branch
+
+        Returns up to `depth` levels of the descendants of a Reply, at most
+        `limit` of them (see services/branches.py)
+
+        """
+
+    @abstractmethod
+    def get_thread_stats(self, uuid: str, exact: bool = False) -> ThreadStats:
+        """
+        get_thread_stats
+
+        Returns the summary statistics of a Thread, from its maintained
+        counters or (if exact is set) recomputed from its reply tree
+
+        """
+
+    ### votes
+
+    @abstractmethod
+    def vote(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        user_uuid: str,
+        kind: str,
+        cast: bool,
+    ) -> dict:
+        """
+        vote
+
+        Casts or withdraws a User's vote on a Thread or Reply
+
+        Inputs:
+            node_class - Thread or Reply
+            uuid - the uuid of the item
+            user_uuid - the uuid of the User voting
+            kind - "up" or "down"
+            cast - True to cast the vote, False to withdraw it
+
+        Output:
+            item - the properties of the item, with its upvotes and downvotes,
+                   the uuid of its Thread under "thread", whether the vote
+                   changed anything under "changed" and when the vote cast
+                   (or withdrawn) was cast under "voted_at" (in seconds
+                   since the epoch, None if there was no such vote)
+
+        """
+
+    @abstractmethod
+    def user_votes(self, user_uuid: str) -> dict[str, list[str]]:
+        """
+        user_votes
+
+        Returns the uuids of every Thread and Reply a User has voted on
+
+        Input:
+            user_uuid - the uuid of the User
+
+        Output:
+            votes - {"up": [uuids upvoted], "down": [uuids downvoted]}
+
+        """
+
+    @abstractmethod
+    def most_voted_threads(self, limit: int) -> list[tuple[str, int]]:
+        """
+        most_voted_threads
+
+        Returns the Threads with the most upvotes
+
+        Input:
+            limit - the number of Threads to return
+
+        Output:
+            threads - (uuid, upvotes) of each Thread, most upvoted first
+
+        """
+
+    ### activity
+
+    @abstractmethod
+    def recent_activity(self, since: float) -> list[tuple[str, str, float]]:
+        """
+        recent_activity
+
+        Returns the upvotes and Replies since a given time, each attributed
+        to its Thread
+
+        Input:
+            since - seconds since the epoch
+
+        Output:
+            events - (Thread uuid, "upvote" or "reply", timestamp) triples
+
+        """
+
+    ### related threads
+
+    @abstractmethod
+    def thread_engagement(
+        self, threads: set[str] | None = None
+    ) -> dict[str, list[str]]:
+        """
+        thread_engagement
+
+        Returns the Users engaged with each Thread: its author and upvoters,
+        and the authors and upvoters of the Replies in it
+
+        Input:
+            threads - the uuids of the Threads to look at (default all)
+
+        Output:
+            engagement - the uuids of the Users, by Thread uuid
+
+        """
+
+    @abstractmethod
+    def user_engagement(self, users: set[str]) -> dict[str, list[str]]:
+        """
+        user_engagement
+
+        Returns the Threads each of a set of Users is engaged with (the
+        inverse of thread_engagement)
+
+        Input:
+            users - the uuids of the Users
+
+        Output:
+            engagement - the uuids of the Threads, by User uuid
+
+        """
+
+    @abstractmethod
+    def store_related(self, related: dict[str, list[tuple[str, float]]]):
+        """
+        store_related
+
+        Stores the related Threads found for each of a set of Threads,
+        replacing any stored before
+
+        Input:
+            related - (uuid, score) of the related Threads, best first, by
+                      Thread uuid
+
+        """
+
+    @abstractmethod
+    def get_related(
+        self, uuid: str, present_only: bool = True
+    ) -> list[tuple[str, float]]:
+        """
+        get_related
+
+        Returns the related Threads stored for a Thread
+
+        Inputs:
+            uuid - the uuid of the Thread
+            present_only - whether to leave out the related Threads not in
+                           the repository (e.g. deleted since)
+
+        Output:
+            related - (uuid, score) of the related Threads, best first
+
+        """
+
+    @abstractmethod
+    def existing_threads(self, uuids: list[str]) -> set[str]:
+        """
+        existing_threads
+
+        Returns those of a list of Threads that are in the repository
+
+        Input:
+            uuids - the uuids of the Threads
+
+        Output:
+            existing - the uuids of those in the repository
+
+        """
+
+    ### archiving
+
+    @abstractmethod
+    def inactive_threads(self, before: float, limit: int) -> list[str]:
+        """
+        inactive_threads
+
+        Returns Threads in which nothing has happened (no edits, Replies or
+        votes, on the Thread or any of its Replies) since a given time
+
+        Inputs:
+            before - seconds since the epoch
+            limit - the most Threads to return
+
+        Output:
+            uuids - of the inactive Threads
+
+        """
+
+    @abstractmethod
+    def export_thread(self, uuid: str) -> dict:
+        """
+        export_thread
+
+        Returns a Thread with everything below it, as plain data (times in
+        seconds since the epoch) that import_thread can store again
+
+        Output:
+            tree - with the Thread's properties under "thread", its Replies
+                   (parents first) under "replies", each item's author uuid
+                   under "author", the authors under "users" and the votes
+                   as [item, user, kind, time] lists under "votes"
+
+        """
+
+    @abstractmethod
+    def import_thread(self, tree: dict):
+        """
+        import_thread
+
+        Stores a Thread exported by export_thread, keeping its uuids, times
+        and versions (links to Users that no longer exist are dropped)
+
+        """
+
+    @abstractmethod
+    def purge_thread(self, uuid: str, before: float) -> bool:
+        """
+        purge_thread
+
+        Deletes a Thread with all of its Replies and the votes on them,
+        provided nothing has happened in it since a given time
+
+        Output:
+            purged - whether the Thread was deleted
+
+        """
+
+    ### administration
+
+    @abstractmethod
+    def is_empty(self) -> bool:
+        """
+        is_empty
+
+        Checks whether nothing has been stored yet
+
+        """
@@ -0,0 +1,374 @@
+# services/repository/graph.py
+# the Neo4j implementation of the repository
+
+from functools import wraps
+from time import time
+
+from src.models import ReplyLowerLevel, ReplyTopLevel, Thread, User
+from src.schemas import ThreadStats
+from src.services import archive, related
+from src.services.batches import create_replies, create_threads
+from src.services.branches import fetch_branch
+from src.services.concurrency import conditional_update
+from src.services.graph import graph_is_empty
+from src.services.projections import (
+    REPLY_PROPERTIES,
+    THREAD_PROPERTIES,
+    USER_FIELDS,
+    fetch_item,
+    fetch_threads,
+)
+from src.services.repository.base import ItemClass, Repository
+from src.services.sessions import read_transaction, write_transaction
+from src.services.shards import replicate_user, use_shard
+from src.services.stats import (
+    record_reply_created,
+    record_reply_deleted,
+    store_thread_stats,
+    stored_stats,
+    thread_of_reply,
+    thread_stats,
+)
+from src.services.trending import recent_activity
+from src.services.votes import (
+    most_voted_threads,
+    user_votes,
+    vote_counts,
+    vote_recorder,
+    vote_state,
+)
+
+
+def _fields(node, fields: tuple[str, ...]) -> dict:
+    return {field: getattr(node, field) for field in fields}
+
+
+def _properties(node) -> dict:
+    fields = THREAD_PROPERTIES if isinstance(node, Thread) else REPLY_PROPERTIES
+    return _fields(node, fields)
+
+
+def _on_shard(method):
+    # runs a repository method against the repository's shard
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with use_shard(self.shard):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class Neo4jRepository(Repository):
+    """
+    Neo4jRepository
+
+    Stores everything in the Neo4j graph configured by graph_init or, if a
+    shard is given, in that database of the shard map
+
+    """
+
+    def __init__(self, shard: int | None = None):
+        self.shard = shard
+
+    ### users
+
+    @_on_shard
+    def create_user(self, name: str) -> dict:
+        with write_transaction():
+            new_user = User(name=name).save()
+
+        return _fields(new_user, USER_FIELDS)
+
+    @_on_shard
+    def store_user(self, user: dict):
+        with write_transaction():
+            replicate_user(user)
+
+    @_on_shard
+    def list_users(self) -> list[dict]:
+        with read_transaction():
+            all_users = User.nodes.all()
+
+        return [_fields(user, USER_FIELDS) for user in all_users]
+
+    @_on_shard
+    def get_user(self, uuid: str) -> dict:
+        with read_transaction():
+            user = User.nodes.get(uuid=uuid)
+
+        return _fields(user, USER_FIELDS)
+
+    @_on_shard
+    def delete_user(self, uuid: str):
+        with write_transaction():
+            user = User.nodes.get(uuid=uuid)
+            user.delete()
+
+    ### threads and replies
+
+    @_on_shard
+    def create_thread(
+        self, user_uuid: str, title: str, body: str, uuid: str | None = None
+    ) -> dict:
+        properties = {"uuid": uuid} if uuid is not None else {}
+
+        with write_transaction():
+            user = User.nodes.get(uuid=user_uuid)
+
+            new_thread = Thread(
+                title=title,
+                body=body,
+                reply_count=0,
+                participant_count=1,
+                max_depth=0,
+                reply_depths=[],
+                **properties,
+            ).save()
+            new_thread.author.connect(user)
+
+        return {
+            **_properties(new_thread),
+            "author": _fields(user, USER_FIELDS),
+            "children": [],
+            "upvotes": 0,
+            "downvotes": 0,
+        }
+
+    @_on_shard
+    def create_reply(
+        self,
+        user_uuid: str,
+        parent_class: ItemClass,
+        parent_uuid: str,
+        body: str,
+    ) -> dict:
+        reply_class = ReplyTopLevel if parent_class is Thread else ReplyLowerLevel
+
+        with write_transaction():
+            user = User.nodes.get(uuid=user_uuid)
+            parent = parent_class.nodes.get(uuid=parent_uuid)
+
+            new_reply = reply_class(body=body).save()
+            new_reply.parent.connect(parent)
+            new_reply.author.connect(user)
+            thread_uuid = record_reply_created(new_reply.uuid)
+
+        return {
+            **_properties(new_reply),
+            "author": _fields(user, USER_FIELDS),
+            "children": [],
+            "upvotes": 0,
+            "downvotes": 0,
+            "thread": thread_uuid,
+        }
+
+    @_on_shard
+    def create_threads(self, threads: list[dict]) -> list[str]:
+        return create_threads(threads)
+
+    @_on_shard
+    def create_replies(self, thread_uuid: str, replies: list[dict]) -> list[str]:
+        return create_replies(thread_uuid, replies)
+
+    @_on_shard
+    def list_threads(
+        self,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+        limit: int | None = None,
+        before: str | None = None,
+        include_stats: bool = False,
+    ) -> list[dict]:
+        with read_transaction():
+            all_threads = fetch_threads(
+                fields,
+                preview_chars=preview_chars,
+                limit=limit,
+                before=before,
+                include_counters=include_stats,
+            )
+
+            if include_stats:
+                for thread in all_threads:
+                    counters = thread.pop("counters")
+                    thread["stats"] = stored_stats(counters) or thread_stats(
+                        counters["uuid"]
+                    )
+
+        return all_threads
+
+    @_on_shard
+    def get_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+    ) -> dict:
+        with read_transaction():
+            return fetch_item(node_class, uuid, fields, preview_chars)
+
+    @_on_shard
+    def update_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        properties: dict,
+        expected_version: int | None,
+    ) -> dict:
+        with write_transaction():
+            updated = conditional_update(node_class, uuid, properties, expected_version)
+
+        return _properties(updated)
+
+    @_on_shard
+    def delete_item(self, node_class: ItemClass, uuid: str):
+        with write_transaction():
+            item = node_class.nodes.get(uuid=uuid)
+
+            if node_class is Thread:
+                item.delete()
+                return
+
+            # N.B. the Reply's descendants are orphaned, so no longer count
+            if record_reply_deleted(uuid) is not None:
+                item.delete()
+                return
+
+            # the Thread's counters have never been initialised
+            thread_uuid = thread_of_reply(uuid)
+            item.delete()
+            if thread_uuid is not None:
+                store_thread_stats(thread_uuid)
+
+    @_on_shard
+    def get_branch(
+        self,
+        uuid: str,
+        depth: int,
+        limit: int,
+        after: tuple[float, str] | None = None,
+        preview_chars: int | None = None,
+    ) -> dict:
+        with read_transaction():
+            return fetch_branch(uuid, depth, limit, after, preview_chars)
+
+    @_on_shard
+    def get_thread_stats(self, uuid: str, exact: bool = False) -> ThreadStats:
+        with read_transaction():
+            if exact:
+                return thread_stats(uuid)
+
+            thread = Thread.nodes.get(uuid=uuid)
+            stats = stored_stats(thread.__properties__) or thread_stats(uuid)
+
+        return stats
+
+    ### votes
+
+    @_on_shard
+    def vote(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        user_uuid: str,
+        kind: str,
+        cast: bool,
+    ) -> dict:
+        with write_transaction():
+            user = User.nodes.get(uuid=user_uuid)
+            item = node_class.nodes.get(uuid=uuid)
+            voted_at = vote_state(item, user_uuid, kind)
+            changed = (voted_at is None) == cast
+            if changed:
+                vote_recorder.record(item, user, kind, cast)
+                if cast:
+                    voted_at = time()
+            upvotes, downvotes = vote_counts(item)
+            thread_uuid = uuid if node_class is Thread else thread_of_reply(uuid)
+
+        return {
+            **_properties(item),
+            "upvotes": upvotes,
+            "downvotes": downvotes,
+            "thread": thread_uuid,
+            "changed": changed,
+            "voted_at": voted_at,
+        }
+
+    @_on_shard
+    def most_voted_threads(self, limit: int) -> list[tuple[str, int]]:
+        with read_transaction():
+            return most_voted_threads(limit)
+
+    @_on_shard
+    def user_votes(self, user_uuid: str) -> dict[str, list[str]]:
+        with read_transaction():
+            return user_votes(user_uuid)
+
+    ### activity
+
+    @_on_shard
+    def recent_activity(self, since: float) -> list[tuple[str, str, float]]:
+        with read_transaction():
+            return recent_activity(since)
+
+    ### related threads
+
+    @_on_shard
+    def thread_engagement(
+        self, threads: set[str] | None = None
+    ) -> dict[str, list[str]]:
+        with read_transaction():
+            return related.thread_engagement(threads)
+
+    @_on_shard
+    def user_engagement(self, users: set[str]) -> dict[str, list[str]]:
+        with read_transaction():
+            return related.user_engagement(users)
+
+    @_on_shard
+    def store_related(self, related_threads: dict[str, list[tuple[str, float]]]):
+        with write_transaction():
+            related.store_related(related_threads)
+
+    @_on_shard
+    def get_related(
+        self, uuid: str, present_only: bool = True
+    ) -> list[tuple[str, float]]:
+        with read_transaction():
+            return related.get_related(uuid, present_only)
+
+    @_on_shard
+    def existing_threads(self, uuids: list[str]) -> set[str]:
+        with read_transaction():
+            return related.existing_threads(uuids)
+
+    ### archiving
+
+    @_on_shard
+    def inactive_threads(self, before: float, limit: int) -> list[str]:
+        with read_transaction():
+            return archive.inactive_threads(before, limit)
+
+    @_on_shard
+    def export_thread(self, uuid: str) -> dict:
+        with read_transaction():
+            return archive.export_thread(uuid)
+
+    @_on_shard
+    def import_thread(self, tree: dict):
+        with write_transaction():
+            archive.import_thread(tree)
+            store_thread_stats(tree["thread"]["uuid"])
+
+    @_on_shard
+    def purge_thread(self, uuid: str, before: float) -> bool:
+        with write_transaction():
+            return archive.purge_thread(uuid, before)
+
+    ### administration
+
+    @_on_shard
+    def is_empty(self) -> bool:
+        return graph_is_empty()
@@ -0,0 +1,698 @@
+# services/repository/memory.py
+# an in-memory repository, for tests, local development and benchmarks
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import chain, islice
+from threading import RLock
+
+from neomodel.exceptions import UniqueProperty
+
+from src.models import Reply, Thread, User
+from src.schemas import ThreadStats
+from src.services.batches import resolve_replies, timestamps
+from src.services.branches import MAX_BRANCH_DEPTH, MAX_BRANCH_REPLIES, assemble_branch
+from src.services.concurrency import VersionConflict
+from src.services.ids import new_id
+from src.services.projections import REPLY_PROPERTIES, THREAD_PROPERTIES
+from src.services.repository.base import ItemClass, Repository
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _from_timestamp(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+class MemoryRepository(Repository):
+    """
+    MemoryRepository
+
+    Keeps everything in process memory: nodes in dictionaries keyed by
+    uuid, and each kind of relationship as an adjacency index (in both
+    directions where it is traversed both ways), so that every operation
+    touches only the nodes involved.
+
+    N.B. nothing is persisted, and each process has its own data
+
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self.clear()
+
+    def clear(self):
+        """
+        clear
+
+        Forgets everything stored
+
+        """
+        with self._lock:
+            self._users: dict[str, dict] = {}
+            self._user_names: dict[str, str] = {}  # name -> uuid
+            self._items: dict[str, dict] = {}  # Threads and Replies
+            self._classes: dict[str, ItemClass] = {}
+            self._thread_titles: dict[str, str] = {}  # title -> uuid
+            self._author: dict[str, str] = {}  # item -> User
+            self._authored: defaultdict[str, set[str]] = defaultdict(set)
+            self._parent: dict[str, str] = {}  # Reply -> item replied to
+            self._children: defaultdict[str, list[str]] = defaultdict(list)
+            # kind ("up"/"down") -> item -> User -> time of the vote
+            self._votes: dict[str, defaultdict[str, dict[str, datetime]]] = {
+                "up": defaultdict(dict),
+                "down": defaultdict(dict),
+            }
+            self._voted: defaultdict[str, set[tuple[str, str]]] = defaultdict(set)
+            # Thread -> (uuid, score) of its related Threads
+            self._related: dict[str, list[tuple[str, float]]] = {}
+
+    ### lookups
+
+    def _user(self, uuid: str) -> dict:
+        if uuid not in self._users:
+            raise User.DoesNotExist(repr({"uuid": uuid}))
+        return self._users[uuid]
+
+    def _item(self, node_class: ItemClass, uuid: str) -> dict:
+        if self._classes.get(uuid) is not node_class:
+            raise node_class.DoesNotExist(repr({"uuid": uuid}))
+        return self._items[uuid]
+
+    def _project(
+        self, uuid: str, fields: tuple[str, ...], preview_chars: int | None
+    ) -> dict:
+        item = self._items[uuid]
+        data = {}
+
+        for field in fields:
+            if field == "body" and preview_chars is not None:
+                data["body"] = item["body"][:preview_chars]
+            elif field == "author":
+                author = self._author.get(uuid)
+                data["author"] = dict(self._users[author]) if author else None
+            elif field == "children":
+                data["children"] = [
+                    self._project(child, REPLY_PROPERTIES, preview_chars)
+                    for child in self._children.get(uuid, [])
+                ]
+            elif field == "upvotes":
+                data["upvotes"] = len(self._votes["up"].get(uuid, {}))
+            elif field == "downvotes":
+                data["downvotes"] = len(self._votes["down"].get(uuid, {}))
+            else:
+                data[field] = item[field]
+
+        return data
+
+    def _thread_of(self, uuid: str) -> str | None:
+        while uuid in self._parent:
+            uuid = self._parent[uuid]
+        return uuid if self._classes.get(uuid) is Thread else None
+
+    def _thread_stats(self, uuid: str) -> ThreadStats:
+        thread = self._items[uuid]
+        thread_author = self._author.get(uuid)
+        reply_authors = set()
+        reply_count = max_depth = 0
+        last_reply_at = None
+
+        level, depth = self._children.get(uuid, []), 0
+        while level:
+            depth += 1
+            for reply in level:
+                reply_count += 1
+                max_depth = depth
+                if reply in self._author:
+                    reply_authors.add(self._author[reply])
+                created_at = self._items[reply]["created_at"]
+                if last_reply_at is None or created_at > last_reply_at:
+                    last_reply_at = created_at
+            level = [
+                child for reply in level for child in self._children.get(reply, [])
+            ]
+
+        participant_count = len(reply_authors - {thread_author}) + (
+            1 if thread_author else 0
+        )
+        last_activity_at = thread["updated_at"]
+        if last_reply_at is not None and last_reply_at > last_activity_at:
+            last_activity_at = last_reply_at
+
+        return ThreadStats(
+            reply_count=reply_count,
+            participant_count=participant_count,
+            max_depth=max_depth,
+            last_activity_at=last_activity_at,
+        )
+
+    ### users
+
+    def create_user(self, name: str) -> dict:
+        with self._lock:
+            if name in self._user_names:
+                raise UniqueProperty(
+                    f"Node already exists with label `User` and property "
+                    f"`name` = {name!r}"
+                )
+            user = {"uuid": new_id(), "name": name, "created_at": _now()}
+            self._users[user["uuid"]] = user
+            self._user_names[name] = user["uuid"]
+
+            return dict(user)
+
+    def store_user(self, user: dict):
+        with self._lock:
+            if user["uuid"] not in self._users:
+                self._users[user["uuid"]] = dict(user)
+                self._user_names[user["name"]] = user["uuid"]
+
+    def list_users(self) -> list[dict]:
+        with self._lock:
+            return [dict(user) for user in self._users.values()]
+
+    def get_user(self, uuid: str) -> dict:
+        with self._lock:
+            return dict(self._user(uuid))
+
+    def delete_user(self, uuid: str):
+        with self._lock:
+            user = self._user(uuid)
+            for item in self._authored.pop(uuid, set()):
+                del self._author[item]
+            for kind, item in self._voted.pop(uuid, set()):
+                del self._votes[kind][item][uuid]
+            del self._user_names[user["name"]]
+            del self._users[uuid]
+
+    ### threads and replies
+
+    def _create_item(
+        self,
+        node_class: ItemClass,
+        user_uuid: str,
+        properties: dict,
+        uuid: str | None = None,
+        created_at: datetime | None = None,
+    ) -> str:
+        uuid = uuid or new_id()
+        created_at = created_at or _now()
+        self._items[uuid] = {
+            "uuid": uuid,
+            **properties,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "version": 0,
+        }
+        self._classes[uuid] = node_class
+        self._author[uuid] = user_uuid
+        self._authored[user_uuid].add(uuid)
+
+        return uuid
+
+    def create_thread(
+        self, user_uuid: str, title: str, body: str, uuid: str | None = None
+    ) -> dict:
+        with self._lock:
+            user = self._user(user_uuid)
+            if title in self._thread_titles:
+                raise UniqueProperty(
+                    f"Node already exists with label `Thread` and property "
+                    f"`title` = {title!r}"
+                )
+            uuid = self._create_item(
+                Thread, user_uuid, {"title": title, "body": body}, uuid=uuid
+            )
+            self._thread_titles[title] = uuid
+
+            return {
+                **self._project(uuid, THREAD_PROPERTIES, None),
+                "author": dict(user),
+                "children": [],
+                "upvotes": 0,
+                "downvotes": 0,
+            }
+
+    def create_reply(
+        self,
+        user_uuid: str,
+        parent_class: ItemClass,
+        parent_uuid: str,
+        body: str,
+    ) -> dict:
+        with self._lock:
+            user = self._user(user_uuid)
+            self._item(parent_class, parent_uuid)
+
+            uuid = self._create_item(Reply, user_uuid, {"body": body})
+            self._parent[uuid] = parent_uuid
+            self._children[parent_uuid].append(uuid)
+
+            return {
+                **self._project(uuid, REPLY_PROPERTIES, None),
+                "author": dict(user),
+                "children": [],
+                "upvotes": 0,
+                "downvotes": 0,
+                "thread": self._thread_of(uuid),
+            }
+
+    def create_threads(self, threads: list[dict]) -> list[str]:
+        with self._lock:
+            for thread in threads:
+                self._user(thread["user_id"])
+
+            titles = [thread["title"] for thread in threads]
+            for title in titles:
+                if title in self._thread_titles or titles.count(title) > 1:
+                    raise UniqueProperty(
+                        f"Node already exists with label `Thread` and property "
+                        f"`title` = {title!r}"
+                    )
+
+            uuids = []
+            for thread, created_at in zip(threads, timestamps(len(threads))):
+                uuid = self._create_item(
+                    Thread,
+                    thread["user_id"],
+                    {"title": thread["title"], "body": thread["body"]},
+                    uuid=thread.get("uuid"),
+                    created_at=created_at,
+                )
+                self._thread_titles[thread["title"]] = uuid
+                uuids.append(uuid)
+
+            return uuids
+
+    def create_replies(self, thread_uuid: str, replies: list[dict]) -> list[str]:
+        resolved = resolve_replies(replies)
+
+        with self._lock:
+            for reply in resolved:
+                self._user(reply["user_id"])
+            self._item(Thread, thread_uuid)
+            for reply in resolved:
+                parent = reply["parent"]
+                if (
+                    parent is not None
+                    and not reply["new_parent"]
+                    and (
+                        self._classes.get(parent) is not Reply
+                        or self._thread_of(parent) != thread_uuid
+                    )
+                ):
+                    raise Reply.DoesNotExist(repr({"uuid": parent}))
+
+            for reply, created_at in zip(resolved, timestamps(len(resolved))):
+                self._create_item(
+                    Reply,
+                    reply["user_id"],
+                    {"body": reply["body"]},
+                    uuid=reply["uuid"],
+                    created_at=created_at,
+                )
+                parent = reply["parent"] or thread_uuid
+                self._parent[reply["uuid"]] = parent
+                self._children[parent].append(reply["uuid"])
+
+            return [reply["uuid"] for reply in resolved]
+
+    def list_threads(
+        self,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+        limit: int | None = None,
+        before: str | None = None,
+        include_stats: bool = False,
+    ) -> list[dict]:
+        with self._lock:
+            uuids = [
+                uuid
+                for uuid, node_class in self._classes.items()
+                if node_class is Thread and (before is None or uuid < before)
+            ]
+            if limit is not None:
+                uuids = sorted(uuids, reverse=True)[:limit]
+
+            all_threads = []
+            for uuid in uuids:
+                thread = self._project(uuid, fields, preview_chars)
+                if include_stats:
+                    thread["stats"] = self._thread_stats(uuid)
+                all_threads.append(thread)
+
+            return all_threads
+
+    def get_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+    ) -> dict:
+        with self._lock:
+            self._item(node_class, uuid)
+            return self._project(uuid, fields, preview_chars)
+
+    def update_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        properties: dict,
+        expected_version: int | None,
+    ) -> dict:
+        with self._lock:
+            item = self._item(node_class, uuid)
+
+            if expected_version is not None and item["version"] != expected_version:
+                raise VersionConflict(uuid, expected_version, item["version"])
+
+            title = properties.get("title")
+            if node_class is Thread and title is not None and title != item["title"]:
+                if title in self._thread_titles:
+                    raise UniqueProperty(
+                        f"Node already exists with label `Thread` and property "
+                        f"`title` = {title!r}"
+                    )
+                del self._thread_titles[item["title"]]
+                self._thread_titles[title] = uuid
+
+            item.update(properties)
+            item["updated_at"] = _now()
+            item["version"] += 1
+
+            fields = THREAD_PROPERTIES if node_class is Thread else REPLY_PROPERTIES
+            return self._project(uuid, fields, None)
+
+    def delete_item(self, node_class: ItemClass, uuid: str):
+        with self._lock:
+            item = self._item(node_class, uuid)
+
+            # N.B. Replies to the item are orphaned, as in the graph
+            for child in self._children.pop(uuid, []):
+                del self._parent[child]
+            if uuid in self._parent:
+                self._children[self._parent.pop(uuid)].remove(uuid)
+            if uuid in self._author:
+                self._authored[self._author.pop(uuid)].discard(uuid)
+            for kind, votes in self._votes.items():
+                for user in votes.pop(uuid, {}):
+                    self._voted[user].discard((kind, uuid))
+            if node_class is Thread:
+                del self._thread_titles[item["title"]]
+                self._related.pop(uuid, None)
+
+            del self._classes[uuid]
+            del self._items[uuid]
+
+    def get_branch(
+        self,
+        uuid: str,
+        depth: int,
+        limit: int,
+        after: tuple[float, str] | None = None,
+        preview_chars: int | None = None,
+    ) -> dict:
+        depth = max(1, min(depth, MAX_BRANCH_DEPTH))
+        limit = max(1, min(limit, MAX_BRANCH_REPLIES))
+
+        def position(reply: str) -> tuple[float, str]:
+            return (self._items[reply]["created_at"].timestamp(), reply)
+
+        with self._lock:
+            self._item(Reply, uuid)
+
+            level = [
+                child
+                for child in self._children.get(uuid, [])
+                if after is None or position(child) > tuple(after)
+            ]
+            n_children = len(level)
+
+            # breadth first, in order of creation within each level
+            rows = []
+            for _ in range(depth):
+                for reply in sorted(level, key=position)[: limit - len(rows)]:
+                    rows.append(
+                        {
+                            "reply": self._project(
+                                reply, REPLY_PROPERTIES, preview_chars
+                            ),
+                            "created_at": position(reply)[0],
+                            "parent": self._parent[reply],
+                            "n_children": len(self._children.get(reply, [])),
+                        }
+                    )
+                level = [
+                    child for reply in level for child in self._children.get(reply, [])
+                ]
+
+            return assemble_branch(uuid, n_children, rows, after)
+
+    def get_thread_stats(self, uuid: str, exact: bool = False) -> ThreadStats:
+        # N.B. statistics are always computed exactly, since it is cheap here
+        with self._lock:
+            self._item(Thread, uuid)
+            return self._thread_stats(uuid)
+
+    ### votes
+
+    def vote(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        user_uuid: str,
+        kind: str,
+        cast: bool,
+    ) -> dict:
+        with self._lock:
+            self._user(user_uuid)
+            self._item(node_class, uuid)
+
+            previous = self._votes[kind][uuid].get(user_uuid)
+            if cast:
+                voted_at = self._votes[kind][uuid].setdefault(user_uuid, _now())
+                self._voted[user_uuid].add((kind, uuid))
+            else:
+                voted_at = self._votes[kind][uuid].pop(user_uuid, None)
+                self._voted[user_uuid].discard((kind, uuid))
+
+            fields = THREAD_PROPERTIES if node_class is Thread else REPLY_PROPERTIES
+            return {
+                **self._project(uuid, fields + ("upvotes", "downvotes"), None),
+                "thread": self._thread_of(uuid),
+                "changed": (previous is None) == cast,
+                "voted_at": voted_at.timestamp() if voted_at else None,
+            }
+
+    def most_voted_threads(self, limit: int) -> list[tuple[str, int]]:
+        with self._lock:
+            upvotes = [
+                (uuid, len(self._votes["up"].get(uuid, {})))
+                for uuid, node_class in self._classes.items()
+                if node_class is Thread
+            ]
+            return sorted(upvotes, key=lambda thread: thread[1], reverse=True)[:limit]
+
+    def user_votes(self, user_uuid: str) -> dict[str, list[str]]:
+        with self._lock:
+            self._user(user_uuid)
+            votes = {"up": [], "down": []}
+            for kind, item in self._voted.get(user_uuid, ()):
+                votes[kind].append(item)
+            return votes
+
+    ### activity
+
+    def recent_activity(self, since: float) -> list[tuple[str, str, float]]:
+        with self._lock:
+            events = [
+                (self._thread_of(item), "upvote", at.timestamp())
+                for item, votes in self._votes["up"].items()
+                for at in votes.values()
+                if at.timestamp() >= since
+            ]
+            events += [
+                (self._thread_of(uuid), "reply", item["created_at"].timestamp())
+                for uuid, item in self._items.items()
+                if self._classes[uuid] is Reply
+                and item["created_at"].timestamp() >= since
+            ]
+
+            return [event for event in events if event[0] is not None]
+
+    ### related threads
+
+    def thread_engagement(
+        self, threads: set[str] | None = None
+    ) -> dict[str, list[str]]:
+        with self._lock:
+            engagement = {}
+            for uuid, node_class in self._classes.items():
+                if node_class is not Thread or not (threads is None or uuid in threads):
+                    continue
+                users = set()
+                for item in self._subtree(uuid):
+                    if item in self._author:
+                        users.add(self._author[item])
+                    users.update(self._votes["up"].get(item, {}))
+                engagement[uuid] = list(users)
+            return engagement
+
+    def store_related(self, related: dict[str, list[tuple[str, float]]]):
+        with self._lock:
+            for uuid, neighbours in related.items():
+                if self._classes.get(uuid) is Thread:
+                    self._related[uuid] = list(neighbours)
+
+    def user_engagement(self, users: set[str]) -> dict[str, list[str]]:
+        with self._lock:
+            engagement = {}
+            for user in users:
+                if user not in self._users:
+                    continue
+                items = set(self._authored[user])
+                items.update(uuid for kind, uuid in self._voted[user] if kind == "up")
+                threads = {self._thread_of(item) for item in items}
+                engagement[user] = list(threads - {None})
+            return engagement
+
+    def get_related(
+        self, uuid: str, present_only: bool = True
+    ) -> list[tuple[str, float]]:
+        with self._lock:
+            self._item(Thread, uuid)
+            return [
+                (other, score)
+                for other, score in self._related.get(uuid, [])
+                if not present_only or self._classes.get(other) is Thread
+            ]
+
+    def existing_threads(self, uuids: list[str]) -> set[str]:
+        with self._lock:
+            return {uuid for uuid in uuids if self._classes.get(uuid) is Thread}
+
+    ### archiving
+
+    def _subtree(self, uuid: str) -> list[str]:
+        # an item and everything below it, level by level
+        subtree, level = [], [uuid]
+        while level:
+            subtree += level
+            level = [child for item in level for child in self._children.get(item, [])]
+        return subtree
+
+    def _last_activity(self, uuid: str) -> float:
+        # the latest edit of, or vote on, anything in a Thread
+        subtree = self._subtree(uuid)
+        edits = (self._items[item]["updated_at"] for item in subtree)
+        votes = (
+            at
+            for votes in self._votes.values()
+            for item in subtree
+            for at in votes.get(item, {}).values()
+        )
+        return max(chain(edits, votes)).timestamp()
+
+    def inactive_threads(self, before: float, limit: int) -> list[str]:
+        with self._lock:
+            inactive = (
+                uuid
+                for uuid, node_class in self._classes.items()
+                if node_class is Thread and self._last_activity(uuid) < before
+            )
+            return list(islice(inactive, limit))
+
+    def export_thread(self, uuid: str) -> dict:
+        with self._lock:
+            self._item(Thread, uuid)
+            subtree = self._subtree(uuid)
+
+            def export(item: str, fields: tuple[str, ...]) -> dict:
+                data = {field: self._items[item][field] for field in fields}
+                data["created_at"] = data["created_at"].timestamp()
+                data["updated_at"] = data["updated_at"].timestamp()
+                data["author"] = self._author.get(item)
+                return data
+
+            authors = {self._author[item] for item in subtree if item in self._author}
+
+            return {
+                "thread": export(uuid, THREAD_PROPERTIES),
+                "replies": [
+                    {**export(reply, REPLY_PROPERTIES), "parent": self._parent[reply]}
+                    for reply in subtree[1:]
+                ],
+                "users": [
+                    {
+                        **self._users[author],
+                        "created_at": self._users[author]["created_at"].timestamp(),
+                    }
+                    for author in authors
+                ],
+                "votes": [
+                    [item, user, kind, at.timestamp()]
+                    for kind, votes in self._votes.items()
+                    for item in subtree
+                    for user, at in votes.get(item, {}).items()
+                ],
+            }
+
+    def import_thread(self, tree: dict):
+        thread = tree["thread"]
+
+        with self._lock:
+            if thread["title"] in self._thread_titles:
+                raise UniqueProperty(
+                    f"Node already exists with label `Thread` and property "
+                    f"`title` = {thread['title']!r}"
+                )
+
+            items = [(Thread, thread)] + [(Reply, reply) for reply in tree["replies"]]
+            for node_class, item in items:
+                uuid = item["uuid"]
+                self._items[uuid] = {
+                    **{
+                        field: value
+                        for field, value in item.items()
+                        if field not in ("author", "parent")
+                    },
+                    "created_at": _from_timestamp(item["created_at"]),
+                    "updated_at": _from_timestamp(item["updated_at"]),
+                }
+                self._classes[uuid] = node_class
+                if item["author"] in self._users:
+                    self._author[uuid] = item["author"]
+                    self._authored[item["author"]].add(uuid)
+                if node_class is Reply:
+                    self._parent[uuid] = item["parent"]
+                    self._children[item["parent"]].append(uuid)
+
+            self._thread_titles[thread["title"]] = thread["uuid"]
+
+            for item, user, kind, at in tree["votes"]:
+                if user in self._users:
+                    self._votes[kind][item][user] = _from_timestamp(at)
+                    self._voted[user].add((kind, item))
+
+    def purge_thread(self, uuid: str, before: float) -> bool:
+        with self._lock:
+            if (
+                self._classes.get(uuid) is not Thread
+                or self._last_activity(uuid) >= before
+            ):
+                return False
+
+            # N.B. deepest first, so that nothing is orphaned on the way
+            for item in reversed(self._subtree(uuid)):
+                self.delete_item(self._classes[item], item)
+
+            return True
+
+    ### administration
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._users and not self._items
@@ -0,0 +1,390 @@
+# services/repository/sharded.py
+# a repository spreading Threads over several shards (each itself a repository)
+
+import heapq
+
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from itertools import chain, islice
+from threading import Lock
+
+from src.models import Reply, Thread, User
+from src.schemas import ThreadStats
+from src.services.ids import new_id
+from src.services.repository.base import ItemClass, Repository
+from src.services.shards import ShardMap
+
+
+class ShardedRepository(Repository):
+    """
+    ShardedRepository
+
+    Spreads Threads over several shards, placing each Thread, with all of
+    its Replies and the votes on them, on the shard the shard map chooses
+    for its uuid. Every User is stored on every shard (the first shard
+    holding the original), so that items on any shard can refer to them.
+
+    Operations on a Thread go straight to its shard. Replies are addressed
+    by their own uuid, so the shard of each Reply seen is remembered (up to
+    `directory_size` of them); an unknown Reply is looked for on every
+    shard at once. Operations spanning all Threads (e.g. listing them) are
+    sent to every shard at once and their results merged.
+
+    N.B. titles are only unique within a shard, and a batch of Threads
+         spanning several shards is written by one transaction per shard
+
+    """
+
+    def __init__(
+        self,
+        shards: list[Repository],
+        shard_map: ShardMap,
+        directory_size: int = 100_000,
+    ):
+        self.shards = shards
+        self.shard_map = shard_map
+        self.directory_size = directory_size
+        self._directory: OrderedDict[str, int] = OrderedDict()
+        self._lock = Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=len(shards), thread_name_prefix="shard"
+        )
+
+    ### routing
+
+    def _map(self, call: Callable, items) -> list:
+        # N.B. each call runs in the caller's context (e.g. with its bookmarks)
+        contexts = [copy_context() for _ in items]
+        return list(
+            self._pool.map(
+                lambda context, item: context.run(call, item), contexts, items
+            )
+        )
+
+    def _scatter(self, call: Callable[[Repository], object]) -> list:
+        return self._map(call, self.shards)
+
+    def _remember(self, uuid: str, shard: int):
+        with self._lock:
+            self._directory[uuid] = shard
+            self._directory.move_to_end(uuid)
+            if len(self._directory) > self.directory_size:
+                self._directory.popitem(last=False)
+
+    def _forget(self, uuid: str):
+        with self._lock:
+            self._directory.pop(uuid, None)
+
+    def _by_shard(self, uuids) -> dict[int, list[str]]:
+        # groups Threads by the shard holding them
+        by_shard = defaultdict(list)
+        for uuid in uuids:
+            by_shard[self.shard_map.shard_for(uuid)].append(uuid)
+        return by_shard
+
+    def _shard_of(self, node_class: ItemClass, uuid: str) -> int:
+        if node_class is Thread:
+            return self.shard_map.shard_for(uuid)
+
+        with self._lock:
+            shard = self._directory.get(uuid)
+        if shard is not None:
+            return shard
+
+        def holds(repository: Repository) -> bool:
+            try:
+                repository.get_item(Reply, uuid, ("uuid",))
+            except Reply.DoesNotExist:
+                return False
+            return True
+
+        for shard, found in enumerate(self._scatter(holds)):
+            if found:
+                self._remember(uuid, shard)
+                return shard
+
+        raise Reply.DoesNotExist(repr({"uuid": uuid}))
+
+    def _holding(self, node_class: ItemClass, uuid: str) -> Repository:
+        return self.shards[self._shard_of(node_class, uuid)]
+
+    ### users
+
+    def create_user(self, name: str) -> dict:
+        # N.B. the first shard checks that the name is unique
+        user = self.shards[0].create_user(name)
+        for shard in self.shards[1:]:
+            shard.store_user(user)
+
+        return user
+
+    def store_user(self, user: dict):
+        for shard in self.shards:
+            shard.store_user(user)
+
+    def list_users(self) -> list[dict]:
+        return self.shards[0].list_users()
+
+    def get_user(self, uuid: str) -> dict:
+        return self.shards[0].get_user(uuid)
+
+    def delete_user(self, uuid: str):
+        self.shards[0].delete_user(uuid)
+        for shard in self.shards[1:]:
+            try:
+                shard.delete_user(uuid)
+            except User.DoesNotExist:
+                pass  # N.B. a copy may be missing if creating the User failed
+
+    ### threads and replies
+
+    def create_thread(
+        self, user_uuid: str, title: str, body: str, uuid: str | None = None
+    ) -> dict:
+        uuid = uuid or new_id()
+        return self._holding(Thread, uuid).create_thread(user_uuid, title, body, uuid)
+
+    def create_reply(
+        self,
+        user_uuid: str,
+        parent_class: ItemClass,
+        parent_uuid: str,
+        body: str,
+    ) -> dict:
+        shard = self._shard_of(parent_class, parent_uuid)
+        reply = self.shards[shard].create_reply(
+            user_uuid, parent_class, parent_uuid, body
+        )
+        self._remember(reply["uuid"], shard)
+
+        return reply
+
+    def create_threads(self, threads: list[dict]) -> list[str]:
+        threads = [
+            {**thread, "uuid": thread.get("uuid") or new_id()} for thread in threads
+        ]
+
+        by_shard = defaultdict(list)
+        for thread in threads:
+            by_shard[self.shard_map.shard_for(thread["uuid"])].append(thread)
+
+        # N.B. each shard keeps its part in the order submitted
+        self._map(
+            lambda shard: self.shards[shard].create_threads(by_shard[shard]),
+            list(by_shard),
+        )
+
+        return [thread["uuid"] for thread in threads]
+
+    def create_replies(self, thread_uuid: str, replies: list[dict]) -> list[str]:
+        shard = self._shard_of(Thread, thread_uuid)
+        uuids = self.shards[shard].create_replies(thread_uuid, replies)
+        for uuid in uuids:
+            self._remember(uuid, shard)
+
+        return uuids
+
+    def list_threads(
+        self,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+        limit: int | None = None,
+        before: str | None = None,
+        include_stats: bool = False,
+    ) -> list[dict]:
+        # N.B. pages are merged by uuid, so it is read even if not requested
+        read_fields = fields if "uuid" in fields else fields + ("uuid",)
+
+        pages = self._scatter(
+            lambda shard: shard.list_threads(
+                read_fields, preview_chars, limit, before, include_stats
+            )
+        )
+
+        def by_uuid(thread: dict) -> str:
+            return thread["uuid"]
+
+        if limit is None:
+            # N.B. unlimited lists are not sorted by the shards
+            all_threads = sorted(chain.from_iterable(pages), key=by_uuid, reverse=True)
+        else:
+            merged = heapq.merge(*pages, key=by_uuid, reverse=True)
+            all_threads = list(islice(merged, limit))
+
+        if read_fields != fields:
+            for thread in all_threads:
+                del thread["uuid"]
+
+        return all_threads
+
+    def get_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        fields: tuple[str, ...],
+        preview_chars: int | None = None,
+    ) -> dict:
+        return self._holding(node_class, uuid).get_item(
+            node_class, uuid, fields, preview_chars
+        )
+
+    def update_item(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        properties: dict,
+        expected_version: int | None,
+    ) -> dict:
+        return self._holding(node_class, uuid).update_item(
+            node_class, uuid, properties, expected_version
+        )
+
+    def delete_item(self, node_class: ItemClass, uuid: str):
+        self._holding(node_class, uuid).delete_item(node_class, uuid)
+        self._forget(uuid)
+
+    def get_branch(
+        self,
+        uuid: str,
+        depth: int,
+        limit: int,
+        after: tuple[float, str] | None = None,
+        preview_chars: int | None = None,
+    ) -> dict:
+        return self._holding(Reply, uuid).get_branch(
+            uuid, depth, limit, after, preview_chars
+        )
+
+    def get_thread_stats(self, uuid: str, exact: bool = False) -> ThreadStats:
+        return self._holding(Thread, uuid).get_thread_stats(uuid, exact)
+
+    ### votes
+
+    def vote(
+        self,
+        node_class: ItemClass,
+        uuid: str,
+        user_uuid: str,
+        kind: str,
+        cast: bool,
+    ) -> dict:
+        return self._holding(node_class, uuid).vote(
+            node_class, uuid, user_uuid, kind, cast
+        )
+
+    def most_voted_threads(self, limit: int) -> list[tuple[str, int]]:
+        pages = self._scatter(lambda shard: shard.most_voted_threads(limit))
+        return heapq.nlargest(
+            limit, chain.from_iterable(pages), key=lambda thread: thread[1]
+        )
+
+    def user_votes(self, user_uuid: str) -> dict[str, list[str]]:
+        def votes_on(shard: int) -> dict[str, list[str]]:
+            try:
+                return self.shards[shard].user_votes(user_uuid)
+            except User.DoesNotExist:
+                if shard == 0:
+                    raise
+                return {}  # N.B. see delete_user
+
+        votes = {"up": [], "down": []}
+        for shard_votes in self._map(votes_on, list(range(len(self.shards)))):
+            for kind, uuids in shard_votes.items():
+                votes[kind] += uuids
+
+        return votes
+
+    ### activity
+
+    def recent_activity(self, since: float) -> list[tuple[str, str, float]]:
+        return list(
+            chain.from_iterable(
+                self._scatter(lambda shard: shard.recent_activity(since))
+            )
+        )
+
+    ### related threads
+
+    def thread_engagement(
+        self, threads: set[str] | None = None
+    ) -> dict[str, list[str]]:
+        # N.B. each Thread is on one shard, so the shards' parts are disjoint
+        if threads is None:
+            parts = self._scatter(lambda shard: shard.thread_engagement())
+        else:
+            by_shard = self._by_shard(threads)
+            parts = self._map(
+                lambda shard: self.shards[shard].thread_engagement(
+                    set(by_shard[shard])
+                ),
+                list(by_shard),
+            )
+
+        engagement = {}
+        for part in parts:
+            engagement.update(part)
+
+        return engagement
+
+    def user_engagement(self, users: set[str]) -> dict[str, list[str]]:
+        # N.B. every User is on every shard, engaged with that shard's Threads
+        engagement = defaultdict(list)
+        for part in self._scatter(lambda shard: shard.user_engagement(users)):
+            for user, threads in part.items():
+                engagement[user] += threads
+
+        return dict(engagement)
+
+    def store_related(self, related: dict[str, list[tuple[str, float]]]):
+        by_shard = defaultdict(dict)
+        for uuid, neighbours in related.items():
+            by_shard[self.shard_map.shard_for(uuid)][uuid] = neighbours
+
+        self._map(
+            lambda shard: self.shards[shard].store_related(by_shard[shard]),
+            list(by_shard),
+        )
+
+    def get_related(
+        self, uuid: str, present_only: bool = True
+    ) -> list[tuple[str, float]]:
+        # N.B. the related Threads may be on any shard, so the shard holding
+        #      the Thread cannot tell which of them are present
+        related = self._holding(Thread, uuid).get_related(uuid, present_only=False)
+        if not present_only:
+            return related
+
+        present = self.existing_threads([other for other, _ in related])
+        return [(other, score) for other, score in related if other in present]
+
+    def existing_threads(self, uuids: list[str]) -> set[str]:
+        by_shard = self._by_shard(uuids)
+        parts = self._map(
+            lambda shard: self.shards[shard].existing_threads(by_shard[shard]),
+            list(by_shard),
+        )
+        return set().union(*parts)
+
+    ### archiving
+
+    def inactive_threads(self, before: float, limit: int) -> list[str]:
+        pages = self._scatter(lambda shard: shard.inactive_threads(before, limit))
+        return list(islice(chain.from_iterable(pages), limit))
+
+    def export_thread(self, uuid: str) -> dict:
+        return self._holding(Thread, uuid).export_thread(uuid)
+
+    def import_thread(self, tree: dict):
+        self._holding(Thread, tree["thread"]["uuid"]).import_thread(tree)
+
+    def purge_thread(self, uuid: str, before: float) -> bool:
+        # N.B. the directory may still name the shard of a purged Reply,
+        #      where it is then simply not found
+        return self._holding(Thread, uuid).purge_thread(uuid, before)
+
+    ### administration
+
+    def is_empty(self) -> bool:
+        return all(self._scatter(lambda shard: shard.is_empty()))
@@ -0,0 +1,150 @@
+# services/sessions.py
+# services for routing transactions to the cluster and propagating bookmarks
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from neomodel import db
+from neomodel.util import TransactionProxy
+
+from src.services.shards import current_shard
+
+# the header in which clients present (and receive) bookmarks, each as
+# "<shard>:<bookmark>" (a bookmark without a shard is for shard 0)
+BOOKMARK_HEADER = "X-Bookmark"
+
+
+def split_bookmark(value: str) -> tuple[int, str]:
+    """
+    split_bookmark
+
+    Splits a bookmark sent by a client into the shard it was issued by and
+    the bookmark itself
+
+    """
+    shard, _, bookmark = value.partition(":")
+    if not shard.isdigit() or not bookmark:
+        return 0, value
+    return int(shard), bookmark
+
+
+@dataclass
+class RequestBookmarks:
+    """
+    RequestBookmarks
+
+    The bookmarks of a request, by shard: bookmarks are only meaningful to
+    the database that issued them, so reads on a shard wait only for the
+    writes made there
+
+    N.B. shared (not copied) with the worker threads handling the request,
+         so the bookmark of a write made there is visible to the middleware
+
+    """
+
+    presented: tuple[str, ...] = ()  # sent by the client with the request
+    latest: dict[int, str] = field(default_factory=dict)  # of the last writes
+
+    def for_shard(self, shard: int) -> tuple[str, ...]:
+        return tuple(
+            bookmark
+            for bookmark_shard, bookmark in map(split_bookmark, self.presented)
+            if bookmark_shard == shard
+        )
+
+    def header(self) -> str | None:
+        """
+        header
+
+        Returns the bookmarks to send back after the request's writes (if
+        any): the latest for each shard written to, and those presented for
+        the other shards, so that the client need only keep the last set
+        it received
+
+        """
+        if not self.latest:
+            return None
+
+        bookmarks = [
+            value
+            for value in self.presented
+            if split_bookmark(value)[0] not in self.latest
+        ]
+        bookmarks += [f"{shard}:{bookmark}" for shard, bookmark in self.latest.items()]
+        return ",".join(sorted(bookmarks))
+
+
+request_bookmarks: ContextVar[RequestBookmarks | None] = ContextVar(
+    "request_bookmarks", default=None
+)
+
+
+def parse_bookmarks(header: str | None) -> tuple[str, ...]:
+    """
+    parse_bookmarks
+
+    Splits the (comma-separated) bookmarks sent in a request header
+
+    """
+    if not header:
+        return ()
+    return tuple(sorted({value.strip() for value in header.split(",")} - {""}))
+
+
+def presented_bookmarks() -> tuple[str, ...]:
+    """
+    presented_bookmarks
+
+    Returns the bookmarks the current request must read after
+
+    """
+    bookmarks = request_bookmarks.get()
+    return bookmarks.presented if bookmarks is not None else ()
+
+
+@contextmanager
+def _transaction(access_mode: str) -> Iterator[None]:
+    # N.B. neomodel allows one transaction at a time per thread, so a
+    #      transaction opened inside another simply joins it
+    if db._active_transaction is not None:
+        yield
+        return
+
+    bookmarks = request_bookmarks.get()
+    shard = current_shard()
+    transaction = TransactionProxy(db, access_mode=access_mode)
+    if bookmarks is not None:
+        transaction.bookmarks = bookmarks.for_shard(shard) or None
+
+    with transaction:
+        yield
+
+    if bookmarks is not None and access_mode == "WRITE":
+        if transaction.last_bookmark is not None:
+            bookmarks.latest[shard] = transaction.last_bookmark
+
+
+def read_transaction():
+    """
+    read_transaction
+
+    Opens a read transaction: with a routing (neo4j://) connection, it is
+    served by a follower or read replica, after that server has caught up
+    with the bookmarks the request presented
+
+    """
+    return _transaction("READ")
+
+
+def write_transaction():
+    """
+    write_transaction
+
+    Opens a write transaction: with a routing (neo4j://) connection, it is
+    served by the leader, and its bookmark is returned to the client so
+    that later reads see the write
+
+    """
+    return _transaction("WRITE")
@@ -0,0 +1,178 @@
+# services/shards.py
+# services for spreading Threads over several Neo4j databases
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from hashlib import blake2b
+from threading import local
+
+from neomodel import db
+
+from src.models import User
+
+
+class ShardMap:
+    """
+    ShardMap
+
+    The databases Threads are spread over, and which of them holds each
+    Thread (with all of its Replies and votes)
+
+    Threads are placed by rendezvous hashing of their uuid: each Thread goes
+    to the shard scoring highest for it. Adding a shard at the end of the
+    list therefore only moves the Threads that now score highest on the new
+    shard (about 1/n of them), rather than reshuffling almost all of them as
+    `hash % n` would.
+
+    Shard 0 is the database given by DBHOST and DBNAME.
+
+    N.B. each shard's score must be independent of the others', so it is a
+         cryptographic hash of the shard and the uuid together (the scores
+         of a CRC seeded with the shard are correlated, skewing placement)
+
+    """
+
+    def __init__(self):
+        self.urls: list[str] = []
+
+    def configure(self, urls: list[str]):
+        self.urls = list(urls)
+
+    @property
+    def count(self) -> int:
+        return max(len(self.urls), 1)
+
+    def shard_for(self, thread_uuid: str) -> int:
+        """
+        shard_for
+
+        Returns the index of the shard holding a Thread
+
+        """
+        if self.count == 1:
+            return 0
+        return max(range(self.count), key=lambda index: _score(index, thread_uuid))
+
+
+def _score(index: int, thread_uuid: str) -> int:
+    # the rendezvous score of a shard for a Thread
+    digest = blake2b(f"{index}:{thread_uuid}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+shard_map = ShardMap()
+
+
+def split_shard(shard: str, default_dbname: str) -> tuple[str, str]:
+    """
+    split_shard
+
+    Splits a shard given as "host:port/dbname" (or just "host:port", for a
+    database named as the first shard's) into its host and database name
+
+    """
+    host, _, dbname = shard.partition("/")
+    return host, dbname or default_dbname
+
+
+# N.B. neomodel's connection is per thread, so each thread keeps its own
+#      driver for each shard
+_connections = local()
+
+
+def _connect(url: str) -> tuple:
+    drivers = _connections.__dict__.setdefault("drivers", {})
+    if url not in drivers:
+        db.set_connection(url)
+        drivers[url] = (db.url, db.driver, db._database_name)
+    return drivers[url]
+
+
+@contextmanager
+def use_shard(index: int | None) -> Iterator[None]:
+    """
+    use_shard
+
+    Sends the queries made within the block (in this thread) to a shard
+
+    N.B. with a single database, or if index is None, the connection is
+         left as it is
+
+    Input:
+        index - the index of the shard
+
+    """
+    if index is None or len(shard_map.urls) < 2:
+        yield
+        return
+
+    if db._active_transaction is not None:
+        raise RuntimeError("Cannot switch shards within a transaction")
+
+    previous = (db.url, db.driver, db._database_name) if db.url else None
+    previous_shard = current_shard()
+    db.url, db.driver, db._database_name = _connect(shard_map.urls[index])
+    _connections.shard = index
+
+    try:
+        yield
+    finally:
+        db.url, db.driver, db._database_name = previous or _connect(shard_map.urls[0])
+        _connections.shard = previous_shard
+
+
+def current_shard() -> int:
+    """
+    current_shard
+
+    Returns the index of the shard queries made (in this thread) are sent to
+
+    """
+    return getattr(_connections, "shard", 0)
+
+
+def close_connections():
+    """
+    close_connections
+
+    Closes the drivers opened by this thread (to every shard), e.g. before
+    a short-lived thread ends
+
+    """
+    drivers = [
+        driver for _, driver, _ in _connections.__dict__.pop("drivers", {}).values()
+    ]
+    if db.driver is not None and db.driver not in drivers:
+        drivers.append(db.driver)
+
+    for driver in drivers:
+        driver.close()
+
+    db.url, db.driver = None, None
+
+
+def replicate_user(user: dict):
+    """
+    replicate_user
+
+    Stores a copy of a User on the current shard, with the same uuid, so
+    that Threads and Replies there can refer to its author and voters
+
+    Input:
+        user - uuid, name and created_at
+
+    """
+    query = """\
+        MERGE
+            (u:User {uuid: $uuid})
+        ON CREATE SET
+            u.name = $name,
+            u.created_at = $created_at,
+            u.updated_at = $created_at
+        """
+    params = {
+        "uuid": user["uuid"],
+        "name": user["name"],
+        "created_at": User.created_at.deflate(user["created_at"]),
+    }
+    db.cypher_query(query, params)
@@ -0,0 +1,91 @@
+# services/singleflight.py
+# services for coalescing concurrent identical reads into a single fetch
+
+import asyncio
+
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass
+class SingleFlightStats:
+    name: str
+    requests: int = 0  # calls made to the group
+    executions: int = 0  # fetches actually run against the database
+    coalesced: int = 0  # calls that shared a fetch already in flight
+    in_flight: int = 0  # fetches currently running
+
+
+class SingleFlight:
+    """
+    SingleFlight
+
+    Ensures that, for each key, at most one fetch is in flight at a time:
+    callers arriving while a fetch for their key is running wait for (and
+    share) its result rather than starting another.
+
+    N.B. results are never cached; once a fetch completes, the next caller
+         for that key starts a new one, so no stale data are served.
+
+    """
+
+    def __init__(self, name: str):
+        self.stats = SingleFlightStats(name=name)
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Any], *args) -> Any:
+        """
+        do
+
+        Runs func(*args) in a worker thread, unless a call with the same
+        key is already in flight, in which case its result is shared
+
+        Inputs:
+            key - identifies calls that are interchangeable
+            func - a (blocking) function that fetches the data
+            args - the arguments to func
+
+        Output:
+            result - the return value of func (or its exception is raised)
+
+        """
+        self.stats.requests += 1
+
+        future = self._in_flight.get(key)
+
+        if future is None:
+            self.stats.executions += 1
+            # run as a separate task, so that a caller disconnecting does
+            # not cancel the fetch for everyone else
+            future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._release(key, done))
+        else:
+            self.stats.coalesced += 1
+
+        self.stats.in_flight = len(self._in_flight)
+
+        return await asyncio.shield(future)
+
+    def _release(self, key: Hashable, future: asyncio.Future):
+        del self._in_flight[key]
+        self.stats.in_flight = len(self._in_flight)
+        if not future.cancelled():
+            future.exception()  # marks an error as retrieved, even if unawaited
+
+
+groups: dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """
+    single_flight
+
+    Returns the named SingleFlight group, creating it if need be
+
+    """
+    if name not in groups:
+        groups[name] = SingleFlight(name)
+
+    return groups[name]
@@ -0,0 +1,435 @@
+# services/stats.py
+# services for computing and maintaining Thread summary statistics
+
+from neomodel import db
+
+from src.models import Thread
+from src.schemas import ThreadStats
+
+# aggregates over the whole IN_REPLY_TO subtree of a Thread in one pass
+THREAD_STATS_QUERY = """\
+    MATCH
+        (t:Thread {uuid: $uuid})
+    OPTIONAL MATCH
+        (t)-[:AUTHORED_BY]->(thread_author:User)
+    OPTIONAL MATCH
+        path = (r:Reply)-[:IN_REPLY_TO*]->(t)
+    OPTIONAL MATCH
+        (r)-[:AUTHORED_BY]->(reply_author:User)
+    WITH
+        t,
+        thread_author,
+        count(DISTINCT r) AS reply_count,
+        collect(DISTINCT reply_author.uuid) AS reply_authors,
+        coalesce(max(length(path)), 0) AS max_depth,
+        max(r.created_at) AS last_reply_at
+    WITH
+        t,
+        reply_count,
+        max_depth,
+        size([a IN reply_authors WHERE a <> thread_author.uuid])
+            + CASE WHEN thread_author IS NULL THEN 0 ELSE 1 END
+            AS participant_count,
+        CASE
+            WHEN last_reply_at > t.updated_at THEN last_reply_at
+            ELSE t.updated_at
+        END AS last_activity_at
+    """
+
+# the deepest level of a Thread with any Replies, given the number of Replies
+# at each depth (from 1)
+DEEPEST = """\
+reduce(
+            deepest = 0, i IN range(1, size({0}))
+            | CASE WHEN {0}[i - 1] > 0 THEN i ELSE deepest END
+        )"""
+
+# counts the new Reply into its Thread's counters (N.B. must run after the
+# Reply has been connected to its parent and author). Whether its author is
+# a new participant is a single lookup of their PARTICIPATED_IN relationship.
+REPLY_CREATED_QUERY = f"""\
+    MATCH
+        path = (r:Reply {{uuid: $uuid}})-[:IN_REPLY_TO*]->(t:Thread)
+    MATCH
+        (r)-[:AUTHORED_BY]->(u:User)
+    WITH
+        r, t, u, length(path) AS depth
+    WHERE
+        t.reply_count IS NOT NULL
+    MERGE
+        (u)-[p:PARTICIPATED_IN]->(t)
+    ON CREATE SET
+        p.replies = 0
+    SET
+        p.replies = p.replies + 1
+    WITH
+        r, t, depth, coalesce(t.reply_depths, []) AS depths,
+        p.replies = 1 AND NOT EXISTS {{ (t)-[:AUTHORED_BY]->(u) }} AS new_participant
+    WITH
+        r, t, depth, depths, new_participant,
+        CASE WHEN depth > size(depths) THEN depth ELSE size(depths) END AS levels
+    WITH
+        r, t, new_participant,
+        [
+            i IN range(1, levels)
+            | coalesce(depths[i - 1], 0) + CASE WHEN i = depth THEN 1 ELSE 0 END
+        ] AS depths
+    SET
+        t.reply_count = t.reply_count + 1,
+        t.reply_depths = depths,
+        t.max_depth = {DEEPEST.format("depths")},
+        t.participant_count = t.participant_count
+            + CASE WHEN new_participant THEN 1 ELSE 0 END,
+        t.last_activity_at = r.created_at
+    RETURN
+        t.uuid
+    """
+
+# counts a batch of new Replies ($uuids) of a Thread into its counters at
+# once (N.B. as REPLY_CREATED_QUERY, touching only the new Replies)
+REPLIES_CREATED_QUERY = f"""\
+    MATCH
+        (t:Thread {{uuid: $thread}})
+    WHERE
+        t.reply_count IS NOT NULL
+    CALL {{
+        WITH t
+        UNWIND $uuids AS uuid
+        MATCH
+            path = (r:Reply {{uuid: uuid}})-[:IN_REPLY_TO*]->(t)
+        RETURN
+            collect(length(path)) AS added_depths,
+            max(r.created_at) AS last_reply_at
+    }}
+    CALL {{
+        WITH t
+        UNWIND $uuids AS uuid
+        MATCH
+            (:Reply {{uuid: uuid}})-[:AUTHORED_BY]->(u:User)
+        WITH
+            t, u, count(*) AS replies
+        MERGE
+            (u)-[p:PARTICIPATED_IN]->(t)
+        ON CREATE SET
+            p.replies = 0
+        SET
+            p.replies = p.replies + replies
+        WITH
+            p.replies = replies AND NOT EXISTS {{ (t)-[:AUTHORED_BY]->(u) }}
+                AS new_participant
+        RETURN
+            sum(CASE WHEN new_participant THEN 1 ELSE 0 END) AS new_participants
+    }}
+    WITH
+        t, added_depths, last_reply_at, new_participants,
+        coalesce(t.reply_depths, []) AS depths
+    WITH
+        t, added_depths, last_reply_at, new_participants, depths,
+        reduce(
+            levels = size(depths), d IN added_depths
+            | CASE WHEN d > levels THEN d ELSE levels END
+        ) AS levels
+    WITH
+        t, added_depths, last_reply_at, new_participants,
+        [
+            i IN range(1, levels)
+            | coalesce(depths[i - 1], 0) + size([d IN added_depths WHERE d = i])
+        ] AS depths
+    SET
+        t.reply_count = t.reply_count + size(added_depths),
+        t.reply_depths = depths,
+        t.max_depth = {DEEPEST.format("depths")},
+        t.participant_count = t.participant_count + new_participants,
+        t.last_activity_at = coalesce(last_reply_at, t.last_activity_at)
+    RETURN
+        t.uuid
+    """
+
+# counts a Reply about to be deleted, and the Replies below it (which are
+# orphaned by its deletion), out of its Thread's counters, touching only
+# those Replies
+REPLY_DELETED_QUERY = f"""\
+    MATCH
+        path = (r:Reply {{uuid: $uuid}})-[:IN_REPLY_TO*]->(t:Thread)
+    WHERE
+        t.reply_count IS NOT NULL
+    WITH
+        r, t, length(path) AS depth
+    MATCH
+        below = (s:Reply)-[:IN_REPLY_TO*0..]->(r)
+    WITH
+        t, collect(s) AS removed, collect(depth + length(below)) AS removed_depths
+    CALL {{
+        WITH t, removed
+        UNWIND removed AS s
+        MATCH
+            (s)-[:AUTHORED_BY]->(u:User)
+        WITH
+            t, u, count(*) AS replies
+        MATCH
+            (u)-[p:PARTICIPATED_IN]->(t)
+        SET
+            p.replies = p.replies - replies
+        WITH
+            t, u, p
+        WHERE
+            p.replies <= 0
+        WITH
+            p, EXISTS {{ (t)-[:AUTHORED_BY]->(u) }} AS is_author
+        DELETE
+            p
+        RETURN
+            sum(CASE WHEN is_author THEN 0 ELSE 1 END) AS departed
+    }}
+    WITH
+        t, removed, departed,
+        [
+            i IN range(1, size(coalesce(t.reply_depths, [])))
+            | t.reply_depths[i - 1] - size([d IN removed_depths WHERE d = i])
+        ] AS depths
+    SET
+        t.reply_count = t.reply_count - size(removed),
+        t.reply_depths = depths,
+        t.max_depth = {DEEPEST.format("depths")},
+        t.participant_count = t.participant_count - departed
+    RETURN
+        t.uuid
+    """
+
+# recreates the PARTICIPATED_IN relationships and Reply depth counts of a
+# Thread (appended to THREAD_STATS_QUERY)
+THREAD_TRACKING_QUERY = """\
+    CALL {
+        WITH t
+        MATCH
+            (:User)-[p:PARTICIPATED_IN]->(t)
+        DELETE
+            p
+    }
+    CALL {
+        WITH t
+        MATCH
+            (t)<-[:IN_REPLY_TO*]-(:Reply)-[:AUTHORED_BY]->(u:User)
+        WITH
+            t, u, count(*) AS replies
+        CREATE
+            (u)-[:PARTICIPATED_IN {replies: replies}]->(t)
+    }
+    CALL {
+        WITH t
+        MATCH
+            path = (:Reply)-[:IN_REPLY_TO*]->(t)
+        WITH
+            length(path) AS depth, count(*) AS replies
+        RETURN
+            collect([depth, replies]) AS depth_counts
+    }
+    WITH
+        t, reply_count, participant_count, max_depth, last_activity_at,
+        [
+            i IN range(1, max_depth)
+            | coalesce(head([c IN depth_counts WHERE c[0] = i | c[1]]), 0)
+        ] AS reply_depths
+    """
+
+
+# computes a Thread's statistics
+READ_THREAD_STATS_QUERY = f"""\
+    {THREAD_STATS_QUERY}
+    RETURN
+        reply_count, participant_count, max_depth, last_activity_at
+    """
+
+# recomputes a Thread's statistics and stores them as its counters
+STORE_THREAD_STATS_QUERY = f"""\
+    {THREAD_STATS_QUERY}
+    {THREAD_TRACKING_QUERY}
+    SET
+        t.reply_depths = reply_depths,
+        t.reply_count = reply_count,
+        t.participant_count = participant_count,
+        t.max_depth = max_depth,
+        t.last_activity_at = last_activity_at
+    RETURN
+        reply_count, participant_count, max_depth, last_activity_at
+    """
+
+# the Thread a Reply belongs to
+THREAD_OF_REPLY_QUERY = (
+    "MATCH (:Reply {uuid: $uuid})-[:IN_REPLY_TO*]->(t:Thread) RETURN t.uuid"
+)
+
+
+def _to_stats(row: list) -> ThreadStats:
+    reply_count, participant_count, max_depth, last_activity_at = row
+    return ThreadStats(
+        reply_count=reply_count,
+        participant_count=participant_count,
+        max_depth=max_depth,
+        last_activity_at=Thread.last_activity_at.inflate(last_activity_at),
+    )
+
+
+def thread_stats(uuid: str) -> ThreadStats:
+    """
+    thread_stats
+
+    Computes the summary statistics of a Thread with a single aggregation
+    over its reply subtree
+
+    Input:
+        uuid - the uuid of the Thread
+
+    Output:
+        stats
+
+    """
+    results, _ = db.cypher_query(READ_THREAD_STATS_QUERY, {"uuid": uuid})
+
+    if not results:
+        raise Thread.DoesNotExist(repr({"uuid": uuid}))
+
+    return _to_stats(results[0])
+
+
+def stored_stats(counters: dict) -> ThreadStats | None:
+    """
+    stored_stats
+
+    Returns the incrementally maintained statistics of a Thread, or None
+    if they have never been initialised (i.e. for legacy Threads, whose
+    counters are initialised when one of their Replies is next created or
+    deleted)
+
+    Input:
+        counters - the Thread's properties (at least the counters and
+                   updated_at)
+
+    Output:
+        stats
+
+    """
+    if counters["reply_count"] is None:
+        return None
+
+    # edits to the Thread itself count as activity, too
+    last_activity_at = max(
+        counters["updated_at"],
+        counters["last_activity_at"] or counters["updated_at"],
+    )
+
+    return ThreadStats(
+        reply_count=counters["reply_count"],
+        participant_count=counters["participant_count"],
+        max_depth=counters["max_depth"],
+        last_activity_at=last_activity_at,
+    )
+
+
+def store_thread_stats(uuid: str) -> ThreadStats:
+    """
+    store_thread_stats
+
+    Recomputes the statistics of a Thread and stores them as its counters,
+    along with what is kept to maintain them (see REPLY_CREATED_QUERY)
+
+    Input:
+        uuid - the uuid of the Thread
+
+    Output:
+        stats
+
+    """
+    results, _ = db.cypher_query(STORE_THREAD_STATS_QUERY, {"uuid": uuid})
+
+    if not results:
+        raise Thread.DoesNotExist(repr({"uuid": uuid}))
+
+    return _to_stats(results[0])
+
+
+def record_reply_created(reply_uuid: str) -> str | None:
+    """
+    record_reply_created
+
+    Updates the counters of the Thread a new Reply belongs to
+
+    N.B. should run in the same transaction as the creation of the Reply,
+         after it has been connected to its parent and author
+
+    Input:
+        reply_uuid - the uuid of the new Reply
+
+    Output:
+        thread_uuid - the uuid of the Thread the Reply belongs to
+
+    """
+    results, _ = db.cypher_query(REPLY_CREATED_QUERY, {"uuid": reply_uuid})
+
+    if results:
+        return results[0][0]
+
+    # the Thread's counters have never been initialised, so compute them
+    thread_uuid = thread_of_reply(reply_uuid)
+    if thread_uuid is not None:
+        store_thread_stats(thread_uuid)
+
+    return thread_uuid
+
+
+def record_replies_created(thread_uuid: str, reply_uuids: list[str]):
+    """
+    record_replies_created
+
+    Updates the counters of a Thread for a batch of new Replies in it
+
+    N.B. should run in the same transaction as the creation of the Replies,
+         after they have been connected to their parents and authors
+
+    Inputs:
+        thread_uuid - the uuid of the Thread
+        reply_uuids - the uuids of the new Replies
+
+    """
+    results, _ = db.cypher_query(
+        REPLIES_CREATED_QUERY, {"thread": thread_uuid, "uuids": reply_uuids}
+    )
+
+    if not results:
+        # the Thread's counters have never been initialised, so compute them
+        store_thread_stats(thread_uuid)
+
+
+def record_reply_deleted(reply_uuid: str) -> str | None:
+    """
+    record_reply_deleted
+
+    Updates the counters of the Thread a Reply about to be deleted belongs
+    to, removing it and the Replies below it (which its deletion orphans)
+
+    N.B. should run in the same transaction as the deletion of the Reply,
+         before it is deleted
+
+    Input:
+        reply_uuid - the uuid of the Reply
+
+    Output:
+        thread_uuid - the uuid of the Thread the Reply belongs to, if its
+                      counters were updated (None if they have never been
+                      initialised, or the Reply is already orphaned)
+
+    """
+    results, _ = db.cypher_query(REPLY_DELETED_QUERY, {"uuid": reply_uuid})
+    return results[0][0] if results else None
+
+
+def thread_of_reply(reply_uuid: str) -> str | None:
+    """
+    thread_of_reply
+
+    Returns the uuid of the Thread a Reply belongs to (None if the Reply
+    has been orphaned, e.g. by the deletion of one of its ancestors)
+
+    """
+    results, _ = db.cypher_query(THREAD_OF_REPLY_QUERY, {"uuid": reply_uuid})
+    return results[0][0] if results else None
@@ -0,0 +1,65 @@
+# services/streaming.py
+# services for sending large JSON responses a chunk at a time
+
+import json
+
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+# items encoded per chunk sent (each chunk is compressed and flushed as a whole)
+CHUNK_ITEMS = 100
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_array_chunks(
+    items: Iterable, chunk_items: int = CHUNK_ITEMS
+) -> Iterator[bytes]:
+    """
+    json_array_chunks
+
+    Encodes items as a JSON array, a chunk of them at a time, so that the
+    start of the array can be sent before the rest has been encoded
+
+    Inputs:
+        items - values that can be encoded as JSON (e.g. with jsonable_encoder)
+        chunk_items - the number of items per chunk
+
+    Output:
+        chunks - the encoded array, in parts
+
+    """
+    items = iter(items)
+    separator = "["
+
+    while chunk := list(islice(items, chunk_items)):
+        yield (separator + ",".join(_dumps(item) for item in chunk)).encode()
+        separator = ","
+
+    yield b"[]" if separator == "[" else b"]"
+
+
+def json_object_chunks(
+    head: dict, key: str, items: Iterable, chunk_items: int = CHUNK_ITEMS
+) -> Iterator[bytes]:
+    """
+    json_object_chunks
+
+    Encodes a JSON object whose last property (key) is a long array, the
+    array a chunk of items at a time
+
+    Inputs:
+        head - the other properties of the object
+        key - the name of the array
+        items - the values in the array
+        chunk_items - the number of items per chunk
+
+    Output:
+        chunks - the encoded object, in parts
+
+    """
+    yield (_dumps(head)[:-1] + ("," if head else "") + _dumps(key) + ":").encode()
+    yield from json_array_chunks(items, chunk_items)
+    yield b"}"
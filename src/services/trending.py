@@ -0,0 +1,255 @@
+# services/trending.py
+# services for ranking Threads by their recent activity
+
+import heapq
+
+from collections import Counter
+from operator import itemgetter
+from threading import Lock
+from time import time
+
+from neomodel import db
+
+# how much each kind of event counts towards a Thread's trending score
+TREND_WEIGHTS = {"reply": 2.0, "upvote": 1.0}
+
+# every upvote (of a Thread or of a Reply in it) and Reply created since $since,
+# attributed to its Thread
+RECENT_ACTIVITY_QUERY = """\
+    MATCH
+        (t:Thread)-[v:UPVOTED_BY]->()
+    WHERE
+        v.upvoted_at >= $since
+    RETURN
+        t.uuid AS thread, 'upvote' AS kind, v.upvoted_at AS at
+    UNION ALL
+    MATCH
+        (r:Reply)-[v:UPVOTED_BY]->()
+    WHERE
+        v.upvoted_at >= $since
+    MATCH
+        (r)-[:IN_REPLY_TO*]->(t:Thread)
+    RETURN
+        t.uuid AS thread, 'upvote' AS kind, v.upvoted_at AS at
+    UNION ALL
+    MATCH
+        (r:Reply)
+    WHERE
+        r.created_at >= $since
+    MATCH
+        (r)-[:IN_REPLY_TO*]->(t:Thread)
+    RETURN
+        t.uuid AS thread, 'reply' AS kind, r.created_at AS at
+    """
+
+
+class TrendingThreads:
+    """
+    TrendingThreads
+
+    Keeps the weighted number of events (upvotes and Replies) per Thread over
+    a sliding window, as a ring of fixed-width buckets: recording an event
+    adds to the current bucket, and buckets leaving the window are subtracted
+    from the running totals as a whole.
+
+    The top Threads are kept in a cache (of `capacity` entries), recomputed
+    with a heap only when something has changed since it was last read, so
+    most reads cost no more than slicing a list.
+
+    At most `tracked` Threads are scored: past that, the lowest scoring
+    tenth of them is dropped, so memory stays bounded even if the rankings
+    are never read.
+
+    N.B. each process ranks the events it has seen (plus those it loaded
+         when it was rebuilt), so with several workers rankings are
+         approximate
+
+    """
+
+    def __init__(
+        self,
+        window: float = 3600.0,
+        buckets: int = 60,
+        capacity: int = 100,
+        tracked: int = 10_000,
+    ):
+        self._lock = Lock()
+        self.configure(window, buckets, capacity, tracked)
+
+    def configure(
+        self, window: float, buckets: int, capacity: int, tracked: int = 10_000
+    ):
+        with self._lock:
+            self.window = window
+            self.n_buckets = buckets
+            self.bucket_width = window / buckets
+            self.capacity = capacity
+            self.tracked = max(tracked, capacity)
+            self._clear()
+
+    def _clear(self):
+        self._buckets: dict[int, Counter] = {}  # bucket -> Thread -> score
+        self._totals: Counter = Counter()  # Thread -> score over the window
+        self._top: list[tuple[str, float]] = []
+        self._dirty = False
+        self._current: int | None = None  # the bucket last expired up to
+
+    def _bucket(self, at: float) -> int:
+        return int(at // self.bucket_width)
+
+    def _expire(self, now: float):
+        current = self._bucket(now)
+        if current == self._current:
+            return  # N.B. nothing has left the window since the last call
+
+        self._current = current
+        oldest = current - self.n_buckets + 1
+        expired = [bucket for bucket in self._buckets if bucket < oldest]
+        for bucket in expired:
+            self._totals.subtract(self._buckets.pop(bucket))
+
+        if expired:
+            self._totals = +self._totals  # drops Threads without recent events
+            self._dirty = True
+
+    def _evict(self):
+        keep = self.tracked - self.tracked // 10
+        evicted = heapq.nsmallest(
+            len(self._totals) - keep, self._totals, key=self._totals.__getitem__
+        )
+
+        for thread in evicted:
+            del self._totals[thread]
+        for bucket in self._buckets.values():
+            for thread in evicted:
+                bucket.pop(thread, None)
+
+    def record(self, thread: str, kind: str, at: float | None = None):
+        """
+        record
+
+        Counts an event towards a Thread's trending score
+
+        Inputs:
+            thread - the uuid of the Thread
+            kind - the kind of event (see TREND_WEIGHTS)
+            at - when the event happened (defaults to now)
+
+        """
+        now = time()
+        at = now if at is None else at
+
+        if kind not in TREND_WEIGHTS or at <= now - self.window:
+            return
+
+        with self._lock:
+            self._expire(now)
+
+            bucket = self._buckets.setdefault(self._bucket(at), Counter())
+            bucket[thread] += TREND_WEIGHTS[kind]
+            self._totals[thread] += TREND_WEIGHTS[kind]
+            self._dirty = True
+
+            if len(self._totals) > self.tracked:
+                self._evict()
+
+    def withdraw(self, thread: str, kind: str, at: float):
+        """
+        withdraw
+
+        Takes back an event (e.g. a withdrawn upvote) counted towards a
+        Thread's trending score, if it is still in the window
+
+        Inputs:
+            thread - the uuid of the Thread
+            kind - the kind of event (see TREND_WEIGHTS)
+            at - when the event withdrawn happened
+
+        """
+        if kind not in TREND_WEIGHTS:
+            return
+
+        with self._lock:
+            bucket = self._buckets.get(self._bucket(at))
+            if bucket is None or bucket[thread] <= 0:
+                return  # N.B. no longer counted
+
+            weight = min(TREND_WEIGHTS[kind], bucket[thread])
+            bucket[thread] -= weight
+            self._totals[thread] -= weight
+            self._totals = +self._totals
+            self._dirty = True
+
+    def forget(self, thread: str):
+        """
+        forget
+
+        Removes a (deleted) Thread from the rankings
+
+        """
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.pop(thread, None)
+            self._totals.pop(thread, None)
+            self._dirty = True
+
+    def top(self, limit: int) -> list[tuple[str, float]]:
+        """
+        top
+
+        Returns the Threads with the most activity in the window
+
+        Input:
+            limit - the number of Threads to return (at most `capacity`)
+
+        Output:
+            trending - (uuid, score) pairs, highest score first
+
+        """
+        with self._lock:
+            self._expire(time())
+
+            if self._dirty:
+                self._top = heapq.nlargest(
+                    self.capacity, self._totals.items(), key=itemgetter(1)
+                )
+                self._dirty = False
+
+            return self._top[:limit]
+
+    def rebuild(self, events: list[tuple[str, str, float]]):
+        """
+        rebuild
+
+        Replaces the rankings with those implied by a list of past events
+
+        Input:
+            events - (Thread uuid, kind, timestamp) triples
+
+        """
+        with self._lock:
+            self._clear()
+
+        for thread, kind, at in events:
+            self.record(thread, kind, at)
+
+
+def recent_activity(since: float) -> list[tuple[str, str, float]]:
+    """
+    recent_activity
+
+    Reads the upvotes and Replies since a given time from the graph, using
+    the indexes on upvoted_at and created_at
+
+    Input:
+        since - seconds since the epoch
+
+    Output:
+        events - (Thread uuid, kind, timestamp) triples
+
+    """
+    results, _ = db.cypher_query(RECENT_ACTIVITY_QUERY, {"since": since})
+    return [tuple(row) for row in results]
+
+
+trending = TrendingThreads()
@@ -0,0 +1,528 @@
+# services/votes.py
+# services for recording votes without contention on heavily voted nodes
+
+from threading import Event, Lock
+from threading import Thread as BackgroundThread
+from time import monotonic, time
+
+from neomodel import db
+
+from src.models import UpvotableNode, User
+from src.services.logs import logger
+from src.services.sessions import write_transaction
+from src.services.shards import shard_map, use_shard
+
+# the relationship manager recording each kind of vote
+VOTERS = {"up": "upvoters", "down": "downvoters"}
+
+
+class WriteRateTracker:
+    """
+    WriteRateTracker
+
+    Estimates the recent write rate of each key with a sliding window
+    counter: the count for the current window plus a share of the count
+    for the previous one, in proportion to how much of it still overlaps
+    the sliding window. Uses constant memory per key.
+
+    """
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+        self._lock = Lock()
+        # key -> [start of current window, current count, previous count]
+        self._counts: dict[str, list] = {}
+
+    def record(self, key: str, now: float | None = None) -> float:
+        """
+        record
+
+        Counts a write to key
+
+        Inputs:
+            key - identifies what was written to
+            now - the current (monotonic) time, for testing
+
+        Output:
+            rate - the estimated writes per second to key, including this one
+
+        """
+        now = monotonic() if now is None else now
+
+        with self._lock:
+            start, current, previous = self._counts.get(key, (now, 0, 0))
+
+            if now - start >= 2 * self.window:
+                start, current, previous = now, 0, 0
+            elif now - start >= self.window:
+                start, current, previous = start + self.window, 0, current
+
+            current += 1
+            self._counts[key] = [start, current, previous]
+
+            overlap = 1 - (now - start) / self.window
+
+            return (current + previous * overlap) / self.window
+
+    def prune(self, now: float | None = None):
+        """
+        prune
+
+        Forgets keys that have not been written to for two windows
+
+        """
+        now = monotonic() if now is None else now
+
+        with self._lock:
+            for key in [
+                key
+                for key, (start, _, _) in self._counts.items()
+                if now - start >= 2 * self.window
+            ]:
+                del self._counts[key]
+
+
+class VoteRecorder:
+    """
+    VoteRecorder
+
+    Records votes either directly, as UPVOTED_BY/DOWNVOTED_BY relationships,
+    or (for nodes receiving votes faster than `hot_rate` per second) as
+    append-only :VoteEvent nodes, which are rolled up into relationships in
+    batches by a background thread.
+
+    Creating a relationship write-locks the voted node, so concurrent votes
+    on one node are serialised; creating a free-standing event node does not
+    lock it, so votes on a hot node no longer wait for one another. The
+    roll-up then takes the lock once per batch, rather than once per vote.
+
+    N.B. while a vote is pending, counts read with vote_counts include it,
+         but other reads only see it once it has been rolled up
+
+    """
+
+    def __init__(self):
+        self.hot_rate = 20.0
+        self.interval = 1.0
+        self.batch_size = 5000
+        self.tracker = WriteRateTracker()
+        self._stop = Event()
+        self._worker: BackgroundThread | None = None
+
+    def configure(self, hot_rate: float, interval: float, batch_size: int):
+        self.hot_rate = hot_rate
+        self.interval = interval
+        self.batch_size = batch_size
+
+    def record(self, node: UpvotableNode, user: User, kind: str, cast: bool):
+        """
+        record
+
+        Casts (or withdraws) a user's vote on a Thread or Reply
+
+        N.B. once a user has a pending vote event for a node, their later
+             votes on it are recorded as events too, so that they are
+             applied in order
+
+        Inputs:
+            node - the Thread or Reply voted on
+            user - the User voting
+            kind - "up" or "down"
+            cast - True to cast the vote, False to withdraw it
+
+        """
+        rate = self.tracker.record(node.uuid)
+
+        if rate >= self.hot_rate or has_pending_votes(node.uuid, user.uuid):
+            append_vote_event(node.uuid, user.uuid, kind, cast)
+        elif cast:
+            getattr(node, VOTERS[kind]).connect(user)
+        else:
+            getattr(node, VOTERS[kind]).disconnect(user)
+
+    def start(self):
+        """
+        start
+
+        Starts rolling up pending vote events in the background, every
+        `interval` seconds
+
+        """
+        if self._worker is not None:
+            return
+
+        self._stop.clear()
+        self._worker = BackgroundThread(
+            target=self._run, name="vote-roll-up", daemon=True
+        )
+        self._worker.start()
+
+    def stop(self):
+        """
+        stop
+
+        Stops the background roll-up (after one last pass)
+
+        """
+        if self._worker is None:
+            return
+
+        self._stop.set()
+        self._worker.join()
+        self._worker = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            for shard in range(shard_map.count):
+                try:
+                    with use_shard(shard):
+                        while roll_up_votes(self.batch_size) == self.batch_size:
+                            pass
+                except Exception as exc:
+                    logger.error(f"Failed to roll up vote events: {exc}")
+            self.tracker.prune()
+            if stopping:
+                return
+
+
+# whether a User has votes on a node pending roll-up
+HAS_PENDING_VOTES_QUERY = """\
+    RETURN EXISTS {
+        MATCH (:VoteEvent {target: $target, user: $user})
+    }
+    """
+
+
+def has_pending_votes(target: str, user: str) -> bool:
+    """
+    has_pending_votes
+
+    Checks whether a user has votes on a node that are yet to be rolled up
+
+    """
+    results, _ = db.cypher_query(
+        HAS_PENDING_VOTES_QUERY, {"target": target, "user": user}
+    )
+    return results[0][0]
+
+
+def append_vote_event(target: str, user: str, kind: str, cast: bool):
+    """
+    append_vote_event
+
+    Records a vote as a :VoteEvent node, to be rolled up later
+
+    Inputs:
+        target - the uuid of the Thread or Reply voted on
+        user - the uuid of the User voting
+        kind - "up" or "down"
+        cast - True to cast the vote, False to withdraw it
+
+    """
+    query = """\
+        CREATE
+            (:VoteEvent {
+                target: $target, user: $user, kind: $kind, cast: $cast, at: $at
+            })
+        """
+    params = {"target": target, "user": user, "kind": kind, "cast": cast, "at": time()}
+    db.cypher_query(query, params)
+
+
+def roll_up_votes(batch_size: int) -> int:
+    """
+    roll_up_votes
+
+    Applies the oldest pending vote events to the graph (creating or deleting
+    vote relationships) and removes them, in a single transaction
+
+    N.B. only the latest event per user, node and kind of vote matters, so
+         e.g. a vote cast and withdrawn within a batch is never written
+
+    Input:
+        batch_size - the maximum number of events to apply
+
+    Output:
+        n_events - the number of events applied
+
+    """
+    with write_transaction():
+        results, _ = db.cypher_query(
+            """\
+            MATCH
+                (e:VoteEvent)
+            RETURN
+                elementId(e), e.target, e.user, e.kind, e.cast, e.at
+            ORDER BY
+                e.at
+            LIMIT
+                $batch_size
+            """,
+            {"batch_size": batch_size},
+        )
+        if not results:
+            return 0
+
+        latest = {}
+        for _, target, user, kind, cast, at in results:
+            latest[(target, user, kind)] = {
+                "target": target,
+                "user": user,
+                "kind": kind,
+                "cast": cast,
+                "at": at,
+            }
+
+        db.cypher_query(
+            """\
+            UNWIND $votes AS vote
+            MATCH
+                (n:Thread|Reply {uuid: vote.target})
+            MATCH
+                (u:User {uuid: vote.user})
+            CALL {
+                WITH n, u, vote
+                WITH * WHERE vote.cast AND vote.kind = 'up'
+                MERGE (n)-[r:UPVOTED_BY]->(u)
+                ON CREATE SET r.upvoted_at = vote.at
+            }
+            CALL {
+                WITH n, u, vote
+                WITH * WHERE vote.cast AND vote.kind = 'down'
+                MERGE (n)-[r:DOWNVOTED_BY]->(u)
+                ON CREATE SET r.downvoted_at = vote.at
+            }
+            CALL {
+                WITH n, u, vote
+                WITH * WHERE NOT vote.cast
+                MATCH (n)-[r:UPVOTED_BY|DOWNVOTED_BY]->(u)
+                WHERE (type(r) = 'UPVOTED_BY') = (vote.kind = 'up')
+                DELETE r
+            }
+            """,
+            {"votes": list(latest.values())},
+        )
+        db.cypher_query(
+            "MATCH (e:VoteEvent) WHERE elementId(e) IN $ids DELETE e",
+            {"ids": [row[0] for row in results]},
+        )
+
+    return len(results)
+
+
+def vote_counts_query(label: str) -> str:
+    """
+    vote_counts_query
+
+    Returns the query vote_counts runs for a Thread or Reply (by label)
+
+    """
+    return f"""\
+        MATCH
+            (n:{label} {{uuid: $uuid}})
+        CALL {{
+            WITH n
+            MATCH
+                (e:VoteEvent {{target: n.uuid}})
+            WITH
+                n, e
+            ORDER BY
+                e.at
+            WITH
+                n, e.user AS user, e.kind AS kind, last(collect(e.cast)) AS cast
+            WITH
+                kind,
+                cast,
+                CASE kind
+                    WHEN 'up' THEN EXISTS {{ (n)-[:UPVOTED_BY]->(:User {{uuid: user}}) }}
+                    ELSE EXISTS {{ (n)-[:DOWNVOTED_BY]->(:User {{uuid: user}}) }}
+                END AS voted
+            WITH
+                kind, CASE WHEN cast = voted THEN 0 WHEN cast THEN 1 ELSE -1 END AS delta
+            RETURN
+                sum(CASE kind WHEN 'up' THEN delta ELSE 0 END) AS pending_up,
+                sum(CASE kind WHEN 'down' THEN delta ELSE 0 END) AS pending_down
+        }}
+        RETURN
+            COUNT {{ (n)-[:UPVOTED_BY]->() }} + pending_up,
+            COUNT {{ (n)-[:DOWNVOTED_BY]->() }} + pending_down
+        """
+
+
+def vote_counts(node: UpvotableNode) -> tuple[int, int]:
+    """
+    vote_counts
+
+    Counts the votes on a Thread or Reply, including those still pending
+    roll-up
+
+    Input:
+        node - the Thread or Reply
+
+    Output:
+        upvotes, downvotes
+
+    """
+    query = vote_counts_query(node.__label__)
+    results, _ = db.cypher_query(query, {"uuid": node.uuid})
+    upvotes, downvotes = results[0]
+
+    return upvotes, downvotes
+
+
+def vote_state_query(label: str, kind: str) -> str:
+    """
+    vote_state_query
+
+    Returns the query vote_state runs for a kind of vote on a Thread or
+    Reply (by label)
+
+    """
+    relationship, voted_at = {
+        "up": ("UPVOTED_BY", "upvoted_at"),
+        "down": ("DOWNVOTED_BY", "downvoted_at"),
+    }[kind]
+
+    return f"""\
+        MATCH
+            (n:{label} {{uuid: $uuid}})
+        OPTIONAL MATCH
+            (n)-[r:{relationship}]->(:User {{uuid: $user}})
+        OPTIONAL MATCH
+            (e:VoteEvent {{target: $uuid, user: $user, kind: $kind}})
+        WITH
+            r, e
+        ORDER BY
+            e.at DESC
+        LIMIT
+            1
+        RETURN
+            CASE
+                WHEN e IS NULL THEN r.{voted_at}
+                WHEN e.cast THEN coalesce(r.{voted_at}, e.at)
+                ELSE NULL
+            END
+        """
+
+
+def vote_state(node: UpvotableNode, user_uuid: str, kind: str) -> float | None:
+    """
+    vote_state
+
+    Finds when a User's vote of a kind on a Thread or Reply was cast,
+    taking account of their votes still pending roll-up
+
+    Inputs:
+        node - the Thread or Reply
+        user_uuid - the uuid of the User
+        kind - "up" or "down"
+
+    Output:
+        voted_at - seconds since the epoch, or None if they have no such vote
+
+    """
+    query = vote_state_query(node.__label__, kind)
+    results, _ = db.cypher_query(
+        query, {"uuid": node.uuid, "user": user_uuid, "kind": kind}
+    )
+    return results[0][0] if results else None
+
+
+# the Threads with the most (rolled-up) upvotes
+MOST_VOTED_THREADS_QUERY = """\
+    MATCH
+        (t:Thread)
+    WITH
+        t, COUNT { (t)-[:UPVOTED_BY]->() } AS upvotes
+    ORDER BY
+        upvotes DESC
+    LIMIT
+        $limit
+    RETURN
+        t.uuid, upvotes
+    """
+
+
+def most_voted_threads(limit: int) -> list[tuple[str, int]]:
+    """
+    most_voted_threads
+
+    Finds the Threads with the most upvotes (N.B. not counting those still
+    pending roll-up)
+
+    Input:
+        limit - the number of Threads to return
+
+    Output:
+        threads - (uuid, upvotes) of each Thread, most upvoted first
+
+    """
+    results, _ = db.cypher_query(MOST_VOTED_THREADS_QUERY, {"limit": limit})
+    return [(uuid, upvotes) for uuid, upvotes in results]
+
+
+# every vote of a User, rolled up or pending
+USER_VOTES_QUERY = """\
+    MATCH
+        (u:User {uuid: $uuid})
+    CALL {
+        WITH u
+        MATCH
+            (n)-[r:UPVOTED_BY|DOWNVOTED_BY]->(u)
+        RETURN
+            collect([
+                n.uuid, CASE type(r) WHEN 'UPVOTED_BY' THEN 'up' ELSE 'down' END
+            ]) AS voted
+    }
+    CALL {
+        WITH u
+        MATCH
+            (e:VoteEvent {user: u.uuid})
+        WITH
+            e
+        ORDER BY
+            e.at
+        WITH
+            e.target AS target, e.kind AS kind, last(collect(e.cast)) AS cast
+        RETURN
+            collect([target, kind, cast]) AS pending
+    }
+    RETURN
+        voted, pending
+    """
+
+
+def user_votes(user_uuid: str) -> dict[str, list[str]]:
+    """
+    user_votes
+
+    Finds every Thread and Reply a User has voted on, including votes still
+    pending roll-up, in a single query
+
+    Input:
+        user_uuid - the uuid of the User
+
+    Output:
+        votes - {"up": [uuids upvoted], "down": [uuids downvoted]}
+
+    """
+    results, _ = db.cypher_query(USER_VOTES_QUERY, {"uuid": user_uuid})
+    if not results:
+        raise User.DoesNotExist(repr({"uuid": user_uuid}))
+
+    voted, pending = results[0]
+    votes = {tuple(vote) for vote in voted}
+    for target, kind, cast in pending:
+        if cast:
+            votes.add((target, kind))
+        else:
+            votes.discard((target, kind))
+
+    return {
+        kind: [uuid for uuid, voted_kind in votes if voted_kind == kind]
+        for kind in VOTERS
+    }
+
+
+vote_recorder = VoteRecorder()
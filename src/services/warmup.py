@@ -0,0 +1,204 @@
+# services/warmup.py
+# services for warming caches with the hottest Threads before serving traffic
+
+import json
+import os
+
+from collections import Counter
+from queue import Empty, SimpleQueue
+from threading import Lock
+from threading import Thread as BackgroundThread
+from time import monotonic
+
+from src.models import Reply, Thread
+from src.services.logs import logger
+from src.services.projections import THREAD_FIELDS
+from src.services.shards import close_connections
+
+
+class AccessStats:
+    """
+    AccessStats
+
+    Counts the reads of each Thread, keeping the `capacity` most read, and
+    saves them to a file so that the next process to start knows which
+    Threads are hot
+
+    N.B. counts loaded from the file are halved, so that Threads which are
+         no longer read fade from the hot set over a few restarts
+
+    """
+
+    def __init__(self):
+        self.path: str | None = None
+        self.capacity = 1000
+        self._counts: Counter[str] = Counter()
+        self._lock = Lock()
+
+    def configure(self, path: str | None, capacity: int):
+        self.path = path
+        self.capacity = capacity
+
+    def record(self, thread_uuid: str):
+        with self._lock:
+            self._counts[thread_uuid] += 1
+            if len(self._counts) > 2 * self.capacity:
+                self._counts = Counter(dict(self._counts.most_common(self.capacity)))
+
+    def forget(self, thread_uuid: str):
+        with self._lock:
+            self._counts.pop(thread_uuid, None)
+
+    def top(self, n: int) -> list[str]:
+        with self._lock:
+            return [uuid for uuid, _ in self._counts.most_common(n)]
+
+    def load(self):
+        """
+        load
+
+        Adds the counts saved by the previous process (if any)
+
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as stats_file:
+                saved = json.load(stats_file)
+        except (OSError, ValueError) as exc:
+            logger.warning(f"Could not load access stats from {self.path}: {exc}")
+            return
+
+        with self._lock:
+            for uuid, count in saved.items():
+                self._counts[uuid] += count // 2
+
+    def save(self):
+        """
+        save
+
+        Saves the counts of the most read Threads (replacing the file
+        atomically, so that a crash never leaves it half written)
+
+        """
+        if self.path is None:
+            return
+
+        with self._lock:
+            counts = dict(self._counts.most_common(self.capacity))
+
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as stats_file:
+            json.dump(counts, stats_file)
+        os.replace(temporary, self.path)
+
+
+access_stats = AccessStats()
+
+
+def hot_threads(repository, stats: AccessStats, limit: int) -> list[str]:
+    """
+    hot_threads
+
+    Returns the Threads most worth warming: the most read, according to the
+    access stats, topped up with the most upvoted
+
+    Inputs:
+        repository - the repository the Threads are in
+        stats - the counts of reads of each Thread
+        limit - the number of Threads to return
+
+    Output:
+        uuids - of the hottest Threads, hottest first
+
+    """
+    threads = stats.top(limit)
+    if len(threads) < limit:
+        for uuid, _ in repository.most_voted_threads(limit):
+            if uuid not in threads:
+                threads.append(uuid)
+
+    return threads[:limit]
+
+
+def warm_thread(repository, uuid: str):
+    """
+    warm_thread
+
+    Reads a Thread as its readers would: the Thread (with its author, vote
+    counts and top level Replies), its statistics and the branch below each
+    of its Replies
+
+    """
+    try:
+        thread = repository.get_item(Thread, uuid, THREAD_FIELDS)
+        repository.get_thread_stats(uuid)
+        for child in thread["children"]:
+            repository.get_branch(child["uuid"], depth=10, limit=100)
+    except (Thread.DoesNotExist, Reply.DoesNotExist):
+        pass  # N.B. e.g. deleted since it was last read
+
+
+def warm_up(repository, threads: list[str], timeout: float, concurrency: int) -> int:
+    """
+    warm_up
+
+    Reads a set of Threads (several at once), so that the database's page
+    cache and the application's own caches and code paths are warm before
+    the first requests for them arrive
+
+    N.B. gives up on whatever is left once the timeout has passed. The
+         connection is per thread, so this does not warm the connections
+         requests are served on: each reader closes its own when done.
+
+    Inputs:
+        repository - the repository the Threads are in
+        threads - the uuids of the Threads to read
+        timeout - seconds to allow for warming up
+        concurrency - the number of Threads read at once
+
+    Output:
+        n_warmed - the number of Threads read before the timeout
+
+    """
+    if not threads:
+        return 0
+
+    deadline = monotonic() + timeout
+    pending: SimpleQueue[str] = SimpleQueue()
+    for uuid in threads:
+        pending.put(uuid)
+
+    warmed = 0
+    lock = Lock()
+
+    def read():
+        nonlocal warmed
+        try:
+            while monotonic() < deadline:
+                try:
+                    uuid = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    warm_thread(repository, uuid)
+                except Exception as exc:
+                    logger.warning(f"Failed to warm up a Thread: {exc}")
+                    continue
+                with lock:
+                    warmed += 1
+        finally:
+            close_connections()
+
+    readers = [
+        BackgroundThread(target=read, name=f"warm-up-{i}", daemon=True)
+        for i in range(min(concurrency, len(threads)))
+    ]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join(max(deadline - monotonic(), 0))
+
+    with lock:
+        return warmed
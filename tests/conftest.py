@@ -0,0 +1,47 @@
+# tests/conftest.py
+# runs the API against the in-memory repository, so no database is needed
+
+import os
+
+os.environ["REPOSITORY_BACKEND"] = "memory"
+os.environ.setdefault("APPLICATION_ENV", "test")
+os.environ.setdefault("DBHOST", "localhost:7687")
+os.environ.setdefault("DBNAME", "neo4j")
+os.environ.setdefault("DBPASS", "password")
+os.environ.setdefault("DBUSER", "neo4j")
+os.environ.setdefault("ADMIN_TOKEN", "admin-token")
+
+import pytest  # noqa: E402
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src import app  # noqa: E402
+from src.services.repository import get_repository  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    get_repository().clear()
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def admin() -> dict:
+    # the headers the admin routes require
+    return {"X-Admin-Token": os.environ["ADMIN_TOKEN"]}
+
+
+@pytest.fixture
+def user(client) -> dict:
+    return client.post("/user/", json={"name": "John Smith"}).json()
+
+
+@pytest.fixture
+def thread(client, user) -> dict:
+    response = client.post(
+        "/thread/",
+        params={"user_id": user["uuid"]},
+        json={"title": "How now, brown cow?", "body": "Hi guys!"},
+    )
+    return response.json()
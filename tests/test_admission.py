@@ -0,0 +1,175 @@
+# tests/test_admission.py
+# tests for admission control of write requests
+
+import asyncio
+
+from inspect import iscoroutinefunction
+
+import pytest
+
+from fastapi.routing import APIRoute
+
+from src.app import app
+from src.services.admission import (
+    WRITE_METHODS,
+    AdmissionController,
+    Rejected,
+    TokenBucket,
+    admission,
+)
+
+
+@pytest.fixture
+def limited(client):
+    admission.configure(
+        client_rate=1000.0,
+        client_burst=1000,
+        user_rate=0.01,
+        user_burst=2,
+        global_rate=1000.0,
+        global_burst=1000,
+        max_concurrent=4,
+        max_queued=4,
+        queue_timeout=0.1,
+    )
+    yield client
+    admission.enabled = False
+    admission.reset()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1.0, burst=2, now=0.0)
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.5) == pytest.approx(0.5)
+    assert bucket.take(1.0) == 0
+
+
+def test_writes_over_a_users_rate_are_rejected(limited, user, thread, admin):
+    path = f"/thread/{thread['uuid']}/upvote"
+
+    params = {"user_id": user["uuid"]}
+
+    # N.B. creating the Thread took the first of the User's two tokens
+    assert limited.post(path, params=params).status_code == 200
+    response = limited.post(path, params=params)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    other = limited.post("/user/", params={"user_id": "other"}, json={"name": "Jo"})
+    assert other.status_code == 200
+
+    # reads are not limited
+    assert limited.get(f"/thread/{thread['uuid']}").status_code == 200
+
+    stats = limited.get("/admin/admission", headers=admin).json()
+    assert stats["enabled"] is True
+    assert stats["rejected_user_rate"] == 1
+
+
+def test_writes_beyond_the_queue_are_rejected():
+    controller = AdmissionController()
+    controller.configure(
+        client_rate=100.0,
+        client_burst=100,
+        user_rate=100.0,
+        user_burst=100,
+        global_rate=100.0,
+        global_burst=100,
+        max_concurrent=1,
+        max_queued=0,
+        queue_timeout=0.1,
+    )
+
+    async def admit_two():
+        await controller.admit("a")
+        try:
+            with pytest.raises(Rejected) as rejection:
+                await controller.admit("b")
+            return rejection.value.reason
+        finally:
+            controller.release()
+
+    assert asyncio.run(admit_two()) == "queue_full"
+    assert controller.stats.in_flight == 0
+
+
+def test_naming_new_users_does_not_escape_the_client_rate():
+    controller = AdmissionController()
+    controller.configure(
+        client_rate=0.01,
+        client_burst=2,
+        user_rate=100.0,
+        user_burst=100,
+        global_rate=100.0,
+        global_burst=100,
+        max_concurrent=4,
+        max_queued=4,
+        queue_timeout=0.1,
+    )
+
+    async def admit(client, user):
+        try:
+            await controller.admit(client, user)
+        except Rejected as exc:
+            return exc.reason
+        controller.release()
+        return "admitted"
+
+    async def admit_all():
+        return [
+            await admit("10.0.0.1", "a"),
+            await admit("10.0.0.1", "b"),
+            await admit("10.0.0.1", "c"),
+            await admit("10.0.0.2", "c"),
+        ]
+
+    assert asyncio.run(admit_all()) == [
+        "admitted",
+        "admitted",
+        "client_rate",
+        "admitted",
+    ]
+    assert controller.stats.rejected_client_rate == 1
+
+
+def test_tokens_are_given_back_when_no_slot_is_free():
+    controller = AdmissionController()
+    controller.configure(
+        client_rate=0.01,
+        client_burst=2,
+        user_rate=0.01,
+        user_burst=2,
+        global_rate=0.01,
+        global_burst=2,
+        max_concurrent=1,
+        max_queued=0,
+        queue_timeout=0.1,
+    )
+
+    async def admit_three():
+        await controller.admit("10.0.0.1", "a")
+        with pytest.raises(Rejected) as rejection:
+            await controller.admit("10.0.0.1", "a")
+        controller.release()
+        await controller.admit("10.0.0.1", "a")  # N.B. the second token is back
+        controller.release()
+        return rejection.value.reason
+
+    assert asyncio.run(admit_three()) == "queue_full"
+    assert controller.stats.admitted == 2
+
+
+def test_write_routes_run_off_the_event_loop():
+    # N.B. so that the admission slots bound the transactions in flight
+    routes = [
+        route
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.methods & set(WRITE_METHODS)
+    ]
+    assert routes
+    assert [
+        route.path
+        for route in routes
+        if iscoroutinefunction(route.endpoint) and not route.path.startswith("/admin")
+    ] == []
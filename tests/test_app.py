@@ -1,6 +1,109 @@
 # tests/test_app.py
-# placeholder for future tests
+# tests for the application as a whole
+
+from importlib import import_module
+
+from neo4j.io import ServiceUnavailable
+
+from src.models import Thread
+from src.services.config import AppSettings, get_settings
+from src.services.health import readiness
+from src.services.migrations import hot_queries
+from src.services.profiling import QueryProfiler, QueryRecord
+from src.services.projections import THREAD_FIELDS, item_query
+from src.services.sessions import RequestBookmarks, parse_bookmarks, split_bookmark
 
 
 def test_dummy():
     pass
+
+
+def test_probes(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert client.get("/readyz").status_code == 200
+
+
+def test_request_id_is_echoed(client):
+    response = client.get("/healthz", headers={"X-Request-ID": "abc"})
+    assert response.headers["X-Request-ID"] == "abc"
+
+
+def test_parse_bookmarks():
+    assert parse_bookmarks(None) == ()
+    assert parse_bookmarks("b, a,,b") == ("a", "b")
+
+
+def test_bookmarks_are_kept_by_shard():
+    assert split_bookmark("1:FB:abc") == (1, "FB:abc")
+    assert split_bookmark("FB:abc") == (0, "FB:abc")  # N.B. no shard given
+
+    bookmarks = RequestBookmarks(presented=parse_bookmarks("0:a,1:b,FB:c"))
+    assert bookmarks.for_shard(0) == ("a", "FB:c")
+    assert bookmarks.for_shard(1) == ("b",)
+    assert bookmarks.for_shard(2) == ()
+    assert bookmarks.header() is None
+
+    bookmarks.latest[1] = "d"
+    bookmarks.latest[2] = "e"
+    assert bookmarks.header() == "0:a,1:d,2:e,FB:c"
+
+
+def test_no_bookmark_without_a_write(client):
+    response = client.get("/healthz", headers={"X-Bookmark": "a"})
+    assert "X-Bookmark" not in response.headers
+
+
+def test_graph_database_preparation_is_retried(monkeypatch):
+    application = import_module("src.app")
+    failures = [ServiceUnavailable("not yet"), RuntimeError("bad migration")]
+    details = []
+
+    def prepare(settings):
+        details.append(readiness.detail)
+        if failures:
+            raise failures.pop(0)
+        readiness.mark_ready()
+
+    monkeypatch.setattr(application, "prepare_graph_database", prepare)
+    monkeypatch.setattr(application, "sleep", lambda seconds: None)
+    readiness.mark_not_ready("connecting to graph database")
+
+    application.keep_preparing_graph_database(AppSettings())
+
+    assert details[1:] == [
+        "graph database unavailable",
+        "failed to prepare graph database: RuntimeError",
+    ]
+    assert readiness.ready
+
+
+def test_hot_queries_are_the_services_queries():
+    queries = hot_queries()
+    assert queries["get thread"][0] == item_query(Thread, THREAD_FIELDS)
+    assert all(query.strip() for query, _ in queries.values())
+
+
+def test_captured_queries_are_distinct():
+    profiler = QueryProfiler()
+    for uuid in ("a", "b"):
+        profile = profiler.start_request("GET", f"/thread/{uuid}")
+        profile.queries.append(QueryRecord("MATCH  (t) RETURN t", {"uuid": uuid}, 1, 1))
+        profile.queries.append(QueryRecord("RETURN 1", {}, 1, 1))
+        profiler.finish_request(profile, 200)
+
+    assert profiler.captured_queries() == {
+        "MATCH (t) RETURN t": ("MATCH  (t) RETURN t", {"uuid": "b"}),
+        "RETURN 1": ("RETURN 1", {}),
+    }
+
+
+def test_admin_routes_require_the_admin_token(client, admin, monkeypatch):
+    assert client.get("/admin/admission", headers=admin).status_code == 200
+    assert client.get("/admin/admission").status_code == 401
+    assert (
+        client.post("/admin/related", headers={"X-Admin-Token": "guess"}).status_code
+        == 401
+    )
+
+    monkeypatch.setattr(get_settings(), "admin_token", None)
+    assert client.get("/admin/admission", headers=admin).status_code == 404
@@ -0,0 +1,94 @@
+# tests/test_archive.py
+# tests for moving inactive Threads to the archive and back
+
+from time import time
+
+import pytest
+
+from neomodel.exceptions import UniqueProperty
+
+from src.models import Reply, Thread
+from src.services.archive import ArchiveStore
+from src.services.projections import REPLY_FIELDS, THREAD_FIELDS
+from src.services.repository import ArchivingRepository, MemoryRepository
+
+
+@pytest.fixture
+def archiving(tmp_path) -> ArchivingRepository:
+    return ArchivingRepository(MemoryRepository(), ArchiveStore(str(tmp_path)))
+
+
+@pytest.fixture
+def tree(archiving) -> dict:
+    author = archiving.create_user("John Smith")
+    voter = archiving.create_user("Jane Doe")
+    thread = archiving.create_thread(author["uuid"], "A title", "A body")
+    reply = archiving.create_reply(voter["uuid"], Thread, thread["uuid"], "A reply")
+    nested = archiving.create_reply(author["uuid"], Reply, reply["uuid"], "Nested")
+    archiving.vote(Thread, thread["uuid"], voter["uuid"], "up", True)
+    archiving.vote(Reply, nested["uuid"], voter["uuid"], "down", True)
+    return {"thread": thread, "reply": reply, "nested": nested, "voter": voter}
+
+
+def test_archived_threads_read_as_before(archiving, tree):
+    thread, reply = tree["thread"]["uuid"], tree["reply"]["uuid"]
+    before = (
+        archiving.get_item(Thread, thread, THREAD_FIELDS),
+        archiving.get_item(Reply, reply, REPLY_FIELDS),
+        archiving.get_branch(reply, depth=5, limit=10),
+        archiving.get_thread_stats(thread),
+    )
+
+    assert archiving.archive(time() + 1) == [thread]
+    assert archiving.inner.is_empty() is False  # the Users remain
+    with pytest.raises(Thread.DoesNotExist):
+        archiving.inner.get_item(Thread, thread, ("uuid",))
+
+    after = (
+        archiving.get_item(Thread, thread, THREAD_FIELDS),
+        archiving.get_item(Reply, reply, REPLY_FIELDS),
+        archiving.get_branch(reply, depth=5, limit=10),
+        archiving.get_thread_stats(thread),
+    )
+    assert after == before
+
+
+def test_active_threads_are_kept(archiving, tree):
+    assert archiving.archive(time() - 60) == []
+
+
+def test_voting_brings_a_thread_back(archiving, tree, tmp_path):
+    thread, nested = tree["thread"]["uuid"], tree["nested"]["uuid"]
+    archiving.archive(time() + 1)
+
+    voted = archiving.vote(Reply, nested, tree["voter"]["uuid"], "up", True)
+    assert (voted["upvotes"], voted["downvotes"]) == (1, 1)
+    assert voted["thread"] == thread
+    assert archiving.inner.get_item(Thread, thread, ("upvotes",)) == {"upvotes": 1}
+
+    # another worker sharing the directory ignores the archived copy
+    assert ArchiveStore(str(tmp_path)).thread_of(Thread, thread) is None
+
+
+def test_missing_items_are_still_missing(archiving, tree):
+    archiving.archive(time() + 1)
+    with pytest.raises(Reply.DoesNotExist):
+        archiving.get_item(Reply, "missing", ("uuid",))
+
+
+def test_archived_titles_stay_taken(archiving, tree):
+    author = tree["thread"]["author"]["uuid"]
+    archiving.archive(time() + 1)
+
+    with pytest.raises(UniqueProperty):
+        archiving.create_thread(author, "A title", "Another body")
+    with pytest.raises(UniqueProperty):
+        archiving.create_threads([{"user_id": author, "title": "A title", "body": ""}])
+
+    other = archiving.create_thread(author, "Another title", "Another body")
+    with pytest.raises(UniqueProperty):
+        archiving.update_item(Thread, other["uuid"], {"title": "A title"}, None)
+
+    # so the archived Thread can still be brought back
+    voted = archiving.vote(Thread, tree["thread"]["uuid"], author, "up", True)
+    assert voted["upvotes"] == 2
@@ -0,0 +1,43 @@
+# tests/test_branches.py
+# tests for the continuation cursors of deep reply branches
+
+import json
+
+from base64 import urlsafe_b64encode
+
+import pytest
+
+from src.services.branches import InvalidCursor, decode_cursor, encode_cursor
+
+
+def cursor_of(payload) -> str:
+    return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize("after", [None, (1_700_000_000.5, "abc")])
+def test_cursors_decode_to_their_position(after):
+    cursor = encode_cursor("reply", after)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "reply") == after
+
+
+def test_cursors_belong_to_their_reply():
+    cursor = encode_cursor("reply", None)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "another reply")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        urlsafe_b64encode(b"not json").decode(),
+        cursor_of(["reply", None]),
+        cursor_of({"reply": "reply"}),
+        cursor_of({"reply": "reply", "after": 5}),
+        cursor_of({"reply": "reply", "after": [1.0]}),
+    ],
+)
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "reply")
@@ -0,0 +1,102 @@
+# tests/test_client.py
+# tests for the API client in tools/client
+
+import asyncio
+
+import httpx
+import pytest
+
+from src import app
+from tools.client import ApiError, AsyncThreadsClient, RetryPolicy, ThreadsClient
+from tools.client.common import JsonArrayParser
+
+
+def test_json_array_parser_handles_split_chunks():
+    body = '[{"a": "é"}, 12, [1, 2], "x"]'.encode()
+    parser = JsonArrayParser()
+    items = []
+    for i in range(len(body)):
+        items += parser.feed(body[i : i + 1])
+    assert items == [{"a": "é"}, 12, [1, 2], "x"]
+    assert parser.finished
+
+
+def test_retry_policy_honours_retry_after():
+    response = httpx.Response(429, headers={"Retry-After": "2"})
+    policy = RetryPolicy(attempts=2)
+    assert policy.should_retry(0, response)
+    assert not policy.should_retry(1, response)
+    assert policy.delay(0, response) == 2.0
+    assert not policy.should_retry(0, httpx.Response(404))
+
+
+def test_retry_policy_spares_writes_that_may_have_been_processed():
+    policy = RetryPolicy(attempts=2)
+    for status in (429, 503):
+        assert policy.should_retry(0, httpx.Response(status), idempotent=False)
+    for status in (409, 500, 502, 504):
+        assert not policy.should_retry(0, httpx.Response(status), idempotent=False)
+    assert not policy.should_retry(0, None, idempotent=False)
+    assert policy.should_retry(0, httpx.Response(502))
+    assert not policy.should_retry(0, httpx.Response(409))
+
+
+def test_posts_are_not_retried_after_a_server_error():
+    requests = []
+
+    def handler(request):
+        requests.append(request.method)
+        return httpx.Response(502)
+
+    http_client = httpx.Client(
+        transport=httpx.MockTransport(handler), base_url="http://test"
+    )
+    api = ThreadsClient(http_client=http_client, retry=RetryPolicy(base_delay=0))
+
+    with pytest.raises(ApiError):
+        api.create_user("Jo")
+    with pytest.raises(ApiError):
+        api.get_user("u")
+    assert requests == ["POST", "GET", "GET", "GET", "GET"]
+
+
+def test_sync_client(client, user):
+    api = ThreadsClient(http_client=client, retry=RetryPolicy(attempts=1))
+
+    uuids = api.create_threads(
+        [{"user_id": user["uuid"], "title": f"T{i}", "body": "b"} for i in range(3)]
+    )
+    assert {t["uuid"] for t in api.iter_threads()} == set(uuids)
+
+    replies = api.create_replies(
+        uuids[0],
+        [
+            {"user_id": user["uuid"], "body": "top", "temp_id": "a"},
+            {"user_id": user["uuid"], "body": "nested", "parent": "a"},
+        ],
+    )
+    tree = api.get_tree(replies[0], thread_id=uuids[0])
+    assert [child["uuid"] for child in tree["children"]] == [replies[1]]
+
+    voted = api.vote(user["uuid"], uuids[0])
+    assert voted["upvotes"] == 1
+
+    with pytest.raises(ApiError) as error:
+        api.get_thread("missing")
+    assert error.value.status_code == 404
+
+
+def test_async_client(client, user):
+    async def run():
+        http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+        )
+        async with AsyncThreadsClient(http_client=http, max_concurrency=2) as api:
+            threads = await asyncio.gather(
+                *(api.create_thread(user["uuid"], f"T{i}", "b") for i in range(5))
+            )
+            listed = [thread async for thread in api.iter_threads()]
+            return threads, listed
+
+    threads, listed = asyncio.run(run())
+    assert {t["uuid"] for t in listed} == {t["uuid"] for t in threads}
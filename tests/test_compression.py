@@ -0,0 +1,55 @@
+# tests/test_compression.py
+# tests for compressed and streamed responses
+
+import json
+import zlib
+
+from src.services.compression import GzipEncoder, compression
+from src.services.streaming import json_array_chunks, json_object_chunks
+
+
+def test_choose_encoding():
+    assert compression.choose("gzip, deflate") == "gzip"
+    assert compression.choose("*") is not None
+    assert compression.choose("gzip;q=0, identity") is None
+    assert compression.choose("") is None
+
+
+def test_gzip_encoder_flushes_each_chunk():
+    encoder = GzipEncoder(level=6)
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    first = encoder.compress(b'["a",') + encoder.flush()
+    assert decoder.decompress(first) == b'["a",'
+
+    rest = encoder.compress(b'"b"]') + encoder.finish()
+    assert decoder.decompress(rest) == b'"b"]'
+
+
+def test_json_chunks():
+    items = [{"n": n} for n in range(5)]
+    assert (
+        b"".join(json_array_chunks(items, chunk_items=2))
+        == json.dumps(items, separators=(",", ":")).encode()
+    )
+    assert b"".join(json_array_chunks([])) == b"[]"
+
+    chunks = json_object_chunks({"uuid": "x"}, "children", items, chunk_items=2)
+    assert json.loads(b"".join(chunks)) == {"uuid": "x", "children": items}
+
+
+def test_large_lists_are_streamed_compressed(client):
+    names = {f"User number {n}" for n in range(50)}
+    for name in names:
+        client.post("/user/", json={"name": name})
+
+    response = client.get("/user/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert {user["name"] for user in response.json()} == names
+
+
+def test_small_responses_are_not_compressed(client, user):
+    response = client.get(f"/user/{user['uuid']}", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json() == user
@@ -0,0 +1,36 @@
+# tests/test_concurrency.py
+# tests for entity tags and If-Match headers
+
+import pytest
+
+from src.services.concurrency import VersionConflict, etag, parse_if_match
+
+
+def test_etags_parse_back_to_their_version():
+    for version in [0, 1, 42]:
+        assert etag(version) == f'"{version}"'
+        assert parse_if_match(etag(version)) == version
+
+
+@pytest.mark.parametrize(
+    "if_match, expected",
+    [
+        (None, None),
+        ("*", None),
+        (" * ", None),
+        ('"3"', 3),
+        ('W/"3"', 3),
+        ('"3", "4"', 3),
+        ("3", 3),
+        ('"abc"', -1),
+        ("", -1),
+    ],
+)
+def test_parse_if_match(if_match, expected):
+    assert parse_if_match(if_match) == expected
+
+
+def test_version_conflict_describes_both_versions():
+    conflict = VersionConflict("abc", expected=2, current=5)
+    assert (conflict.uuid, conflict.expected, conflict.current) == ("abc", 2, 5)
+    assert str(conflict) == "Version 2 of abc is out of date (current: 5)"
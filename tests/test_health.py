@@ -0,0 +1,46 @@
+# tests/test_health.py
+# tests for probing the database and tracking readiness
+
+import pytest
+
+from src.services import graph
+from src.services.graph import await_graph
+from src.services.health import Readiness
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a clock that only moves when the code under test sleeps
+    slept: list[float] = []
+    monkeypatch.setattr(graph, "time", lambda: sum(slept))
+    monkeypatch.setattr(graph, "sleep", slept.append)
+    monkeypatch.setattr(graph, "uniform", lambda low, high: high)
+    return slept
+
+
+def test_the_graph_is_probed_with_backoff(monkeypatch, clock):
+    answers = iter([False, False, False, False, True])
+    monkeypatch.setattr(graph, "probe_graph", lambda: next(answers))
+
+    assert await_graph(timeout=10.0, initial_delay=0.5, max_delay=2.0)
+    assert clock == [0.5, 1.0, 2.0, 2.0]
+
+
+def test_probing_gives_up_at_the_timeout(monkeypatch, clock):
+    monkeypatch.setattr(graph, "probe_graph", lambda: False)
+
+    assert not await_graph(timeout=3.0, initial_delay=1.0, max_delay=4.0)
+    assert clock == [1.0, 2.0]
+
+
+def test_readiness():
+    readiness = Readiness()
+    assert (readiness.ready, readiness.detail) == (False, "starting")
+    assert not readiness.wait(timeout=0)
+
+    readiness.mark_ready()
+    assert (readiness.ready, readiness.detail) == (True, "ready")
+    assert readiness.wait(timeout=0)
+
+    readiness.mark_not_ready("database unavailable")
+    assert (readiness.ready, readiness.detail) == (False, "database unavailable")
@@ -0,0 +1,46 @@
+# tests/test_ids.py
+# tests for node identifiers
+
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+
+from src.services.config import get_settings
+from src.services.ids import id_migration_blocker, id_timestamp, new_id, uuid7
+
+
+def test_uuid7_is_a_version_7_rfc_4122_uuid():
+    uuid = uuid7()
+    assert uuid.version == 7
+    assert uuid.variant == "specified in RFC 4122"
+    assert uuid7() != uuid
+
+
+def test_uuid7_embeds_its_timestamp():
+    at = datetime(2024, 5, 1, 12, 30, 15, 250_000, tzinfo=timezone.utc)
+    assert id_timestamp(uuid7(at.timestamp()).hex) == at
+
+
+def test_uuid7s_sort_by_time():
+    ids = [uuid7(timestamp).hex for timestamp in [1.0, 1.5, 2.5, 1_700_000_000.0]]
+    assert sorted(ids) == ids
+
+
+def test_random_ids_have_no_timestamp():
+    assert id_timestamp(uuid4().hex) is None
+
+
+def test_new_id_uses_the_configured_scheme(monkeypatch):
+    monkeypatch.setattr(get_settings(), "id_scheme", "uuid7")
+    assert UUID(hex=new_id()).version == 7
+
+    monkeypatch.setattr(get_settings(), "id_scheme", "uuid4")
+    uuid = new_id()
+    assert len(uuid) == 32 and UUID(hex=uuid).version == 4
+
+
+def test_id_migration_blockers():
+    assert id_migration_blocker("Reply", sharded=False, archived=False) is None
+    assert id_migration_blocker("Reply", sharded=True, archived=False) is None
+    assert id_migration_blocker("Thread", sharded=True, archived=False)
+    assert id_migration_blocker("User", sharded=True, archived=False)
+    assert id_migration_blocker("Reply", sharded=False, archived=True)
@@ -0,0 +1,122 @@
+# tests/test_logs.py
+# tests for the application's logging
+
+import json
+import logging
+
+import pytest
+
+from src.services import logs
+from src.services.logs import (
+    REQUEST_LOGGER,
+    CorrelationIdFilter,
+    JsonFormatter,
+    LocalQueueHandler,
+    SamplingFilter,
+    correlation_id,
+    logging_setup,
+    logging_shutdown,
+)
+
+
+def make_record(level: int = logging.INFO, msg: str = "Hello %s", **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, ("world",), None)
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.fixture
+def json_logs():
+    # N.B. set up in the test itself, so that the log stream is the one
+    #      capsys captures while the test runs
+    yield lambda: logging_setup(json_format=True)
+    logging_setup(levels={"neomodel": "WARNING", "neo4j": "WARNING"})
+
+
+def written(capsys) -> list[dict]:
+    logging_shutdown()
+    return [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+
+
+def test_exceptions_are_formatted_by_the_listener(json_logs, capsys):
+    logger = json_logs()
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logger.exception("Failed to %s", "work")
+
+    (entry,) = written(capsys)
+    assert entry["message"] == "Failed to work"
+    assert entry["level"] == "ERROR"
+    assert "RuntimeError: boom" in entry["exception"]
+
+
+def test_mutable_arguments_are_formatted_when_logged(json_logs, capsys):
+    logger = json_logs()
+    items = ["a"]
+    logger.warning("Items: %s", items)
+    items.append("b")
+
+    (entry,) = written(capsys)
+    assert entry["message"] == "Items: ['a']"
+
+
+def test_extra_fields_are_written(json_logs, capsys):
+    logger = json_logs()
+    logger.info("Done", extra={"duration_ms": 12})
+
+    (entry,) = written(capsys)
+    assert (entry["duration_ms"], entry["correlation_id"]) == (12, "-")
+    assert isinstance(logging.getLogger().handlers[0], LocalQueueHandler)
+
+
+def test_sampling_filter_keeps_a_fraction_of_records_below_warning(monkeypatch):
+    monkeypatch.setattr(logs, "random", lambda: 0.3)
+
+    assert SamplingFilter(rate=0.5).filter(make_record(logging.INFO))
+    assert not SamplingFilter(rate=0.2).filter(make_record(logging.INFO))
+    assert not SamplingFilter(rate=0.0).filter(make_record(logging.DEBUG))
+    assert SamplingFilter(rate=0.0).filter(make_record(logging.WARNING))
+    assert SamplingFilter(rate=0.0).filter(make_record(logging.ERROR))
+
+
+def test_correlation_id_filter_stamps_the_current_request():
+    token = correlation_id.set("abc")
+    try:
+        record = make_record()
+        assert CorrelationIdFilter().filter(record)
+    finally:
+        correlation_id.reset(token)
+
+    assert record.correlation_id == "abc"
+
+
+def test_json_formatter_writes_one_line_per_record():
+    record = make_record(correlation_id="abc", path="/thread/", status=200)
+    line = JsonFormatter().format(record)
+
+    assert "\n" not in line
+    entry = json.loads(line)
+    assert entry["message"] == "Hello world"
+    assert (entry["level"], entry["logger"]) == ("INFO", "test")
+    assert (entry["correlation_id"], entry["path"], entry["status"]) == (
+        "abc",
+        "/thread/",
+        200,
+    )
+    assert entry["time"].endswith("+00:00")
+    assert "exception" not in entry and "args" not in entry
+
+
+def test_json_formatter_writes_values_json_cannot_hold_as_strings():
+    line = JsonFormatter().format(make_record(when=logs.datetime(2024, 1, 2)))
+    assert json.loads(line)["when"] == "2024-01-02 00:00:00"
+
+
+def test_request_logs_are_sampled():
+    logging_setup(request_sample_rate=0.25)
+    try:
+        (sampling,) = logging.getLogger(REQUEST_LOGGER).filters
+        assert sampling.rate == 0.25
+    finally:
+        logging_setup(levels={"neomodel": "WARNING", "neo4j": "WARNING"})
@@ -0,0 +1,47 @@
+# tests/test_migrations.py
+# tests for the schema migrations and the index usage check
+
+import re
+
+from src.models import MIGRATIONS
+from src.services.migrations import find_scans, hot_queries
+
+
+def test_migrations_are_numbered_in_order():
+    versions = [migration.version for migration in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+
+
+def test_schema_statements_can_be_re_run():
+    for migration in MIGRATIONS:
+        for statement in migration.statements:
+            if statement.startswith("CREATE"):
+                assert "IF NOT EXISTS" in statement, statement
+
+
+def test_find_scans_reports_every_scanning_operator():
+    plan = {
+        "operatorType": "ProduceResults@neo4j",
+        "children": [
+            {
+                "operatorType": "CartesianProduct@neo4j",
+                "children": [
+                    {"operatorType": "NodeByLabelScan@neo4j"},
+                    {"operatorType": "NodeUniqueIndexSeek@neo4j"},
+                    {
+                        "operatorType": "Filter@neo4j",
+                        "children": [{"operatorType": "AllNodesScan@neo4j"}],
+                    },
+                ],
+            },
+        ],
+    }
+    assert sorted(find_scans(plan)) == ["AllNodesScan@neo4j", "NodeByLabelScan@neo4j"]
+
+    seek = {"operatorType": "NodeIndexSeek@neo4j", "children": []}
+    assert find_scans(seek) == []
+
+
+def test_hot_queries_come_with_every_parameter_they_use():
+    for name, (query, params) in hot_queries().items():
+        assert set(re.findall(r"\$(\w+)", query)) <= set(params), name
@@ -0,0 +1,44 @@
+# tests/test_my_votes.py
+# tests for the per-User vote states
+
+from src.services.my_votes import UserVotes, VoteStates
+
+
+def test_user_votes():
+    votes = UserVotes({"up": ["c", "a"], "down": ["b"]}, loaded_at=0.0)
+    assert votes.of("a") == {"up": True, "down": False}
+
+    votes.set("up", "b", cast=True)
+    votes.set("down", "b", cast=False)
+    votes.set("up", "a", cast=False)
+    assert votes.of("b") == {"up": True, "down": False}
+    assert votes.of("a") == {"up": False, "down": False}
+
+
+def test_vote_states_load_once_and_evict():
+    states = VoteStates()
+    states.configure(capacity=1, max_age=60.0)
+    loads = []
+
+    def load(user: str) -> dict:
+        loads.append(user)
+        return {"up": [f"{user}-item"]}
+
+    assert states.get("u1", load).has("up", "u1-item")
+    states.get("u1", load)
+    assert loads == ["u1"]
+
+    states.get("u2", load)  # evicts u1
+    states.get("u1", load)
+    assert loads == ["u1", "u2", "u1"]
+
+
+def test_votes_recorded_while_loading_are_kept():
+    states = VoteStates()
+
+    def load(user: str) -> dict:
+        # the vote is recorded after the (stale) state was read
+        states.record(user, "down", "item", cast=True)
+        return {"up": ["item"]}
+
+    assert states.get("u1", load).of("item") == {"up": True, "down": True}
@@ -0,0 +1,61 @@
+# tests/test_profiling.py
+# tests for the query profiling mode
+
+import pytest
+
+from src.services.profiling import (
+    WRITE_CLAUSES,
+    QueryProfiler,
+    QueryRecord,
+    total_db_hits,
+)
+
+
+def test_total_db_hits_sums_nested_operators():
+    plan = {
+        "operatorType": "ProduceResults",
+        "dbHits": 0,
+        "children": [
+            {
+                "operatorType": "Filter",
+                "dbHits": 5,
+                "children": [
+                    {"operatorType": "NodeIndexSeek", "dbHits": 3},
+                    {"operatorType": "Expand(All)", "dbHits": 7, "children": []},
+                ],
+            },
+        ],
+    }
+    assert total_db_hits(plan) == 15
+    assert total_db_hits({"operatorType": "EmptyResult"}) == 0
+
+
+@pytest.mark.parametrize(
+    "query, writes",
+    [
+        ("MATCH (t:Thread {uuid: $uuid}) RETURN t", False),
+        ("MATCH (t:Thread) WHERE t.created_at > $since RETURN t", False),
+        ("MATCH (t:Thread) SET t.title = $title", True),
+        ("merge (u:User {uuid: $uuid})", True),
+        ("CALL { MATCH (t) RETURN t } RETURN t", True),
+        ("LOAD  CSV FROM $url AS row RETURN row", True),
+    ],
+)
+def test_queries_that_may_write_are_recognised(query, writes):
+    assert bool(WRITE_CLAUSES.search(query)) == writes
+
+
+def test_only_the_latest_requests_with_queries_are_kept():
+    profiler = QueryProfiler(buffer_size=2)
+
+    for path in ["/a", "/b", "/c", "/d"]:
+        profile = profiler.start_request("GET", path)
+        if path != "/d":
+            profile.queries.append(QueryRecord("RETURN 1", {}, 1, 1.0))
+        profiler.finish_request(profile, 200)
+
+    assert [profile.path for profile in profiler.recent()] == ["/c", "/b"]
+    assert profiler.recent()[0].status_code == 200
+
+    profiler.configure(threshold_ms=10.0, buffer_size=1)
+    assert [profile.path for profile in profiler.recent()] == ["/c"]
@@ -0,0 +1,61 @@
+# tests/test_projections.py
+# tests for reading only the requested fields of nodes
+
+from datetime import datetime
+
+import pytest
+
+from src.models import Thread
+from src.services.projections import (
+    THREAD_FIELDS,
+    UnknownFields,
+    inflate_fields,
+    map_projection,
+    select_fields,
+)
+
+
+@pytest.mark.parametrize(
+    "fields, selected",
+    [
+        (None, THREAD_FIELDS),
+        ("uuid", ("uuid",)),
+        ("title, uuid", ("title", "uuid")),
+        ("uuid,title,uuid", ("uuid", "title")),
+        ("uuid,,title,", ("uuid", "title")),
+    ],
+)
+def test_select_fields(fields, selected):
+    assert select_fields(fields, THREAD_FIELDS) == selected
+
+
+def test_unknown_fields_are_reported():
+    with pytest.raises(UnknownFields) as error:
+        select_fields("uuid,password,token", THREAD_FIELDS)
+
+    assert error.value.unknown == ["password", "token"]
+    assert error.value.available == THREAD_FIELDS
+
+
+def test_map_projection_reads_only_the_selected_fields():
+    projection = map_projection("t", ("uuid", "body", "upvotes"))
+
+    assert projection.startswith("t {.uuid, body: CASE WHEN $preview_chars")
+    assert "left(t.body, $preview_chars)" in projection
+    assert "UPVOTED_BY" in projection
+    assert ".title" not in projection and "AUTHORED_BY" not in projection
+
+
+def test_inflate_fields_converts_nested_timestamps():
+    data = {
+        "uuid": "t",
+        "created_at": 1_700_000_000.0,
+        "author": {"uuid": "u", "created_at": 1_700_000_000.0},
+        "children": [{"uuid": "r", "created_at": 1_700_000_001.0}],
+    }
+
+    inflate_fields(Thread, data)
+    assert isinstance(data["created_at"], datetime)
+    assert isinstance(data["author"]["created_at"], datetime)
+    assert isinstance(data["children"][0]["created_at"], datetime)
+    assert data["uuid"] == "t"
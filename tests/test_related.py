@@ -0,0 +1,110 @@
+# tests/test_related.py
+# tests for finding related Threads
+
+from src.services.related import compute_related, neighbourhood
+from src.services.repository import get_repository
+
+
+def test_compute_related():
+    engagement = {
+        "a": ["u1", "u2"],
+        "b": ["u1", "u2"],
+        "c": ["u2", "u3"],
+        "d": ["u4"],
+    }
+    related = compute_related(engagement, k=2)
+
+    assert related["a"][0] == ("b", 1.0)
+    assert {uuid for uuid, _ in related["c"]} == {"a", "b"}
+    assert related["d"] == []
+
+    assert compute_related(engagement, k=1, threads={"c"}).keys() == {"c"}
+
+
+def test_related_threads(client, user, admin):
+    voter = client.post("/user/", json={"name": "Jane Doe"}).json()
+    threads = [
+        client.post(
+            "/thread/",
+            params={"user_id": user["uuid"]},
+            json={"title": f"Thread {n}", "body": "Hi"},
+        ).json()["uuid"]
+        for n in range(3)
+    ]
+    for thread in threads[:2]:
+        client.post(f"/thread/{thread}/upvote", params={"user_id": voter["uuid"]})
+
+    assert client.get(f"/thread/{threads[0]}/related").json() == []
+
+    refreshed = client.post(
+        "/admin/related", params={"full": True}, headers=admin
+    ).json()
+    assert refreshed == {"refreshed": 3}
+
+    related = client.get(f"/thread/{threads[0]}/related").json()
+    assert related[0]["uuid"] == threads[1]
+    assert related[0]["score"] > related[1]["score"]
+    assert client.get(f"/thread/{threads[0]}/related", params={"limit": 1}).json() == [
+        related[0]
+    ]
+
+    # only Threads sharing Users with those voted on since are refreshed
+    loner = client.post("/user/", json={"name": "Lone Ranger"}).json()
+    lonely = client.post(
+        "/thread/",
+        params={"user_id": loner["uuid"]},
+        json={"title": "Alone", "body": ""},
+    ).json()["uuid"]
+    client.post(f"/thread/{lonely}/upvote", params={"user_id": loner["uuid"]})
+    assert client.post("/admin/related", headers=admin).json() == {"refreshed": 1}
+
+
+def test_related_threads_of_missing_thread(client):
+    assert client.get("/thread/missing/related").status_code == 404
+
+
+def test_incremental_runs_load_only_the_neighbourhood(client):
+    users = [client.post("/user/", json={"name": f"User {n}"}).json() for n in range(4)]
+    threads = [
+        client.post(
+            "/thread/",
+            params={"user_id": users[n]["uuid"]},
+            json={"title": f"Thread {n}", "body": ""},
+        ).json()["uuid"]
+        for n in range(4)
+    ]
+    # 0 - 1 - 2 are linked by shared voters; 3 is on its own
+    for voter, thread in ((0, 1), (1, 2)):
+        client.post(
+            f"/thread/{threads[thread]}/upvote",
+            params={"user_id": users[voter]["uuid"]},
+        )
+
+    repository = get_repository()
+    engagement, affected, thread_counts = neighbourhood(repository, {threads[0]})
+
+    assert affected == {threads[0], threads[1]}
+    assert threads[3] not in engagement
+    assert compute_related(
+        engagement, 2, affected, thread_counts=thread_counts
+    ) == compute_related(repository.thread_engagement(), 2, affected)
+
+
+def test_deleted_threads_are_not_related(client, user, admin):
+    voter = client.post("/user/", json={"name": "Jane Doe"}).json()
+    threads = [
+        client.post(
+            "/thread/",
+            params={"user_id": user["uuid"]},
+            json={"title": f"Thread {n}", "body": "Hi"},
+        ).json()["uuid"]
+        for n in range(2)
+    ]
+    client.post(f"/thread/{threads[1]}/upvote", params={"user_id": voter["uuid"]})
+    client.post("/admin/related", params={"full": True}, headers=admin)
+    assert [r["uuid"] for r in client.get(f"/thread/{threads[0]}/related").json()] == [
+        threads[1]
+    ]
+
+    client.delete(f"/thread/{threads[1]}", params={"user_id": user["uuid"]})
+    assert client.get(f"/thread/{threads[0]}/related").json() == []
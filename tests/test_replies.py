@@ -0,0 +1,150 @@
+# tests/test_replies.py
+# tests for the Reply routes
+
+
+def create_reply(client, user, thread, body, parent=None) -> dict:
+    path = f"/thread/{thread['uuid']}/reply"
+    if parent is not None:
+        path += f"/{parent['uuid']}"
+    response = client.post(path, params={"user_id": user["uuid"]}, json={"body": body})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_create_and_get_reply(client, user, thread):
+    reply = create_reply(client, user, thread, "A reply")
+    nested = create_reply(client, user, thread, "A nested reply", parent=reply)
+
+    fetched = client.get(f"/thread/{thread['uuid']}/reply/{reply['uuid']}").json()
+    assert fetched["author"] == user
+    assert [child["uuid"] for child in fetched["children"]] == [nested["uuid"]]
+
+    parent = client.get(f"/thread/{thread['uuid']}").json()
+    assert [child["uuid"] for child in parent["children"]] == [reply["uuid"]]
+
+
+def test_reply_to_missing_reply(client, user, thread):
+    response = client.post(
+        f"/thread/{thread['uuid']}/reply/missing",
+        params={"user_id": user["uuid"]},
+        json={"body": "A reply"},
+    )
+    assert response.status_code == 404
+
+
+def test_thread_is_not_a_reply(client, thread):
+    response = client.get(f"/thread/{thread['uuid']}/reply/{thread['uuid']}")
+    assert response.status_code == 404
+
+
+def test_update_reply(client, user, thread):
+    reply = create_reply(client, user, thread, "A reply")
+
+    response = client.patch(
+        f"/thread/{thread['uuid']}/reply/{reply['uuid']}", json={"body": "Edited"}
+    )
+    assert response.json()["body"] == "Edited"
+    assert response.json()["version"] == 1
+
+
+def test_reply_branch_continues_from_cursor(client, user, thread):
+    root = create_reply(client, user, thread, "root")
+    children = [
+        create_reply(client, user, thread, f"child {n}", parent=root) for n in range(3)
+    ]
+    grandchild = create_reply(client, user, thread, "grandchild", parent=children[0])
+
+    path = f"/thread/{thread['uuid']}/reply/{root['uuid']}/branch"
+    branch = client.get(path, params={"depth": 2, "limit": 2}).json()
+    assert branch["n_children"] == 3
+    assert [c["uuid"] for c in branch["children"]] == [c["uuid"] for c in children[:2]]
+    assert branch["has_more_children"]
+    assert branch["children"][0]["n_children"] == 1
+    assert branch["children"][0]["has_more_children"]
+
+    rest = client.get(path, params={"cursor": branch["continuation"]}).json()
+    assert [c["uuid"] for c in rest["children"]] == [children[2]["uuid"]]
+    assert not rest["has_more_children"]
+
+    full = client.get(path, params={"depth": 2}).json()
+    assert full["children"][0]["children"][0]["uuid"] == grandchild["uuid"]
+
+
+def test_reply_branch_rejects_foreign_cursor(client, user, thread):
+    first = create_reply(client, user, thread, "first")
+    second = create_reply(client, user, thread, "second")
+    for n in range(2):
+        create_reply(client, user, thread, f"child {n}", parent=first)
+
+    path = f"/thread/{thread['uuid']}/reply"
+    branch = client.get(f"{path}/{first['uuid']}/branch", params={"limit": 1}).json()
+
+    response = client.get(
+        f"{path}/{second['uuid']}/branch", params={"cursor": branch["continuation"]}
+    )
+    assert response.status_code == 422
+
+
+def test_delete_reply_updates_stats(client, user, thread):
+    reply = create_reply(client, user, thread, "A reply")
+    create_reply(client, user, thread, "A nested reply", parent=reply)
+
+    response = client.delete(f"/thread/{thread['uuid']}/reply/{reply['uuid']}")
+    assert response.status_code == 204
+
+    stats = client.get(f"/thread/{thread['uuid']}/stats").json()
+    assert stats["reply_count"] == 0
+
+
+def test_create_replies_in_batch(client, user, thread):
+    existing = create_reply(client, user, thread, "existing")
+
+    response = client.post(
+        f"/thread/{thread['uuid']}/replies/batch",
+        json={
+            "replies": [
+                {"user_id": user["uuid"], "body": "top", "temp_id": "a"},
+                {"user_id": user["uuid"], "body": "nested", "parent": "a"},
+                {"user_id": user["uuid"], "body": "other", "parent": existing["uuid"]},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    top, nested, other = response.json()["uuids"]
+
+    fetched = client.get(f"/thread/{thread['uuid']}/reply/{top}").json()
+    assert fetched["body"] == "top"
+    assert [child["uuid"] for child in fetched["children"]] == [nested]
+
+    fetched = client.get(f"/thread/{thread['uuid']}/reply/{existing['uuid']}").json()
+    assert [child["uuid"] for child in fetched["children"]] == [other]
+
+    stats = client.get(f"/thread/{thread['uuid']}/stats").json()
+    assert (stats["reply_count"], stats["max_depth"]) == (4, 2)
+
+
+def test_invalid_reply_batches_create_nothing(client, user, thread):
+    path = f"/thread/{thread['uuid']}/replies/batch"
+    reply = {"user_id": user["uuid"], "body": "reply"}
+
+    repeated = [{**reply, "temp_id": "a"}, {**reply, "temp_id": "a"}]
+    response = client.post(path, json={"replies": repeated})
+    assert response.status_code == 422
+
+    missing_user = [reply, {"user_id": "missing", "body": "reply"}]
+    assert client.post(path, json={"replies": missing_user}).status_code == 404
+
+    forward_reference = [{**reply, "parent": "b"}, {**reply, "temp_id": "b"}]
+    assert client.post(path, json={"replies": forward_reference}).status_code == 422
+
+    self_reference = [{**reply, "temp_id": "c", "parent": "c"}]
+    assert client.post(path, json={"replies": self_reference}).status_code == 422
+
+    undeclared = [{**reply, "parent": "d"}]
+    assert client.post(path, json={"replies": undeclared}).status_code == 422
+
+    missing_parent = [{**reply, "parent": "0" * 32}]
+    assert client.post(path, json={"replies": missing_parent}).status_code == 404
+
+    stats = client.get(f"/thread/{thread['uuid']}/stats").json()
+    assert stats["reply_count"] == 0
@@ -0,0 +1,91 @@
+# tests/test_sharding.py
+# tests for spreading Threads over several shards
+
+from uuid import uuid4
+
+import pytest
+
+from src.models import Reply, Thread
+from src.services.ids import id_migration_blocker
+from src.services.repository import MemoryRepository, ShardedRepository
+from src.services.shards import ShardMap
+
+
+@pytest.fixture
+def sharded() -> ShardedRepository:
+    shard_map = ShardMap()
+    shard_map.configure(["shard-0", "shard-1", "shard-2"])
+    return ShardedRepository([MemoryRepository() for _ in range(3)], shard_map)
+
+
+def test_shard_for_is_stable_when_shards_are_added():
+    three, four = ShardMap(), ShardMap()
+    three.configure(["a", "b", "c"])
+    four.configure(["a", "b", "c", "d"])
+
+    uuids = [f"{i:032x}" for i in range(1000)]
+    placed = [three.shard_for(uuid) for uuid in uuids]
+    assert set(placed) == {0, 1, 2}
+
+    moved = [
+        uuid for uuid, shard in zip(uuids, placed) if four.shard_for(uuid) != shard
+    ]
+    assert all(four.shard_for(uuid) == 3 for uuid in moved)
+    assert len(moved) < 400
+
+
+@pytest.mark.parametrize("n_shards", [3, 5])
+def test_shard_for_is_balanced(n_shards):
+    shard_map = ShardMap()
+    shard_map.configure([f"shard-{i}" for i in range(n_shards)])
+
+    counts = [0] * n_shards
+    for _ in range(20_000):
+        counts[shard_map.shard_for(str(uuid4()))] += 1
+
+    expected = 20_000 / n_shards
+    assert all(abs(count - expected) < 0.1 * expected for count in counts)
+
+
+def test_threads_are_spread_and_merged(sharded):
+    user = sharded.create_user("John Smith")
+    assert all(shard.get_user(user["uuid"]) == user for shard in sharded.shards)
+
+    uuids = sharded.create_threads(
+        [{"user_id": user["uuid"], "title": f"T{i}", "body": "b"} for i in range(30)]
+    )
+    assert all(not shard.is_empty() for shard in sharded.shards)
+
+    page = sharded.list_threads(("title",), limit=10)
+    expected = sorted(uuids, reverse=True)[:10]
+    assert [thread["title"] for thread in page] == [
+        f"T{uuids.index(uuid)}" for uuid in expected
+    ]
+
+    everything = sharded.list_threads(("title",))
+    assert [thread["title"] for thread in everything] == [
+        f"T{uuids.index(uuid)}" for uuid in sorted(uuids, reverse=True)
+    ]
+
+
+def test_replies_are_found_on_their_shard(sharded):
+    user = sharded.create_user("John Smith")
+    thread = sharded.create_thread(user["uuid"], "A title", "A body")
+    reply = sharded.create_reply(user["uuid"], Thread, thread["uuid"], "A reply")
+    nested = sharded.create_reply(user["uuid"], Reply, reply["uuid"], "Nested")
+
+    sharded._directory.clear()  # e.g. another worker created them
+    voted = sharded.vote(Reply, nested["uuid"], user["uuid"], "up", True)
+    assert voted["upvotes"] == 1
+    assert voted["thread"] == thread["uuid"]
+
+    with pytest.raises(Reply.DoesNotExist):
+        sharded.get_item(Reply, "missing", ("uuid",))
+
+
+def test_ids_placing_threads_are_not_migrated_when_sharded():
+    assert id_migration_blocker("Thread", sharded=True, archived=False)
+    assert id_migration_blocker("User", sharded=True, archived=False)
+    assert id_migration_blocker("Reply", sharded=True, archived=False) is None
+    assert id_migration_blocker("Reply", sharded=False, archived=True)
+    assert id_migration_blocker("Thread", sharded=False, archived=False) is None
@@ -0,0 +1,77 @@
+# tests/test_singleflight.py
+# tests for coalescing concurrent reads
+
+import asyncio
+
+from threading import Event
+
+import pytest
+
+from src.services.singleflight import SingleFlight, single_flight
+
+
+def test_concurrent_calls_for_a_key_share_one_fetch():
+    group = SingleFlight("test")
+    release = Event()
+    fetches = []
+
+    def fetch(key):
+        fetches.append(key)
+        release.wait(timeout=5)
+        return f"data for {key}"
+
+    async def read_all():
+        calls = [group.do(key, fetch, key) for key in ["a", "a", "a", "b"]]
+        reads = asyncio.gather(*calls)
+        await asyncio.sleep(0.05)  # lets every call join its fetch
+        release.set()
+        return await reads
+
+    assert asyncio.run(read_all()) == ["data for a"] * 3 + ["data for b"]
+    assert sorted(fetches) == ["a", "b"]
+    stats = group.stats
+    assert (stats.requests, stats.executions, stats.coalesced) == (4, 2, 2)
+    assert stats.in_flight == 0
+
+
+def test_results_are_not_cached():
+    group = SingleFlight("test")
+    fetches = []
+
+    async def read_twice():
+        for _ in range(2):
+            await group.do("a", fetches.append, "a")
+
+    asyncio.run(read_twice())
+    assert fetches == ["a", "a"]
+    assert group.stats.coalesced == 0
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    group = SingleFlight("test")
+    release = Event()
+
+    def fail():
+        release.wait(timeout=5)
+        raise LookupError("missing")
+
+    async def read_all():
+        calls = [group.do("a", fail) for _ in range(2)]
+        reads = asyncio.gather(*calls, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        release.set()
+        return await reads
+
+    errors = asyncio.run(read_all())
+    assert [type(error) for error in errors] == [LookupError, LookupError]
+    assert group.stats.executions == 1
+
+    with pytest.raises(LookupError):
+        release.set()
+        asyncio.run(group.do("a", fail))
+    assert group.stats.executions == 2
+
+
+def test_groups_are_shared_by_name():
+    assert single_flight("test-shared") is single_flight("test-shared")
+    assert single_flight("test-shared") is not single_flight("test-other")
@@ -0,0 +1,217 @@
+# tests/test_threads.py
+# tests for the Thread routes
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from src.models import Thread
+from src.services.concurrency import VersionConflict
+from src.services.repository import get_repository
+from src.services.trending import TrendingThreads
+
+
+def test_create_thread(thread, user):
+    assert thread["title"] == "How now, brown cow?"
+    assert thread["author"] == user
+    assert thread["children"] == []
+    assert thread["version"] == 0
+
+
+def test_create_thread_for_missing_user(client):
+    response = client.post(
+        "/thread/", params={"user_id": "missing"}, json={"title": "t", "body": "b"}
+    )
+    assert response.status_code == 404
+
+
+def test_duplicate_thread_title_conflicts(client, user, thread):
+    response = client.post(
+        "/thread/",
+        params={"user_id": user["uuid"]},
+        json={"title": thread["title"], "body": "again"},
+    )
+    assert response.status_code == 409
+
+
+def test_get_thread(client, thread):
+    response = client.get(f"/thread/{thread['uuid']}")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"0"'
+    assert response.json() == thread
+
+
+def test_get_missing_thread(client):
+    assert client.get("/thread/missing").status_code == 404
+
+
+def test_get_thread_fields_and_preview(client, thread):
+    response = client.get(
+        f"/thread/{thread['uuid']}", params={"fields": "uuid,body", "preview_chars": 2}
+    )
+    assert response.json() == {"uuid": thread["uuid"], "body": "Hi"}
+
+
+def test_get_thread_unknown_fields(client, thread):
+    response = client.get(f"/thread/{thread['uuid']}", params={"fields": "nope"})
+    assert response.status_code == 422
+
+
+def test_get_all_threads_pages_by_uuid(client, user, thread):
+    for n in range(3):
+        client.post(
+            "/thread/",
+            params={"user_id": user["uuid"]},
+            json={"title": f"Thread {n}", "body": "..."},
+        )
+
+    uuids = sorted((t["uuid"] for t in client.get("/thread/").json()), reverse=True)
+    assert len(uuids) == 4
+
+    first = client.get("/thread/", params={"limit": 2}).json()
+    second = client.get(
+        "/thread/", params={"limit": 2, "before": first[-1]["uuid"]}
+    ).json()
+    assert [t["uuid"] for t in first + second] == uuids
+
+
+def test_update_thread(client, thread):
+    response = client.patch(
+        f"/thread/{thread['uuid']}",
+        json={"title": "New title", "body": "New body"},
+        headers={"If-Match": '"0"'},
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"1"'
+    assert response.json()["title"] == "New title"
+
+    stale = client.patch(
+        f"/thread/{thread['uuid']}",
+        json={"title": "Newer title", "body": "Newer body"},
+        headers={"If-Match": '"0"'},
+    )
+    assert stale.status_code == 412
+    assert stale.json()["current_version"] == 1
+
+
+def test_thread_stats(client, user, thread):
+    other = client.post("/user/", json={"name": "Joanne Bloggs"}).json()
+    reply = client.post(
+        f"/thread/{thread['uuid']}/reply",
+        params={"user_id": other["uuid"]},
+        json={"body": "A reply"},
+    ).json()
+    client.post(
+        f"/thread/{thread['uuid']}/reply/{reply['uuid']}",
+        params={"user_id": user["uuid"]},
+        json={"body": "A nested reply"},
+    )
+
+    stats = client.get(f"/thread/{thread['uuid']}/stats").json()
+    assert stats["reply_count"] == 2
+    assert stats["participant_count"] == 2
+    assert stats["max_depth"] == 2
+
+    listed = client.get("/thread/", params={"include_stats": True}).json()
+    assert listed[0]["stats"] == stats
+
+
+def test_delete_thread(client, thread):
+    assert client.delete(f"/thread/{thread['uuid']}").status_code == 204
+    assert client.get(f"/thread/{thread['uuid']}").status_code == 404
+
+
+def test_trending_threads(client, user, thread):
+    quiet = client.post(
+        "/thread/",
+        params={"user_id": user["uuid"]},
+        json={"title": "Quiet thread", "body": "..."},
+    ).json()
+    client.post(f"/thread/{quiet['uuid']}/upvote", params={"user_id": user["uuid"]})
+
+    reply = client.post(
+        f"/thread/{thread['uuid']}/reply",
+        params={"user_id": user["uuid"]},
+        json={"body": "A reply"},
+    ).json()
+    client.post(
+        f"/thread/{thread['uuid']}/reply/{reply['uuid']}/upvote",
+        params={"user_id": user["uuid"]},
+    )
+
+    trending = client.get("/thread/trending").json()
+    assert trending == [
+        {"uuid": thread["uuid"], "score": 3.0},
+        {"uuid": quiet["uuid"], "score": 1.0},
+    ]
+
+    client.delete(f"/thread/{thread['uuid']}")
+    assert client.get("/thread/trending", params={"limit": 5}).json() == [
+        {"uuid": quiet["uuid"], "score": 1.0}
+    ]
+
+
+def test_create_threads_in_batch(client, user):
+    threads = [
+        {"user_id": user["uuid"], "title": f"Thread {n}", "body": "..."}
+        for n in range(3)
+    ]
+
+    uuids = client.post("/thread/batch", json={"threads": threads}).json()["uuids"]
+
+    titles = [client.get(f"/thread/{uuid}").json()["title"] for uuid in uuids]
+    assert titles == ["Thread 0", "Thread 1", "Thread 2"]
+
+    response = client.post("/thread/batch", json={"threads": threads[:1]})
+    assert response.status_code == 409
+
+
+def test_concurrent_updates_of_one_version_conflict(client, thread):
+    repository = get_repository()
+    barrier = Barrier(2)
+
+    def update(title: str) -> str:
+        barrier.wait()
+        try:
+            repository.update_item(Thread, thread["uuid"], {"title": title}, 0)
+        except VersionConflict:
+            return "conflict"
+        return "updated"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        outcomes = sorted(pool.map(update, ["First title", "Second title"]))
+
+    assert outcomes == ["conflict", "updated"]
+    assert repository.get_item(Thread, thread["uuid"], ("version",))["version"] == 1
+
+
+def test_trending_counts_only_changed_votes(client, user, thread):
+    upvote = f"/thread/{thread['uuid']}/upvote"
+    params = {"user_id": user["uuid"]}
+    for _ in range(5):
+        client.post(upvote, params=params)
+        client.post(upvote, params=params)
+        client.delete(upvote, params=params)
+
+    assert client.get("/thread/trending").json() == []
+
+    client.post(upvote, params=params)
+    assert client.get("/thread/trending").json() == [
+        {"uuid": thread["uuid"], "score": 1.0}
+    ]
+
+
+def test_trending_expires_and_bounds_threads_without_reads(monkeypatch):
+    now = 10_000.0
+    monkeypatch.setattr("src.services.trending.time", lambda: now)
+    ranking = TrendingThreads(window=60.0, buckets=6, capacity=2, tracked=10)
+
+    for i in range(25):
+        ranking.record(f"t{i}", "upvote")
+    ranking.record("t24", "reply")
+    assert len(ranking._totals) <= 10
+    assert ranking._totals["t24"] == 3.0
+
+    now += 60.0
+    ranking.record("fresh", "upvote")
+    assert dict(ranking._totals) == {"fresh": 1.0}
+    assert len(ranking._buckets) == 1
@@ -0,0 +1,32 @@
+# tests/test_users.py
+# tests for the User routes
+
+
+def test_create_and_get_user(client):
+    created = client.post("/user/", json={"name": "Joanne Bloggs"})
+    assert created.status_code == 200
+    user = created.json()
+    assert user["name"] == "Joanne Bloggs"
+
+    fetched = client.get(f"/user/{user['uuid']}")
+    assert fetched.json() == user
+
+
+def test_duplicate_user_name_conflicts(client, user):
+    response = client.post("/user/", json={"name": user["name"]})
+    assert response.status_code == 409
+
+
+def test_get_all_users(client, user):
+    client.post("/user/", json={"name": "Immanuel Kant"})
+
+    names = {user["name"] for user in client.get("/user/").json()}
+    assert names == {"John Smith", "Immanuel Kant"}
+
+
+def test_delete_user(client, user):
+    assert client.delete(f"/user/{user['uuid']}").status_code == 204
+
+    response = client.get(f"/user/{user['uuid']}")
+    assert response.status_code == 404
+    assert user["uuid"] in response.json()["message"]
@@ -0,0 +1,110 @@
+# tests/test_votes.py
+# tests for the vote routes and the tracking of write rates
+
+from src.services.votes import WriteRateTracker
+
+
+def test_upvote_and_downvote_thread(client, user, thread):
+    path = f"/thread/{thread['uuid']}"
+    params = {"user_id": user["uuid"]}
+
+    upvoted = client.post(f"{path}/upvote", params=params).json()
+    assert (upvoted["upvotes"], upvoted["downvotes"]) == (1, 0)
+
+    # votes are idempotent
+    upvoted = client.post(f"{path}/upvote", params=params).json()
+    assert upvoted["upvotes"] == 1
+
+    downvoted = client.post(f"{path}/downvote", params=params).json()
+    assert (downvoted["upvotes"], downvoted["downvotes"]) == (1, 1)
+
+    assert client.delete(f"{path}/upvote", params=params).status_code == 204
+    assert client.delete(f"{path}/downvote", params=params).status_code == 204
+
+    fetched = client.get(path).json()
+    assert (fetched["upvotes"], fetched["downvotes"]) == (0, 0)
+
+
+def test_vote_on_reply(client, user, thread):
+    reply = client.post(
+        f"/thread/{thread['uuid']}/reply",
+        params={"user_id": user["uuid"]},
+        json={"body": "A reply"},
+    ).json()
+    path = f"/thread/{thread['uuid']}/reply/{reply['uuid']}"
+
+    response = client.post(f"{path}/upvote", params={"user_id": user["uuid"]})
+    assert response.json()["upvotes"] == 1
+
+
+def test_vote_by_missing_user(client, thread):
+    response = client.post(
+        f"/thread/{thread['uuid']}/upvote", params={"user_id": "missing"}
+    )
+    assert response.status_code == 404
+
+
+def test_deleted_user_votes_are_removed(client, user, thread):
+    client.post(f"/thread/{thread['uuid']}/upvote", params={"user_id": user["uuid"]})
+    client.delete(f"/user/{user['uuid']}")
+
+    assert client.get("/thread/", params={"fields": "upvotes"}).json() == [
+        {"upvotes": 0}
+    ]
+
+
+def test_my_votes(client, user, thread):
+    path = f"/thread/{thread['uuid']}"
+    reply = client.post(
+        f"{path}/reply", params={"user_id": user["uuid"]}, json={"body": "A reply"}
+    ).json()
+    params = {"user_id": user["uuid"]}
+
+    assert client.get(path).json()["my_vote"] is None
+    assert client.get(path, params=params).json()["my_vote"] == {
+        "up": False,
+        "down": False,
+    }
+
+    client.post(f"{path}/upvote", params=params)
+    client.post(f"{path}/reply/{reply['uuid']}/downvote", params=params)
+
+    fetched = client.get(path, params=params).json()
+    assert fetched["my_vote"] == {"up": True, "down": False}
+    assert fetched["children"][0]["my_vote"] == {"up": False, "down": True}
+
+    client.delete(f"{path}/upvote", params=params)
+    listed = client.get("/thread/", params=params).json()
+    assert listed[0]["my_vote"] == {"up": False, "down": False}
+
+    fetched_reply = client.get(f"{path}/reply/{reply['uuid']}", params=params).json()
+    assert fetched_reply["my_vote"] == {"up": False, "down": True}
+
+
+def test_my_votes_of_missing_user(client, thread):
+    response = client.get(f"/thread/{thread['uuid']}", params={"user_id": "missing"})
+    assert response.status_code == 404
+
+
+def test_write_rate_tracker_slides_its_window():
+    tracker = WriteRateTracker(window=1.0)
+
+    assert tracker.record("a", now=0.0) == 1.0
+    assert tracker.record("a", now=0.5) == 2.0
+    assert tracker.record("b", now=0.5) == 1.0
+
+    # a quarter of the way into the next window, three quarters of the
+    # previous one still overlaps the sliding window
+    assert tracker.record("a", now=1.25) == 1 + 2 * 0.75
+
+    # nothing for two windows, so the count starts again
+    assert tracker.record("a", now=3.5) == 1.0
+
+
+def test_write_rate_tracker_forgets_idle_keys():
+    tracker = WriteRateTracker(window=1.0)
+    tracker.record("idle", now=0.0)
+    tracker.record("busy", now=1.5)
+
+    tracker.prune(now=2.5)
+    assert list(tracker._counts) == ["busy"]
@@ -0,0 +1,68 @@
+# tests/test_warmup.py
+# tests for warming caches with the hottest Threads
+
+from time import sleep
+
+from src.models import Thread
+from src.services import warmup
+from src.services.repository import MemoryRepository
+from src.services.warmup import AccessStats, hot_threads, warm_up
+
+
+class SlowRepository(MemoryRepository):
+    def get_item(self, *args, **kwargs) -> dict:
+        sleep(0.5)
+        return super().get_item(*args, **kwargs)
+
+
+def make_threads(repository: MemoryRepository, n: int) -> list[str]:
+    user = repository.create_user("John Smith")["uuid"]
+    threads = [
+        repository.create_thread(user, f"Thread {i}", "Hi")["uuid"] for i in range(n)
+    ]
+    repository.create_reply(user, Thread, threads[0], "A reply")
+    return threads
+
+
+def test_access_stats_persist(tmp_path):
+    stats = AccessStats()
+    stats.configure(path=str(tmp_path / "stats.json"), capacity=10)
+    for uuid in ["a", "b", "b", "c", "c", "c"]:
+        stats.record(uuid)
+    stats.forget("a")
+    assert stats.top(2) == ["c", "b"]
+    stats.save()
+
+    restarted = AccessStats()
+    restarted.configure(path=str(tmp_path / "stats.json"), capacity=10)
+    restarted.load()
+    restarted.record("b")
+    assert restarted.top(3) == ["b", "c"]  # N.B. loaded counts are halved
+
+
+def test_hot_threads():
+    repository = MemoryRepository()
+    threads = make_threads(repository, 3)
+    user = repository.create_user("Jane Doe")["uuid"]
+    repository.vote(Thread, threads[2], user, "up", True)
+
+    stats = AccessStats()
+    stats.record(threads[1])
+    assert hot_threads(repository, stats, 2) == [threads[1], threads[2]]
+
+
+def test_warm_up(monkeypatch):
+    closed = []
+    monkeypatch.setattr(warmup, "close_connections", lambda: closed.append(1))
+    repository = MemoryRepository()
+    threads = make_threads(repository, 3)
+
+    assert warm_up(repository, threads + ["deleted"], timeout=5, concurrency=2) == 4
+    assert len(closed) == 2  # N.B. each reader closes its own connection
+
+
+def test_warm_up_times_out():
+    repository = SlowRepository()
+    threads = make_threads(repository, 2)
+
+    assert warm_up(repository, threads, timeout=0.1, concurrency=1) == 0
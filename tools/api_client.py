@@ -1,82 +1,55 @@
 # tools/api_client.py
 # make it easy to send some test API requests
 
-from requests import delete, get, post
+from tools.client import ThreadsClient
 
-HOST = "http://localhost:8765"
+# N.B. one client (and so one pool of kept-alive connections) for the session
+client = ThreadsClient()
 
 
 # convenience functions
-def get_all_(path: str):
-    return get(f"{HOST}/{path}")
-
-
 def get_all_threads():
-    return get_all_("thread").json()
+    return list(client.iter_threads())
 
 
 def get_all_users():
-    return get_all_("user").json()
+    return list(client.iter_users())
 
 
 def get_thread(id: str):
-    return get(f"{HOST}/thread/{id}").json()
+    return client.get_thread(id)
 
 
 def get_reply(id: str):
-    thread_id = "dummy"
-    return get(f"{HOST}/thread/{thread_id}/reply/{id}").json()
+    return client.get_reply(id)
 
 
 def create_user(user_name: str):
-    resp = post(f"{HOST}/user", json={"name": user_name})
-    return resp.json()
+    return client.create_user(user_name)
 
 
 def create_thread(user_id: str, title: str, body: str):
-    params = {"user_id": user_id}
-    resp = post(f"{HOST}/thread", json={"title": title, "body": body}, params=params)
-    return resp.json()
+    return client.create_thread(user_id, title, body)
 
 
 def create_top_level_reply(user_id: str, thread_id: str, body: str):
-    params = {"user_id": user_id}
-    resp = post(f"{HOST}/thread/{thread_id}/reply", json={"body": body}, params=params)
-    return resp.json()
+    return client.create_reply(user_id, thread_id, body)
 
 
 def create_nested_reply(user_id: str, reply_id: str, body: str):
-    params = {"user_id": user_id}
-    thread_id = "dummy"
-    resp = post(
-        f"{HOST}/thread/{thread_id}/reply/{reply_id}",
-        json={"body": body},
-        params=params,
-    )
-    return resp.json()
+    return client.create_reply(user_id, "-", body, parent_id=reply_id)
 
 
 def upvote_a_thread(user_id: str, thread_id: str, reverse: bool = False):
-    method = delete if reverse else post
-    params = {"user_id": user_id}
-    resp = method(f"{HOST}/thread/{thread_id}/upvote", params=params)
-    return resp.json()
+    return client.vote(user_id, thread_id, cast=not reverse)
 
 
 def upvote_a_reply(user_id: str, reply_id: str, reverse: bool = False):
-    method = delete if reverse else post
-    params = {"user_id": user_id}
-    thread_id = "dummy"
-    resp = method(f"{HOST}/thread/{thread_id}/reply/{reply_id}/upvote", params=params)
-    return resp.json()
+    return client.vote(user_id, "-", reply_id, cast=not reverse)
 
 
 def downvote_a_reply(user_id: str, reply_id: str, reverse: bool = False):
-    method = delete if reverse else post
-    params = {"user_id": user_id}
-    thread_id = "dummy"
-    resp = method(f"{HOST}/thread/{thread_id}/reply/{reply_id}/downvote", params=params)
-    return resp.json()
+    return client.vote(user_id, "-", reply_id, kind="down", cast=not reverse)
 
 
 ### test runs
@@ -121,5 +94,3 @@ def test_run_4():
     print(r2)
     r3 = upvote_a_reply(users[2]["uuid"], end_of_thread)
     print(r3)
-
-
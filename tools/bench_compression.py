@@ -0,0 +1,134 @@
+# tools/bench_compression.py
+# compare the bandwidth saved by each response encoding and level with the time it costs
+#
+# usage: python -m tools.bench_compression [--threads 2000] [--mbps 1 10 100]
+
+import json
+import random
+import zlib
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+from uuid import uuid4
+
+from src.services.compression import ENCODERS
+from src.services.streaming import json_array_chunks
+
+# the levels tried for each encoding
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 9, 11), "zstd": (1, 3, 9, 19)}
+
+WORDS = (
+    "the a of to and in that is for it with as was on be by this are not or "
+    "have from but at which one all would there their what so up out if about "
+    "thread reply vote graph node query database index cache latency server "
+    "think agree point question answer idea example issue fix version release"
+).split()
+
+
+def make_payload(n_threads: int, seed: int = 0) -> list[dict]:
+    """
+    make_payload
+
+    Makes a list of Threads shaped like the response of GET /thread/, with
+    bodies of random words
+
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).isoformat()
+
+    def text(n_words: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+    return [
+        {
+            "title": text(rng.randint(4, 12)),
+            "body": text(rng.randint(20, 200)),
+            "uuid": uuid4().hex,
+            "created_at": now,
+            "updated_at": now,
+            "version": rng.randint(0, 3),
+        }
+        for _ in range(n_threads)
+    ]
+
+
+def decompressor(encoding: str):
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+    if encoding == "br":
+        import brotli
+
+        return brotli.Decompressor().process
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompressobj().decompress
+
+
+def measure(encoding: str, level: int, chunks: list[bytes], repeats: int) -> dict:
+    # N.B. compresses as the middleware does a streamed response: flushing
+    #      after every chunk
+    compress_times, decompress_times = [], []
+
+    for _ in range(repeats):
+        start = perf_counter()
+        encoder = ENCODERS[encoding](level)
+        compressed = [encoder.compress(chunk) + encoder.flush() for chunk in chunks]
+        compressed.append(encoder.finish())
+        compress_times.append(perf_counter() - start)
+
+        decompress = decompressor(encoding)
+        start = perf_counter()
+        for part in compressed:
+            decompress(part)
+        decompress_times.append(perf_counter() - start)
+
+    return {
+        "size": sum(len(part) for part in compressed),
+        "compress_s": median(compress_times),
+        "decompress_s": median(decompress_times),
+    }
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark response compression")
+    parser.add_argument("--threads", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--mbps", type=float, nargs="+", default=[1.0, 10.0, 100.0])
+    args = parser.parse_args()
+
+    chunks = list(json_array_chunks(make_payload(args.threads)))
+    raw_size = sum(len(chunk) for chunk in chunks)
+    json.loads(b"".join(chunks))  # N.B. check the payload is valid
+
+    results = [("identity", 0, {"size": raw_size, "compress_s": 0, "decompress_s": 0})]
+    for encoding in ENCODERS:
+        for level in LEVELS[encoding]:
+            results.append(
+                (encoding, level, measure(encoding, level, chunks, args.repeats))
+            )
+
+    print(f"{args.threads} Threads, {raw_size / 1024:.1f} KiB of JSON")
+    print("(total = compression + transfer + decompression, per link speed)\n")
+
+    header = f"{'encoding':<10}{'level':>6}{'KiB':>10}{'ratio':>8}{'comp ms':>10}"
+    header += f"{'dec ms':>9}"
+    header += "".join(f"{f'@{mbps:g}Mbps ms':>15}" for mbps in args.mbps)
+    print(header)
+
+    for encoding, level, result in results:
+        cpu_s = result["compress_s"] + result["decompress_s"]
+        totals = "".join(
+            f"{(cpu_s + result['size'] * 8 / (mbps * 1e6)) * 1000:>15.1f}"
+            for mbps in args.mbps
+        )
+        print(
+            f"{encoding:<10}{level or '-':>6}{result['size'] / 1024:>10.1f}"
+            f"{raw_size / result['size']:>8.2f}{result['compress_s'] * 1000:>10.2f}"
+            f"{result['decompress_s'] * 1000:>9.2f}{totals}"
+        )
+
+
+if __name__ == "__main__":
+    main()
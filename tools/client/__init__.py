@@ -0,0 +1,6 @@
+# tools/client/__init__.py
+# a pooled Python client for the API, with retries, batching and streaming
+
+from tools.client.aio import AsyncThreadsClient  # noqa: F401
+from tools.client.common import ApiError, RetryPolicy  # noqa: F401
+from tools.client.sync import ThreadsClient  # noqa: F401
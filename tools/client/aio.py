@@ -0,0 +1,332 @@
+# tools/client/aio.py
+# an asyncio client for the API, with a persistent connection pool
+
+import asyncio
+
+from collections.abc import AsyncIterator
+
+import httpx
+
+from tools.client.common import (
+    BOOKMARK_HEADER,
+    DEFAULT_BASE_URL,
+    MAX_BATCH_SIZE,
+    RETRYABLE_ERRORS,
+    UNSENT_ERRORS,
+    ApiError,
+    JsonArrayParser,
+    RetryPolicy,
+    chunks,
+    is_idempotent,
+    merge_continuation,
+    pending_continuations,
+    pool_limits,
+    resolve_parents,
+)
+
+
+class AsyncThreadsClient:
+    """
+    AsyncThreadsClient
+
+    An asyncio client for the API that keeps its connections alive between
+    calls (so should be reused, and closed when done, e.g. with an
+    `async with` block). Failed requests are retried according to its
+    RetryPolicy.
+
+    At most `max_concurrency` requests are in flight at a time, however many
+    coroutines use the client, so callers can simply gather many calls.
+
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+        retry: RetryPolicy | None = None,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.bookmark: str | None = None  # of the last write made
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._http = http_client or httpx.AsyncClient(
+            base_url=base_url,
+            limits=pool_limits(max_concurrency),
+            timeout=timeout,
+        )
+
+    async def __aenter__(self) -> "AsyncThreadsClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._http.aclose()
+
+    ### transport
+
+    def _headers(self, headers: dict | None = None) -> dict:
+        headers = dict(headers or {})
+        if self.bookmark is not None:
+            headers[BOOKMARK_HEADER] = self.bookmark
+        return headers
+
+    def _remember_bookmark(self, response: httpx.Response):
+        if BOOKMARK_HEADER in response.headers:
+            self.bookmark = response.headers[BOOKMARK_HEADER]
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        headers: dict | None = None,
+        idempotent: bool | None = None,
+        **kwargs,
+    ) -> httpx.Response:
+        if idempotent is None:
+            idempotent = is_idempotent(method, headers)
+        attempt = 0
+
+        while True:
+            try:
+                async with self._limit:
+                    response = await self._http.request(
+                        method, path, headers=self._headers(headers), **kwargs
+                    )
+            except RETRYABLE_ERRORS as exc:
+                unsent = isinstance(exc, UNSENT_ERRORS)
+                if not self.retry.should_retry(attempt, None, idempotent or unsent):
+                    raise
+                response = None
+            else:
+                if response.status_code < 400:
+                    self._remember_bookmark(response)
+                    return response
+                if not self.retry.should_retry(attempt, response, idempotent):
+                    raise ApiError(response)
+
+            # N.B. the concurrency slot is released while waiting
+            await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    async def _json(self, method: str, path: str, **kwargs):
+        response = await self._request(method, path, **kwargs)
+        return response.json() if response.status_code != 204 else None
+
+    async def _stream(self, path: str, params: dict | None = None) -> AsyncIterator:
+        # N.B. only retried until the response starts arriving
+        attempt = 0
+
+        while True:
+            async with self._limit:
+                async with self._http.stream(
+                    "GET", path, params=params, headers=self._headers()
+                ) as response:
+                    if response.status_code < 400:
+                        parser = JsonArrayParser()
+                        async for chunk in response.aiter_bytes():
+                            for item in parser.feed(chunk):
+                                yield item
+                        return
+
+                    await response.aread()
+                    if not self.retry.should_retry(attempt, response):
+                        raise ApiError(response)
+
+            await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    ### users
+
+    async def create_user(self, name: str) -> dict:
+        return await self._json("POST", "/user/", json={"name": name})
+
+    async def get_user(self, uuid: str) -> dict:
+        return await self._json("GET", f"/user/{uuid}")
+
+    def iter_users(self) -> AsyncIterator[dict]:
+        return self._stream("/user/")
+
+    async def delete_user(self, uuid: str):
+        await self._request("DELETE", f"/user/{uuid}")
+
+    ### threads
+
+    async def create_thread(self, user_id: str, title: str, body: str) -> dict:
+        return await self._json(
+            "POST",
+            "/thread/",
+            params={"user_id": user_id},
+            json={"title": title, "body": body},
+        )
+
+    async def create_threads(self, threads: list[dict]) -> list[str]:
+        """
+        create_threads
+
+        Creates Threads (dicts with user_id, title and body) through the batch
+        route, sending batches of MAX_BATCH_SIZE concurrently
+
+        Output:
+            uuids - of the new Threads, in order
+
+        """
+        created = await asyncio.gather(
+            *(
+                self._json("POST", "/thread/batch", json={"threads": batch})
+                for batch in chunks(threads, MAX_BATCH_SIZE)
+            )
+        )
+        return [uuid for batch in created for uuid in batch["uuids"]]
+
+    async def get_thread(self, uuid: str, **params) -> dict:
+        return await self._json("GET", f"/thread/{uuid}", params=params)
+
+    def iter_threads(self, **params) -> AsyncIterator[dict]:
+        """
+        iter_threads
+
+        Yields Threads as the list of them is received (accepts the query
+        parameters of GET /thread/, e.g. fields or include_stats)
+
+        """
+        return self._stream("/thread/", params=params)
+
+    async def trending_threads(self, limit: int = 10) -> list[dict]:
+        return await self._json("GET", "/thread/trending", params={"limit": limit})
+
+    async def update_thread(
+        self, uuid: str, title: str, body: str, version: int | None = None
+    ) -> dict:
+        headers = {"If-Match": f'"{version}"'} if version is not None else {}
+        return await self._json(
+            "PATCH",
+            f"/thread/{uuid}",
+            json={"title": title, "body": body},
+            headers=headers,
+        )
+
+    async def delete_thread(self, uuid: str):
+        await self._request("DELETE", f"/thread/{uuid}")
+
+    ### replies
+
+    async def create_reply(
+        self, user_id: str, thread_id: str, body: str, parent_id: str | None = None
+    ) -> dict:
+        path = f"/thread/{thread_id}/reply"
+        if parent_id is not None:
+            path += f"/{parent_id}"
+        return await self._json(
+            "POST", path, params={"user_id": user_id}, json={"body": body}
+        )
+
+    async def create_replies(self, thread_id: str, replies: list[dict]) -> list[str]:
+        """
+        create_replies
+
+        Creates Replies in a Thread through the batch route, MAX_BATCH_SIZE at
+        a time; a Reply may name an earlier Reply's temp_id as its parent,
+        even when they end up in different requests
+
+        N.B. batches are sent one after another, since later ones may refer
+             to Replies created by earlier ones
+
+        Output:
+            uuids - of the new Replies, in order
+
+        """
+        uuids: list[str] = []
+        temp_ids: dict[str, str] = {}
+
+        for batch in chunks(replies, MAX_BATCH_SIZE):
+            created = (
+                await self._json(
+                    "POST",
+                    f"/thread/{thread_id}/replies/batch",
+                    json={"replies": resolve_parents(batch, temp_ids)},
+                )
+            )["uuids"]
+            for reply, uuid in zip(batch, created):
+                if reply.get("temp_id") is not None:
+                    temp_ids[reply["temp_id"]] = uuid
+            uuids += created
+
+        return uuids
+
+    async def get_reply(self, uuid: str, thread_id: str = "-", **params) -> dict:
+        return await self._json(
+            "GET", f"/thread/{thread_id}/reply/{uuid}", params=params
+        )
+
+    async def get_tree(self, uuid: str, thread_id: str = "-", **params) -> dict:
+        """
+        get_tree
+
+        Loads every Reply below a Reply, following the continuation cursors
+        of the branch route (concurrently, level by level) until nothing is
+        left to load
+
+        """
+        path = f"/thread/{thread_id}/reply/{{}}/branch"
+        tree = await self._json("GET", path.format(uuid), params=params)
+
+        while pending := list(pending_continuations(tree)):
+            continued = await asyncio.gather(
+                *(
+                    self._json(
+                        "GET",
+                        path.format(node["uuid"]),
+                        params={**params, "cursor": node["continuation"]},
+                    )
+                    for node in pending
+                )
+            )
+            for node, more in zip(pending, continued):
+                merge_continuation(node, more)
+
+        return tree
+
+    async def update_reply(
+        self, uuid: str, body: str, version: int | None = None, thread_id: str = "-"
+    ) -> dict:
+        headers = {"If-Match": f'"{version}"'} if version is not None else {}
+        return await self._json(
+            "PATCH",
+            f"/thread/{thread_id}/reply/{uuid}",
+            json={"body": body},
+            headers=headers,
+        )
+
+    async def delete_reply(self, uuid: str, thread_id: str = "-"):
+        await self._request("DELETE", f"/thread/{thread_id}/reply/{uuid}")
+
+    ### votes
+
+    async def vote(
+        self,
+        user_id: str,
+        thread_id: str,
+        reply_id: str | None = None,
+        kind: str = "up",
+        cast: bool = True,
+    ) -> dict | None:
+        """
+        vote
+
+        Casts (or, if cast is False, withdraws) an upvote or downvote on a
+        Thread or, if reply_id is set, a Reply
+
+        """
+        path = f"/thread/{thread_id}"
+        if reply_id is not None:
+            path += f"/reply/{reply_id}"
+        # N.B. casting a vote twice is the same as casting it once
+        return await self._json(
+            "POST" if cast else "DELETE",
+            f"{path}/{kind}vote",
+            params={"user_id": user_id},
+            idempotent=True,
+        )
@@ -0,0 +1,247 @@
+# tools/client/common.py
+# the parts of the API client shared by its sync and asyncio variants
+
+import codecs
+import json
+import os
+import random
+
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+import httpx
+
+DEFAULT_BASE_URL = os.environ.get("THREADS_API_URL", "http://localhost:8765")
+
+# the most items the batch routes accept per request
+MAX_BATCH_SIZE = 1000
+
+# the header carrying the bookmark of the client's last write (so that its
+# reads, wherever they are routed, see its own writes)
+BOOKMARK_HEADER = "X-Bookmark"
+
+# the methods whose requests have the same effect however often they are made
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# the header by which a request is marked as safe to repeat (e.g. as the
+# server recognises repeats of it), whatever its method
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+
+class ApiError(Exception):
+    """
+    ApiError
+
+    Raised when the API answers with an error status (after any retries)
+
+    """
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        self.status_code = response.status_code
+        try:
+            self.detail = response.json()
+        except ValueError:
+            self.detail = response.text
+        super().__init__(f"{response.request.method} {response.url}: {self.detail}")
+
+
+@dataclass
+class RetryPolicy:
+    """
+    RetryPolicy
+
+    Which failed requests are retried, how often and after how long: delays
+    grow exponentially from `base_delay` up to `max_delay` and are drawn at
+    random below that ("full jitter"), so that clients failing together do
+    not retry together. A Retry-After header, if sent, takes precedence.
+
+    Requests that are not idempotent (e.g. creates) may have been processed
+    when they fail with a server error or without a response, so they are
+    only retried on the statuses meaning they were not processed.
+
+    """
+
+    attempts: int = 4  # in total, including the first
+    base_delay: float = 0.1  # seconds
+    max_delay: float = 5.0  # seconds
+    statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+    unprocessed_statuses: frozenset[int] = frozenset({429, 503})
+
+    def should_retry(
+        self, attempt: int, response: httpx.Response | None, idempotent: bool = True
+    ) -> bool:
+        if attempt + 1 >= self.attempts:
+            return False
+        if response is None:
+            return idempotent
+        statuses = self.statuses if idempotent else self.unprocessed_statuses
+        return response.status_code in statuses
+
+    def delay(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return min(float(response.headers["Retry-After"]), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+# failures worth retrying that leave no response (N.B. the request may have
+# been processed, so only idempotent requests are retried after them)
+RETRYABLE_ERRORS = (httpx.TransportError,)
+
+# of those, the failures before the request was sent, after which any request
+# may be retried
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def is_idempotent(method: str, headers: dict | None = None) -> bool:
+    """
+    is_idempotent
+
+    Returns whether a request may be repeated without changing its effect:
+    if its method is idempotent, or it carries an idempotency key
+
+    """
+    return method in IDEMPOTENT_METHODS or IDEMPOTENCY_KEY_HEADER in (headers or {})
+
+
+def pool_limits(max_connections: int) -> httpx.Limits:
+    """
+    pool_limits
+
+    Returns connection pool limits that keep every connection alive
+
+    """
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+
+
+class JsonArrayParser:
+    """
+    JsonArrayParser
+
+    Parses a JSON array incrementally, as its bytes arrive, returning each
+    element as soon as it is complete; memory use is bounded by the largest
+    element rather than the whole array
+
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self.finished = False
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        feed
+
+        Adds the next chunk of the response body
+
+        Output:
+            items - the elements completed by this chunk
+
+        """
+        self._buffer += self._text.decode(chunk)
+        items = []
+        position = 0
+
+        while not self.finished:
+            position = _skip_whitespace(self._buffer, position)
+            if position == len(self._buffer):
+                break
+
+            if not self._started:
+                if self._buffer[position] != "[":
+                    raise ValueError("Expected a JSON array")
+                self._started = True
+                position += 1
+                continue
+
+            if self._buffer[position] == "]":
+                self.finished = True
+                position += 1
+                break
+
+            if self._buffer[position] == ",":
+                position += 1
+                continue
+
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, position)
+            except json.JSONDecodeError:
+                break  # incomplete: wait for more data
+
+            # a number at the end of the buffer may have more digits to come
+            if end == len(self._buffer) and isinstance(item, (int, float)):
+                break
+
+            items.append(item)
+            position = end
+
+        self._buffer = self._buffer[position:]
+
+        return items
+
+
+def _skip_whitespace(text: str, position: int) -> int:
+    while position < len(text) and text[position] in " \t\n\r":
+        position += 1
+    return position
+
+
+def chunks(items: list, size: int = MAX_BATCH_SIZE) -> Iterator[list]:
+    """
+    chunks
+
+    Splits a list into consecutive lists of at most `size` items
+
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def resolve_parents(replies: list[dict], uuids: dict[str, str]) -> list[dict]:
+    """
+    resolve_parents
+
+    Replaces parent references to temporary ids created in earlier batches
+    with the uuids they were given, so that a long list of Replies can be
+    split across several batch requests
+
+    """
+    return [
+        {**reply, "parent": uuids.get(reply.get("parent"), reply.get("parent"))}
+        for reply in replies
+    ]
+
+
+def merge_continuation(node: dict, continued: dict):
+    """
+    merge_continuation
+
+    Adds the children loaded by following a node's continuation cursor to
+    the node, in place
+
+    """
+    node["children"].extend(continued["children"])
+    node["has_more_children"] = continued["has_more_children"]
+    node["continuation"] = continued["continuation"]
+
+
+def pending_continuations(node: dict) -> Iterator[dict]:
+    """
+    pending_continuations
+
+    Yields every node in a (nested) branch that has children left to load
+
+    """
+    if node.get("continuation"):
+        yield node
+    for child in node["children"]:
+        yield from pending_continuations(child)
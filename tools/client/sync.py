@@ -0,0 +1,312 @@
+# tools/client/sync.py
+# a blocking client for the API, with a persistent connection pool
+
+import time
+
+from collections.abc import Iterator
+
+import httpx
+
+from tools.client.common import (
+    BOOKMARK_HEADER,
+    DEFAULT_BASE_URL,
+    MAX_BATCH_SIZE,
+    RETRYABLE_ERRORS,
+    UNSENT_ERRORS,
+    ApiError,
+    JsonArrayParser,
+    RetryPolicy,
+    chunks,
+    is_idempotent,
+    merge_continuation,
+    pending_continuations,
+    pool_limits,
+    resolve_parents,
+)
+
+
+class ThreadsClient:
+    """
+    ThreadsClient
+
+    A client for the API that keeps its connections alive between calls
+    (so should be reused, and closed when done, e.g. with a `with` block).
+    Failed requests are retried according to its RetryPolicy.
+
+    N.B. safe to share between threads; at most `max_connections` requests
+         are in flight at a time
+
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        max_connections: int = 10,
+        timeout: float = 10.0,
+        retry: RetryPolicy | None = None,
+        http_client: httpx.Client | None = None,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.bookmark: str | None = None  # of the last write made
+        self._http = http_client or httpx.Client(
+            base_url=base_url,
+            limits=pool_limits(max_connections),
+            timeout=timeout,
+        )
+
+    def __enter__(self) -> "ThreadsClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    ### transport
+
+    def _headers(self, headers: dict | None = None) -> dict:
+        headers = dict(headers or {})
+        if self.bookmark is not None:
+            headers[BOOKMARK_HEADER] = self.bookmark
+        return headers
+
+    def _remember_bookmark(self, response: httpx.Response):
+        if BOOKMARK_HEADER in response.headers:
+            self.bookmark = response.headers[BOOKMARK_HEADER]
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        headers: dict | None = None,
+        idempotent: bool | None = None,
+        **kwargs,
+    ) -> httpx.Response:
+        if idempotent is None:
+            idempotent = is_idempotent(method, headers)
+        attempt = 0
+
+        while True:
+            try:
+                response = self._http.request(
+                    method, path, headers=self._headers(headers), **kwargs
+                )
+            except RETRYABLE_ERRORS as exc:
+                unsent = isinstance(exc, UNSENT_ERRORS)
+                if not self.retry.should_retry(attempt, None, idempotent or unsent):
+                    raise
+                response = None
+            else:
+                if response.status_code < 400:
+                    self._remember_bookmark(response)
+                    return response
+                if not self.retry.should_retry(attempt, response, idempotent):
+                    raise ApiError(response)
+
+            time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    def _json(self, method: str, path: str, **kwargs):
+        response = self._request(method, path, **kwargs)
+        return response.json() if response.status_code != 204 else None
+
+    def _stream(self, path: str, params: dict | None = None) -> Iterator[dict]:
+        # N.B. only retried until the response starts arriving
+        attempt = 0
+
+        while True:
+            with self._http.stream(
+                "GET", path, params=params, headers=self._headers()
+            ) as response:
+                if response.status_code < 400:
+                    parser = JsonArrayParser()
+                    for chunk in response.iter_bytes():
+                        yield from parser.feed(chunk)
+                    return
+
+                response.read()
+                if not self.retry.should_retry(attempt, response):
+                    raise ApiError(response)
+
+            time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    ### users
+
+    def create_user(self, name: str) -> dict:
+        return self._json("POST", "/user/", json={"name": name})
+
+    def get_user(self, uuid: str) -> dict:
+        return self._json("GET", f"/user/{uuid}")
+
+    def iter_users(self) -> Iterator[dict]:
+        return self._stream("/user/")
+
+    def delete_user(self, uuid: str):
+        self._request("DELETE", f"/user/{uuid}")
+
+    ### threads
+
+    def create_thread(self, user_id: str, title: str, body: str) -> dict:
+        return self._json(
+            "POST",
+            "/thread/",
+            params={"user_id": user_id},
+            json={"title": title, "body": body},
+        )
+
+    def create_threads(self, threads: list[dict]) -> list[str]:
+        """
+        create_threads
+
+        Creates Threads (dicts with user_id, title and body) through the batch
+        route, MAX_BATCH_SIZE at a time
+
+        Output:
+            uuids - of the new Threads, in order
+
+        """
+        uuids = []
+        for batch in chunks(threads, MAX_BATCH_SIZE):
+            uuids += self._json("POST", "/thread/batch", json={"threads": batch})[
+                "uuids"
+            ]
+        return uuids
+
+    def get_thread(self, uuid: str, **params) -> dict:
+        return self._json("GET", f"/thread/{uuid}", params=params)
+
+    def iter_threads(self, **params) -> Iterator[dict]:
+        """
+        iter_threads
+
+        Yields Threads as the list of them is received (accepts the query
+        parameters of GET /thread/, e.g. fields or include_stats)
+
+        """
+        return self._stream("/thread/", params=params)
+
+    def trending_threads(self, limit: int = 10) -> list[dict]:
+        return self._json("GET", "/thread/trending", params={"limit": limit})
+
+    def update_thread(
+        self, uuid: str, title: str, body: str, version: int | None = None
+    ) -> dict:
+        headers = {"If-Match": f'"{version}"'} if version is not None else {}
+        return self._json(
+            "PATCH",
+            f"/thread/{uuid}",
+            json={"title": title, "body": body},
+            headers=headers,
+        )
+
+    def delete_thread(self, uuid: str):
+        self._request("DELETE", f"/thread/{uuid}")
+
+    ### replies
+
+    def create_reply(
+        self, user_id: str, thread_id: str, body: str, parent_id: str | None = None
+    ) -> dict:
+        path = f"/thread/{thread_id}/reply"
+        if parent_id is not None:
+            path += f"/{parent_id}"
+        return self._json(
+            "POST", path, params={"user_id": user_id}, json={"body": body}
+        )
+
+    def create_replies(self, thread_id: str, replies: list[dict]) -> list[str]:
+        """
+        create_replies
+
+        Creates Replies in a Thread through the batch route, MAX_BATCH_SIZE at
+        a time; a Reply may name an earlier Reply's temp_id as its parent,
+        even when they end up in different requests
+
+        Output:
+            uuids - of the new Replies, in order
+
+        """
+        uuids: list[str] = []
+        temp_ids: dict[str, str] = {}
+
+        for batch in chunks(replies, MAX_BATCH_SIZE):
+            created = self._json(
+                "POST",
+                f"/thread/{thread_id}/replies/batch",
+                json={"replies": resolve_parents(batch, temp_ids)},
+            )["uuids"]
+            for reply, uuid in zip(batch, created):
+                if reply.get("temp_id") is not None:
+                    temp_ids[reply["temp_id"]] = uuid
+            uuids += created
+
+        return uuids
+
+    def get_reply(self, uuid: str, thread_id: str = "-", **params) -> dict:
+        return self._json("GET", f"/thread/{thread_id}/reply/{uuid}", params=params)
+
+    def get_tree(self, uuid: str, thread_id: str = "-", **params) -> dict:
+        """
+        get_tree
+
+        Loads every Reply below a Reply, following the continuation cursors
+        of the branch route until nothing is left to load
+
+        """
+        path = f"/thread/{thread_id}/reply/{{}}/branch"
+        tree = self._json("GET", path.format(uuid), params=params)
+
+        while pending := list(pending_continuations(tree)):
+            for node in pending:
+                continued = self._json(
+                    "GET",
+                    path.format(node["uuid"]),
+                    params={**params, "cursor": node["continuation"]},
+                )
+                merge_continuation(node, continued)
+
+        return tree
+
+    def update_reply(
+        self, uuid: str, body: str, version: int | None = None, thread_id: str = "-"
+    ) -> dict:
+        headers = {"If-Match": f'"{version}"'} if version is not None else {}
+        return self._json(
+            "PATCH",
+            f"/thread/{thread_id}/reply/{uuid}",
+            json={"body": body},
+            headers=headers,
+        )
+
+    def delete_reply(self, uuid: str, thread_id: str = "-"):
+        self._request("DELETE", f"/thread/{thread_id}/reply/{uuid}")
+
+    ### votes
+
+    def vote(
+        self,
+        user_id: str,
+        thread_id: str,
+        reply_id: str | None = None,
+        kind: str = "up",
+        cast: bool = True,
+    ) -> dict | None:
+        """
+        vote
+
+        Casts (or, if cast is False, withdraws) an upvote or downvote on a
+        Thread or, if reply_id is set, a Reply
+
+        """
+        path = f"/thread/{thread_id}"
+        if reply_id is not None:
+            path += f"/reply/{reply_id}"
+        # N.B. casting a vote twice is the same as casting it once
+        return self._json(
+            "POST" if cast else "DELETE",
+            f"{path}/{kind}vote",
+            params={"user_id": user_id},
+            idempotent=True,
+        )